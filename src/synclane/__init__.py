@@ -6,8 +6,24 @@ from ._base import (
     AbstractProcedure,
     AbstractRpc,
     ProcedureNotFound,
+    RootModelStats,
+    root_model_stats,
+)
+from ._cache import IdempotencyStore, SharedResultCache
+from ._client import (
+    AsyncHttpTransport,
+    AsyncRpcClient,
+    ClientProcedure,
+    HttpTransport,
+    RpcClient,
+    RpcError,
 )
 from ._export import TsExporter
+from ._frames import AsyncFrameTransport, FrameServer, FrameServerMetrics
+from ._http import HttpResponse, ResponseCompressor, ServerTiming
+from ._loader import BatchLoader
+from ._py_export import PyExporter
+from ._types import DayNumberDate, EpochDatetime
 
 
 __all__ = [
@@ -15,7 +31,27 @@ __all__ = [
     "AbstractAsyncRpc",
     "AbstractProcedure",
     "AbstractRpc",
+    "AsyncFrameTransport",
+    "AsyncHttpTransport",
+    "AsyncRpcClient",
+    "BatchLoader",
+    "ClientProcedure",
+    "DayNumberDate",
+    "EpochDatetime",
+    "FrameServer",
+    "FrameServerMetrics",
+    "HttpResponse",
+    "HttpTransport",
+    "IdempotencyStore",
     "ProcedureNotFound",
+    "PyExporter",
+    "ResponseCompressor",
+    "RootModelStats",
+    "RpcClient",
+    "RpcError",
+    "ServerTiming",
+    "SharedResultCache",
     "TsExporter",
+    "root_model_stats",
 ]
 __version__ = "0.6.1"
@@ -0,0 +1,269 @@
+"""Command line interface: exports typescript client of an rpc.
+
+Usage: python -m synclane export module:rpc path [--watch]
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+import traceback
+from enum import Enum
+from inspect import isclass
+from types import ModuleType
+from typing import Iterator, MutableMapping, Optional, Set
+
+from pydantic import BaseModel
+
+from ._export import TsExporter
+from ._py_export import PyExporter
+
+
+# their modules are not watched
+LIBRARY_PACKAGES = {"builtins", "pydantic", "synclane", "typing"}
+
+
+def load_rpc(spec):
+    """Imports "module:attribute" and returns its module and rpc."""
+    module_name, _, attr_name = spec.partition(":")
+    if not module_name or not attr_name:
+        raise ValueError("expected module:attribute", spec)
+    module = importlib.import_module(module_name)
+    return module, getattr(module, attr_name)
+
+
+def export(rpc, path, validate_params=False):
+    """Exports to a file if path ends with .ts, otherwise to a directory.
+
+    Paths ending with .py get a typed python client.
+
+    Returns names of changed files.
+    """
+    if path.endswith(".py"):
+        py_exporter = PyExporter(rpc)
+        py_exporter.write(path)
+        return py_exporter.changed_filenames
+
+    exporter = TsExporter(rpc, validate_params=validate_params)
+    if path.endswith(".ts"):
+        exporter.write(path)
+    else:
+        exporter.write_dir(path)
+    return exporter.changed_filenames
+
+
+def iter_type_classes(type_, seen) -> Iterator[type]:
+    """Yields models and enums, which a type references."""
+    if isinstance(type_, (list, tuple)):
+        for item in type_:
+            yield from iter_type_classes(item, seen)
+        return
+    try:
+        if type_ in seen:
+            return
+        seen.add(type_)
+    except TypeError:
+        return
+
+    yield from iter_type_classes(getattr(type_, "__args__", ()), seen)
+    if not isclass(type_):
+        return
+    if issubclass(type_, Enum):
+        yield type_
+    elif issubclass(type_, BaseModel):
+        yield type_
+        metadata = type_.__pydantic_generic_metadata__
+        yield from iter_type_classes(metadata["origin"], seen)
+        yield from iter_type_classes(metadata["args"], seen)
+        for field_info in type_.model_fields.values():
+            yield from iter_type_classes(field_info.annotation, seen)
+
+
+def get_source_modules(rpc) -> Set[str]:
+    """Returns names of modules, which define procedures and their types."""
+    seen: Set[type] = set()
+    module_names = set()
+    for procedure in rpc.procedures.values():
+        module_names.add(type(procedure).__module__)
+        for cls in iter_type_classes(
+            [procedure.in_type, procedure.out_type], seen
+        ):
+            module_names.add(cls.__module__)
+    return module_names
+
+
+def get_mtime(module_name) -> Optional[int]:
+    """Returns mtime of the source of a loaded module (None if unknown)."""
+    module = sys.modules.get(module_name)
+    filename = getattr(module, "__file__", None)
+    if filename is None:
+        return None
+    try:
+        return os.stat(filename).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_dependencies(module_name, module_names) -> Set[str]:
+    """Returns which of module_names the module imports from."""
+    module = sys.modules.get(module_name)
+    deps = set()
+    for value in vars(module).values() if module is not None else ():
+        dep = (
+            value.__name__
+            if isinstance(value, ModuleType)
+            else getattr(value, "__module__", None)
+        )
+        if isinstance(dep, str) and dep != module_name and dep in module_names:
+            deps.add(dep)
+    return deps
+
+
+class Watcher:
+    """Polls source files of an rpc and re-exports it on changes.
+
+    Changed modules are reloaded within the process, followed by the module
+    of the rpc, so the rest of imports stay warm.
+    """
+
+    def __init__(self, spec, path, validate_params=False):
+        """Loads the rpc by "module:attribute" spec."""
+        self.spec = spec
+        self.path = path
+        self.validate_params = validate_params
+        self.module, self.rpc = load_rpc(spec)
+        self.mtimes: MutableMapping[str, Optional[int]] = {}
+        self.update_mtimes()
+
+    def update_mtimes(self):
+        """Remembers mtimes of modules defining procedures and models."""
+        module_names = get_source_modules(self.rpc)
+        module_names.add(self.module.__name__)
+        self.mtimes = {
+            module_name: get_mtime(module_name)
+            for module_name in module_names
+            if module_name.partition(".")[0] not in LIBRARY_PACKAGES
+        }
+
+    def get_changed_modules(self):
+        """Returns watched modules, whose sources changed."""
+        return [
+            module_name
+            for module_name, mtime in self.mtimes.items()
+            if get_mtime(module_name) != mtime
+        ]
+
+    def get_modules_to_reload(self, changed_modules):
+        """Returns changed modules and watched ones importing from them.
+
+        Dependencies go first.
+        """
+        module_to_deps = {
+            module_name: get_dependencies(module_name, self.mtimes)
+            for module_name in self.mtimes
+        }
+        to_reload = set(changed_modules)
+        to_reload.add(self.module.__name__)
+        while True:
+            dependents = {
+                module_name
+                for module_name, deps in module_to_deps.items()
+                if deps & to_reload
+            }
+            if dependents <= to_reload:
+                break
+            to_reload |= dependents
+
+        ordered: "list[str]" = []
+
+        def visit(module_name, path=()):
+            if module_name in ordered or module_name in path:
+                return
+            for dep in sorted(module_to_deps.get(module_name, ())):
+                if dep in to_reload:
+                    visit(dep, path + (module_name,))
+            ordered.append(module_name)
+
+        for module_name in sorted(to_reload):
+            visit(module_name)
+        return ordered
+
+    def check(self):
+        """Re-exports if any source changed; returns changed files."""
+        changed_modules = self.get_changed_modules()
+        if not changed_modules:
+            return []
+
+        for module_name in self.get_modules_to_reload(changed_modules):
+            module = importlib.reload(sys.modules[module_name])
+            if module_name == self.module.__name__:
+                self.module = module
+        self.rpc = getattr(self.module, self.spec.partition(":")[2])
+        self.update_mtimes()
+        return export(self.rpc, self.path, self.validate_params)
+
+    def run(self, interval):
+        """Checks sources every interval seconds, re-exporting on changes."""
+        while True:
+            time.sleep(interval)
+            try:
+                changed_files = self.check()
+            except Exception:
+                traceback.print_exc()
+                # retry once sources change again
+                self.mtimes = {
+                    module_name: get_mtime(module_name)
+                    for module_name in self.mtimes
+                }
+                continue
+            for filename in changed_files:
+                print(f"updated {filename}", file=sys.stderr)
+
+
+def main(argv=None):
+    """Runs the command line interface."""
+    parser = argparse.ArgumentParser(prog="python -m synclane")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser(
+        "export", help="export typescript client"
+    )
+    export_parser.add_argument("rpc", help="module:attribute of an rpc")
+    export_parser.add_argument(
+        "path",
+        help="file (*.ts), directory (a module per namespace) or python "
+        "client (*.py)",
+    )
+    export_parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="re-export on changes of procedure & model sources",
+    )
+    export_parser.add_argument(
+        "--validate-params",
+        action="store_true",
+        help="check params against model constraints before sending them",
+    )
+    export_parser.add_argument(
+        "--interval", type=float, default=1.0, help="polling interval, s"
+    )
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.getcwd())
+    if args.watch:
+        watcher = Watcher(args.rpc, args.path, args.validate_params)
+        export(watcher.rpc, args.path, args.validate_params)
+        try:
+            watcher.run(args.interval)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    _, rpc = load_rpc(args.rpc)
+    for filename in export(rpc, args.path, args.validate_params):
+        print(f"updated {filename}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
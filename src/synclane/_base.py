@@ -2,12 +2,48 @@
 
 import abc
 import asyncio
+import hashlib
 import inspect
-from io import BytesIO
-from typing import Any, Awaitable, Callable, Optional, Sequence, Type
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from itertools import chain
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Type,
+    Union,
+)
 
-from pydantic import BaseModel, RootModel
+from pydantic import BaseModel, Json, RootModel
 from pydantic_core import to_json
+from typing_extensions import Annotated, Literal, get_args, get_origin
+
+from ._cache import IdempotencyStore, SharedResultCache
+from ._http import (
+    HttpResponse,
+    ResponseCompressor,
+    ServerTiming,
+    make_http_response,
+    make_query_http_response,
+)
+from ._loader import REQUEST_CACHES
+
+
+if sys.version_info[0:2] > (3, 9):
+    from types import UnionType
+else:  # pragma: no cover
+    UnionType = None
+
+NoneType = type(None)
 
 
 class BaseRpcException(Exception):
@@ -18,12 +54,140 @@ class ProcedureNotFound(BaseRpcException):
     pass
 
 
+class RootModelStats:
+    """Build stats of a root model wrapper, shared by equal types.
+
+    memory is None unless tracemalloc is tracing (e.g. PYTHONTRACEMALLOC=1).
+    """
+
+    __slots__ = ["type", "model", "build_time", "memory", "uses"]
+
+    def __init__(self, type_, model, build_time, memory):
+        self.type = type_
+        self.model: Type[BaseModel] = model
+        self.build_time: float = build_time
+        self.memory: Optional[int] = memory
+        self.uses = 1
+
+    def __repr__(self):
+        return (
+            "RootModelStats({!r}, build_time={:.6f}, memory={}, uses={})"
+        ).format(self.type, self.build_time, self.memory, self.uses)
+
+
+# normalized type -> stats of its root model wrapper
+ROOT_MODELS: MutableMapping[Any, RootModelStats] = {}
+ROOT_MODELS_LOCK = threading.Lock()
+
+
+def normalize_type(some_type: Any) -> Any:
+    """Returns a hashable key, equal for equal types spelled differently.
+
+    e.g. typing.List[int] and list[int], Optional[int] and int | None.
+    """
+    origin = get_origin(some_type)
+    if origin is None:
+        return some_type
+    args = get_args(some_type)
+    if origin is Annotated:
+        return (Annotated, normalize_type(args[0]), args[1:])
+    if origin is Literal:
+        # 1 == True, so values are told apart by their types
+        return (Literal, tuple((type(arg), arg) for arg in args))
+    if origin is Union or (UnionType is not None and origin is UnionType):
+        return (
+            Union,
+            tuple(normalize_type(arg) for arg in args if arg is not NoneType),
+            NoneType in args,
+        )
+    return (origin, tuple(normalize_type(arg) for arg in args))
+
+
+def intern_root_model(some_type: Any) -> Type[BaseModel]:
+    """Returns RootModel[some_type], built once per normalized type."""
+    try:
+        key = normalize_type(some_type)
+        hash(key)
+    except TypeError:
+        return RootModel[some_type]  # type: ignore
+
+    stats = ROOT_MODELS.get(key)
+    if stats is not None:
+        stats.uses += 1
+        return stats.model
+
+    with ROOT_MODELS_LOCK:
+        stats = ROOT_MODELS.get(key)
+        if stats is not None:
+            stats.uses += 1
+            return stats.model
+
+        memory_before = (
+            tracemalloc.get_traced_memory()[0]
+            if tracemalloc.is_tracing()
+            else None
+        )
+        started_at = time.perf_counter()
+        model = RootModel[some_type]  # type: ignore
+        build_time = time.perf_counter() - started_at
+        memory = (
+            tracemalloc.get_traced_memory()[0] - memory_before
+            if memory_before is not None
+            else None
+        )
+        ROOT_MODELS[key] = RootModelStats(some_type, model, build_time, memory)
+        return model
+
+
+def root_model_stats() -> Sequence[RootModelStats]:
+    """Returns stats of root model wrappers, the slowest to build first."""
+    return sorted(
+        ROOT_MODELS.values(), key=lambda stats: stats.build_time, reverse=True
+    )
+
+
 def ensure_pydantic_model(some_type: Type[Any]):
-    return (
-        some_type if isinstance(some_type, type) and issubclass(some_type, BaseModel) else RootModel[some_type]  # type: ignore
+    if isinstance(some_type, type) and issubclass(some_type, BaseModel):
+        return some_type
+    return intern_root_model(some_type)
+
+
+def is_list_model(model: Type[BaseModel]) -> bool:
+    return bool(model.__pydantic_root_model__) and (
+        getattr(model.model_fields["root"].annotation, "__origin__", None)
+        is list
     )
 
 
+def is_list_type(some_type: Type[Any]) -> bool:
+    """Tells whether the type is a list or a list root model."""
+    if isinstance(some_type, type) and issubclass(some_type, BaseModel):
+        return is_list_model(some_type)
+    return getattr(some_type, "__origin__", None) is list
+
+
+class LazyModel:
+    """Procedure attribute, which builds in_type & out_type on first access.
+
+    Both are built at once and replace the descriptors in the class dict, so
+    next lookups are plain attribute lookups.
+    """
+
+    __slots__ = ["name", "in_annotation", "out_annotation"]
+
+    def __init__(self, name, in_annotation, out_annotation):
+        self.name = name
+        self.in_annotation = in_annotation
+        self.out_annotation = out_annotation
+
+    def __get__(self, instance, owner):
+        in_type = ensure_pydantic_model(self.in_annotation)
+        out_type = ensure_pydantic_model(self.out_annotation)
+        owner.in_type = in_type
+        owner.out_type = out_type
+        return in_type if self.name == "in_type" else out_type
+
+
 class ProcedureMeta(abc.ABCMeta):
     """Meta class, which creates AbstractProcedure and AbstractAsyncProcedure."""
 
@@ -34,22 +198,53 @@ class ProcedureMeta(abc.ABCMeta):
     def __new__(mcs, name, bases, dict_):
         cls = super().__new__(mcs, name, bases, dict_)
         cls.name = name
+        method = None
         if hasattr(cls, "call"):
             if asyncio.iscoroutinefunction(cls.call):
                 raise TypeError(
                     "either make 'call' sync or inherit AbstractAsyncProcedure"
                 )
-            cls.in_type, cls.out_type = mcs.get_in_n_out_models(cls.call)
+            method = cls.call
         if hasattr(cls, "call_async"):
             if not asyncio.iscoroutinefunction(cls.call_async):
                 raise TypeError(
                     "either make 'call_async' async or inherit AbstractProcedure"
                 )
-            cls.in_type, cls.out_type = mcs.get_in_n_out_models(cls.call_async)
+            method = cls.call_async
+        if method is None:
+            return cls
+
+        in_annotation, out_annotation = mcs.get_in_n_out_types(method)
+        chunk_size = getattr(cls, "RESULT_CHUNK_SIZE", None)
+        if chunk_size is not None:
+            if not is_list_type(out_annotation):
+                raise TypeError(
+                    "RESULT_CHUNK_SIZE requires a list return annotation",
+                    out_annotation,
+                )
+            if not isinstance(chunk_size, int) or chunk_size <= 0:
+                raise ValueError(
+                    "RESULT_CHUNK_SIZE must be a positive int", chunk_size
+                )
+        if getattr(cls, "LAZY", False):
+            for attr in ("in_type", "out_type"):
+                setattr(
+                    cls, attr, LazyModel(attr, in_annotation, out_annotation)
+                )
+        else:
+            cls.in_type = ensure_pydantic_model(in_annotation)
+            cls.out_type = ensure_pydantic_model(out_annotation)
         return cls
 
+    @classmethod
+    def get_in_n_out_models(mcs, method):
+        return tuple(
+            ensure_pydantic_model(annotation)
+            for annotation in mcs.get_in_n_out_types(method)
+        )
+
     @staticmethod
-    def get_in_n_out_models(method):
+    def get_in_n_out_types(method):
         signature = inspect.signature(method)
         return_annotation = signature.return_annotation
         if return_annotation is inspect.Signature.empty:
@@ -67,26 +262,84 @@ class ProcedureMeta(abc.ABCMeta):
         if in_type is None or in_type is inspect.Signature.empty:
             raise ValueError("missing input type annotation", method, in_type)
 
-        return (
-            ensure_pydantic_model(in_type),
-            ensure_pydantic_model(return_annotation),
-        )
+        return in_type, return_annotation
 
 
 class AbstractProcedure(metaclass=ProcedureMeta):
     """Base class of an synchronous RPC procedure."""
 
     PERMISSIONS: Sequence[Callable[[Any], None]] = ()
+    RESULT_CHUNK_SIZE: Optional[int] = None
+    QUERY: bool = False
+    QUERY_MAX_AGE: int = 0
+    # responses of QUERY procedures are cacheable by browsers only; public
+    # ones by shared caches (proxies, CDNs) too, unless PERMISSIONS are set
+    QUERY_PUBLIC: bool = False
+    NAMESPACE: Optional[str] = None
+    # seconds to keep serialized results in Rpc.result_cache
+    RESULT_CACHE_TTL: float = 0
+    # build in_type & out_type models on first use (see Rpc.warm)
+    LAZY: bool = False
+    # seconds for TS clients to serve cached results & to serve them stale,
+    # while refetching in background
+    CLIENT_CACHE_TTL: float = 0
+    CLIENT_CACHE_SWR: float = 0
+    # default priority of calls in the TS client queue, higher go first
+    PRIORITY: int = 0
 
     in_type: Type[Any]
     out_type: Type[Any]
 
     def _call(self, raw_data, context):
         self.check_permissions(context)
+        return self._call_unchecked(raw_data, context)
+
+    def _call_unchecked(self, raw_data, context):
+        in_ = self.in_type.model_validate(raw_data)
+        pump_result = self.call(in_, context)
+        return self.out_type.model_validate(pump_result)
+
+    def _invoke(self, in_, context, revalidate):
+        """Same as _call, but takes & returns python objects (see invoke)."""
+        self.check_permissions(context)
+        if not isinstance(in_, self.in_type):
+            in_ = self.in_type.model_validate(in_)
+        elif revalidate:
+            # model_validate returns instances as is
+            in_ = self.in_type.model_validate(
+                in_.model_dump(by_alias=True, round_trip=True)
+            )
+        return unwrap_root(
+            self.out_type.model_validate(self.call(in_, context))
+        )
+
+    def _call_timed(self, raw_data, context, timing):
+        """Same as _call, but marks phases of ServerTiming."""
+        self.check_permissions(context)
+        timing.mark("permissions")
         in_ = self.in_type.model_validate(raw_data)
+        timing.mark("validate")
         pump_result = self.call(in_, context)
+        timing.mark("call")
         return self.out_type.model_validate(pump_result)
 
+    def result_cache_key(self, params, context) -> Optional[bytes]:
+        """Returns key of the result in Rpc.result_cache, None to skip it.
+
+        Results are shared by calls with equal params; override to vary them
+        by context (e.g. by user).
+        """
+        return canonical_params(params)
+
+    def idempotency_scope(self, context) -> Optional[bytes]:
+        """Returns whose idempotency keys calls use, None to ignore them.
+
+        Idempotency keys are opt-in: override to return e.g. the user id
+        from context, so keys of different users never collide (b"" shares
+        them by all callers).
+        """
+        return None
+
     def check_permissions(self, context):
         for permission in self.PERMISSIONS:
             permission(context)
@@ -100,6 +353,23 @@ class AbstractAsyncProcedure(metaclass=ProcedureMeta):
     """Base class of an asynchronous RPC procedure."""
 
     PERMISSIONS: Sequence[Callable[[Any], Optional[Awaitable[Any]]]] = ()
+    RESULT_CHUNK_SIZE: Optional[int] = None
+    QUERY: bool = False
+    QUERY_MAX_AGE: int = 0
+    # responses of QUERY procedures are cacheable by browsers only; public
+    # ones by shared caches (proxies, CDNs) too, unless PERMISSIONS are set
+    QUERY_PUBLIC: bool = False
+    NAMESPACE: Optional[str] = None
+    # seconds to keep serialized results in Rpc.result_cache
+    RESULT_CACHE_TTL: float = 0
+    # build in_type & out_type models on first use (see Rpc.warm)
+    LAZY: bool = False
+    # seconds for TS clients to serve cached results & to serve them stale,
+    # while refetching in background
+    CLIENT_CACHE_TTL: float = 0
+    CLIENT_CACHE_SWR: float = 0
+    # default priority of calls in the TS client queue, higher go first
+    PRIORITY: int = 0
 
     in_type: Type[Any]
     out_type: Type[Any]
@@ -112,10 +382,54 @@ class AbstractAsyncProcedure(metaclass=ProcedureMeta):
 
     async def _call(self, raw_data, context):
         await self.check_permissions(context)
+        return await self._call_unchecked(raw_data, context)
+
+    async def _call_unchecked(self, raw_data, context):
         in_ = self.in_type.model_validate(raw_data)
         pump_result = await self.call_async(in_, context)
         return self.out_type.model_validate(pump_result)
 
+    async def _invoke(self, in_, context, revalidate):
+        """Same as _call, but takes & returns python objects (see invoke)."""
+        await self.check_permissions(context)
+        if not isinstance(in_, self.in_type):
+            in_ = self.in_type.model_validate(in_)
+        elif revalidate:
+            # model_validate returns instances as is
+            in_ = self.in_type.model_validate(
+                in_.model_dump(by_alias=True, round_trip=True)
+            )
+        return unwrap_root(
+            self.out_type.model_validate(await self.call_async(in_, context))
+        )
+
+    async def _call_timed(self, raw_data, context, timing):
+        """Same as _call, but marks phases of ServerTiming."""
+        await self.check_permissions(context)
+        timing.mark("permissions")
+        in_ = self.in_type.model_validate(raw_data)
+        timing.mark("validate")
+        pump_result = await self.call_async(in_, context)
+        timing.mark("call")
+        return self.out_type.model_validate(pump_result)
+
+    def result_cache_key(self, params, context) -> Optional[bytes]:
+        """Returns key of the result in Rpc.result_cache, None to skip it.
+
+        Results are shared by calls with equal params; override to vary them
+        by context (e.g. by user).
+        """
+        return canonical_params(params)
+
+    def idempotency_scope(self, context) -> Optional[bytes]:
+        """Returns whose idempotency keys calls use, None to ignore them.
+
+        Idempotency keys are opt-in: override to return e.g. the user id
+        from context, so keys of different users never collide (b"" shares
+        them by all callers).
+        """
+        return None
+
     async def check_permissions(self, context):
         for permission, is_async in self._permissions:
             if is_async:
@@ -133,15 +447,191 @@ class RpcRequest(BaseModel):
     id: int
     method: str
     params: Any
+    # repeated calls with the same key get the result of the first one
+    idempotency_key: Optional[str] = None
+
+
+class RpcQuery(BaseModel):
+    method: str
+    params: Json[Any] = None
+
+
+RESULT_PREFIX = b'{"jsonrpc": "2.0", "result": '
+ERROR_PREFIX = b'{"jsonrpc": "2.0", "error": '
+METHOD_NOT_FOUND_PREFIX = b'{"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}'
+IDEMPOTENCY_KEY_REUSED_PREFIX = b'{"jsonrpc": "2.0", "error": {"code": -32602, "message": "Idempotency key is reused with other params"}'
+NULL_ID_SUFFIX = b', "id": null}'
+
+
+def id_suffix(request_id: int) -> bytes:
+    return b', "id": %d}' % request_id
+
+
+def iter_list_chunks(out_type, result, chunk_size) -> Iterator[bytes]:
+    """Serializes a list result by slices of chunk_size items.
+
+    Only one chunk of JSON is kept in memory at a time; brackets of each
+    serialized slice are cut off via memoryview, so nothing is copied.
+    """
+    serializer = out_type.__pydantic_serializer__
+    items = result.root
+    yield b"["
+    for start in range(0, len(items), chunk_size):
+        if start:
+            yield b","
+        yield memoryview(
+            serializer.to_json(
+                out_type.model_construct(items[start : start + chunk_size])
+            )
+        )[1:-1]
+    yield b"]"
+
+
+def canonical_params(params) -> bytes:
+    return json.dumps(
+        params, sort_keys=True, separators=(",", ":"), default=str
+    ).encode()
+
+
+def serialize_result(procedure, result) -> bytes:
+    chunk_size = procedure.RESULT_CHUNK_SIZE
+    if chunk_size is None:
+        return result.__pydantic_serializer__.to_json(result)
+    return b"".join(iter_list_chunks(procedure.out_type, result, chunk_size))
+
+
+def result_cache_key(procedure, rpc_request, context) -> Optional[bytes]:
+    key = procedure.result_cache_key(rpc_request.params, context)
+    if key is None:
+        return None
+    return b"%s\0%s" % (rpc_request.method.encode(), key)
+
+
+def idempotency_key(procedure, rpc_request, context) -> Optional[bytes]:
+    """Returns key of the call in Rpc.idempotency_store, None to skip it."""
+    if rpc_request.idempotency_key is None:
+        return None
+    scope = procedure.idempotency_scope(context)
+    if scope is None:
+        return None
+    # the scope is length prefixed, so no scope & key pair is ambiguous
+    return b"%s\0%d\0%s%s" % (
+        rpc_request.method.encode(),
+        len(scope),
+        scope,
+        rpc_request.idempotency_key.encode(),
+    )
+
+
+def params_digest(rpc_request) -> bytes:
+    return hashlib.blake2b(
+        canonical_params(rpc_request.params), digest_size=16
+    ).digest()
+
+
+def result_chunks(procedure, result, request_id, lazy) -> Iterable[bytes]:
+    chunk_size = procedure.RESULT_CHUNK_SIZE
+    if chunk_size is None:
+        return (
+            RESULT_PREFIX,
+            result.__pydantic_serializer__.to_json(result),
+            request_id,
+        )
+    chunks = chain(
+        (RESULT_PREFIX,),
+        iter_list_chunks(procedure.out_type, result, chunk_size),
+        (request_id,),
+    )
+    return chunks if lazy else tuple(chunks)
+
+
+def parse_rpc_request(raw_data) -> RpcRequest:
+    """Parses JSON-RPC request from a body or already decoded data.
+
+    Bytes-like bodies (including memoryview) are passed to the JSON parser
+    without copying whenever the view covers the whole underlying buffer.
+    """
+    if isinstance(raw_data, memoryview):
+        obj = raw_data.obj
+        if (
+            isinstance(obj, (bytes, bytearray))
+            and raw_data.c_contiguous
+            and raw_data.nbytes == len(obj)
+        ):
+            raw_data = obj
+        else:
+            raw_data = raw_data.tobytes()
+
+    if isinstance(raw_data, (str, bytes, bytearray)):
+        return RpcRequest.model_validate_json(raw_data)
+    return RpcRequest.model_validate(raw_data)
+
+
+def parse_rpc_query(query) -> RpcRequest:
+    """Parses JSON-RPC request from a mapping of query parameters.
+
+    Queries have no ids (always 0), so equal queries get equal responses.
+    """
+    rpc_query = RpcQuery.model_validate(
+        {key: query[key] for key in ("method", "params") if key in query}
+    )
+    return RpcRequest(id=0, method=rpc_query.method, params=rpc_query.params)
+
+
+def unwrap_root(model):
+    return model.root if model.__pydantic_root_model__ else model
+
+
+def find_procedure(procedures, procedure):
+    """Returns the registered procedure by name or class."""
+    name = procedure if isinstance(procedure, str) else procedure.name
+    instance = procedures.get(name)
+    if instance is None or not (
+        isinstance(procedure, str) or isinstance(instance, procedure)
+    ):
+        raise ProcedureNotFound(procedure)
+    return instance
+
+
+def query_cache_control(procedures, query, chunks) -> Optional[str]:
+    """Returns Cache-Control of a successful query response, None otherwise.
+
+    Responses are private, unless the procedure is public and has no
+    permissions, since results may depend on the caller.
+    """
+    if chunks[0] != RESULT_PREFIX:
+        return None
+    procedure = procedures[query["method"]]
+    scope = (
+        "public"
+        if procedure.QUERY_PUBLIC and not procedure.PERMISSIONS
+        else "private"
+    )
+    return f"{scope}, max-age={procedure.QUERY_MAX_AGE}"
 
 
 class AbstractRpc(abc.ABC):
     """Abstract class of a synchronous RPC service."""
 
-    __slots__ = ["procedures"]
+    __slots__ = ["procedures", "compressor", "idempotency_store"]
+
+    # every Rpc gets its own ResponseCompressor, unless a subclass sets one
+    # (None disables compression)
+    compressor: Optional[ResponseCompressor]
+    # results of procedures with RESULT_CACHE_TTL are cached there
+    result_cache: Optional[SharedResultCache] = None
+    # every Rpc gets its own IdempotencyStore of results of calls with
+    # idempotency keys, unless a subclass sets one (None ignores the keys)
+    idempotency_store: Optional[IdempotencyStore]
+    # HTTP responses get Server-Timing header with durations of call phases
+    server_timing: bool = False
 
     def __init__(self):
         self.procedures = {}
+        if not hasattr(self, "compressor"):
+            self.compressor = ResponseCompressor()
+        if not hasattr(self, "idempotency_store"):
+            self.idempotency_store = IdempotencyStore()
 
     def register(self, *procedures):
         for procedure in procedures:
@@ -164,66 +654,276 @@ class AbstractRpc(abc.ABC):
         return self
 
     def call(self, raw_data, context) -> bytes:
-        buf = BytesIO()
-        write_ = buf.write
+        return b"".join(self.call_chunks(raw_data, context, lazy=False))
 
-        request_id = b"null"
+    def call_chunks(
+        self, raw_data, context, from_query=False, timing=None, lazy=True
+    ) -> Iterable[bytes]:
+        """Same as call, but returns the response body as buffers.
+
+        The serialized result is one of the buffers as is, so the body can be
+        written piece by piece (e.g. ASGI "more_body" messages or
+        socket.sendmsg) without copying it once again.
+
+        Results of procedures with RESULT_CHUNK_SIZE set are serialized lazily
+        while the returned iterator is consumed, so errors of serialization
+        are raised by it, rather than passed to prepare_exception; lazy=False
+        serializes them eagerly.
+
+        If from_query is True, raw_data is a mapping of query parameters:
+        "method" and "params" (JSON); only QUERY procedures can be called so.
+
+        If timing (ServerTiming) is passed, phases of the call are marked and
+        the result is serialized eagerly.
+        """
+        chunks, _ = self._call_chunks(
+            raw_data, context, from_query, timing, lazy
+        )
+        return chunks
+
+    def _call_chunks(self, raw_data, context, from_query, timing, lazy):
+        """Same as call_chunks, but also returns whether the result is cached.
+
+        Compression of results of result_cache is memoized by call_http.
+        """
+        request_id = NULL_ID_SUFFIX
         try:
             rpc_request = (
-                RpcRequest.model_validate_json(raw_data)
-                if isinstance(raw_data, (str, bytes, bytearray))
-                else RpcRequest.model_validate(raw_data)
+                parse_rpc_query(raw_data)
+                if from_query
+                else parse_rpc_request(raw_data)
             )
-            request_id = str(rpc_request.id).encode("utf-8")
-            if rpc_request.method not in self.procedures:
-                write_(
-                    b'{"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": '
-                )
-                write_(request_id)
-                write_(b"}")
-                return buf.getvalue()
+            request_id = id_suffix(rpc_request.id)
+            if timing is not None:
+                timing.mark("parse")
+            procedure = self.procedures.get(rpc_request.method)
+            if procedure is None or from_query and not procedure.QUERY:
+                return (METHOD_NOT_FOUND_PREFIX, request_id), False
 
-            result = self.procedures[  # pylint: disable=protected-access
-                rpc_request.method
-            ]._call(rpc_request.params, context)
+            store = self.idempotency_store
+            key = (
+                idempotency_key(procedure, rpc_request, context)
+                if store is not None
+                else None
+            )
+            if key is not None:
+                chunks = self._call_idempotent(
+                    store, key, procedure, rpc_request, context, request_id
+                )
+                return chunks, False
+            result_cache = self.result_cache
+            if result_cache is not None and procedure.RESULT_CACHE_TTL:
+                return self._call_cached(
+                    result_cache,
+                    procedure,
+                    rpc_request,
+                    context,
+                    request_id,
+                    lazy,
+                )
+            if timing is not None:
+                chunks = self._call_timed(
+                    procedure, rpc_request, context, request_id, timing
+                )
+                return chunks, False
 
-            write_(b'{"jsonrpc": "2.0", "result": ')
-            write_(result.__pydantic_serializer__.to_json(result))
-            write_(b', "id": ')
-            write_(request_id)
-            write_(b"}")
-            return buf.getvalue()
+            result = procedure._call(  # pylint: disable=protected-access
+                rpc_request.params, context
+            )
+            chunks = result_chunks(procedure, result, request_id, lazy)
+            return chunks, False
 
         except Exception as e:  # pylint: disable=broad-exception-caught
             data = self.prepare_exception(raw_data, context, e)
             if data is None:
                 raise
 
-            write_(b'{"jsonrpc": "2.0", "error": ')
-            write_(to_json(data))
-            write_(b', "id": ')
-            write_(request_id)
-            write_(b"}")
-            return buf.getvalue()
+            return (ERROR_PREFIX, to_json(data), request_id), False
+
+    def _call_timed(self, procedure, rpc_request, context, request_id, timing):
+        # pylint: disable=protected-access
+        result = procedure._call_timed(rpc_request.params, context, timing)
+        serialized = serialize_result(procedure, result)
+        timing.mark("serialize")
+        return (RESULT_PREFIX, serialized, request_id)
+
+    def _call_idempotent(
+        self, store, key, procedure, rpc_request, context, request_id
+    ):
+        """Calls a procedure once per idempotency key.
+
+        Repeated calls wait for the first one and respond with its result
+        (permissions are checked anyway), unless their params differ; failed
+        calls are not stored.
+        """
+        procedure.check_permissions(context)
+        digest = params_digest(rpc_request)
+        while True:
+            is_owner, call = store.claim(key, digest)
+            if is_owner:
+                break
+            if call.params_digest != digest:
+                return (IDEMPOTENCY_KEY_REUSED_PREFIX, request_id)
+            serialized = call.wait(store.ttl)
+            if serialized is not None:
+                return (RESULT_PREFIX, serialized, request_id)
+
+        serialized = None
+        try:
+            # pylint: disable=protected-access
+            result = procedure._call_unchecked(rpc_request.params, context)
+            serialized = serialize_result(procedure, result)
+        finally:
+            store.done(key, call, serialized)
+        return (RESULT_PREFIX, serialized, request_id)
+
+    def _call_cached(
+        self, result_cache, procedure, rpc_request, context, request_id, lazy
+    ):
+        """Calls a procedure unless its result is in result_cache.
+
+        Permissions are checked on cache hits too. Returns the response
+        chunks and whether the result is stored in result_cache.
+        """
+        procedure.check_permissions(context)
+        key = result_cache_key(procedure, rpc_request, context)
+        if key is not None:
+            serialized = result_cache.get(key)
+            if serialized is not None:
+                return (RESULT_PREFIX, serialized, request_id), True
+
+        result = procedure._call_unchecked(  # pylint: disable=protected-access
+            rpc_request.params, context
+        )
+        if key is None:
+            chunks = result_chunks(procedure, result, request_id, lazy)
+            return chunks, False
+        serialized = serialize_result(procedure, result)
+        result_cache.set(key, serialized, procedure.RESULT_CACHE_TTL)
+        return (RESULT_PREFIX, serialized, request_id), True
+
+    def call_http(
+        self, raw_data, context, headers=None, http_method="POST", query=None
+    ) -> HttpResponse:
+        """Same as call, but returns HTTP response.
+
+        Args:
+          raw_data: request body
+          context: anything to be passed to procedures
+          headers: case-insensitive mapping of request headers (or a dict
+            with lowercase keys), used for content negotiation
+          http_method: GET requests call QUERY procedures, responding with
+            Cache-Control and ETag headers (304 if the ETag matches)
+          query: mapping of query parameters, used by GET requests
+        """
+        timing = ServerTiming() if self.server_timing else None
+        chunks: Iterable[bytes]
+        if http_method == "GET":
+            chunks = tuple(
+                self.call_chunks(
+                    query, context, True, timing=timing, lazy=False
+                )
+            )
+            response = make_query_http_response(
+                chunks,
+                headers,
+                self.compressor,
+                query_cache_control(self.procedures, query, chunks),
+            )
+        else:
+            chunks, is_cached = self._call_chunks(
+                raw_data, context, False, timing, True
+            )
+            response = make_http_response(
+                chunks, headers, self.compressor, is_cached
+            )
+        if timing is not None:
+            response.headers["Server-Timing"] = timing.to_header()
+        return response
+
+    def invoke(self, procedure, in_, context, revalidate=False):
+        """Calls a registered procedure in process, without JSON.
+
+        Permissions are checked, input & output are validated like by call,
+        except for input which already is an instance of in_type (unless
+        revalidate is True).
+
+        Args:
+          procedure: procedure class or name
+          in_: in_type instance or python data to validate
+          context: anything to be passed to the procedure
+          revalidate: validate in_type instances too
+
+        Returns:
+          out_type instance or the root value of a root model
+        """
+        # pylint: disable=protected-access
+        return find_procedure(self.procedures, procedure)._invoke(
+            in_, context, revalidate
+        )
+
+    def warm(self):
+        """Builds models of lazy procedures (see LAZY), returns self."""
+        for procedure in self.procedures.values():
+            for model in (procedure.in_type, procedure.out_type):
+                if not model.__pydantic_complete__:
+                    model.model_rebuild()
+        return self
 
     @abc.abstractmethod
     def prepare_exception(self, raw_data, context, exc):
         raise NotImplementedError
 
-    def ts_dump(self, filename):
-        """Dumps typescript type definitions and client to a file."""
+    def ts_dump(self, filename, validate_params=False, manifest=True):
+        """Dumps typescript type definitions and client to a file.
+
+        validate_params makes the client check params against constraints of
+        models before sending them. manifest=False skips writing of the
+        manifest of the file (see TsExporter.write).
+        """
+        from ._export import TsExporter
+
+        return TsExporter(self, validate_params=validate_params).write(
+            filename, manifest
+        )
+
+    def ts_dump_dir(self, dirname, validate_params=False, manifest=True):
+        """Dumps typescript client to a directory, a module per namespace."""
         from ._export import TsExporter
 
-        return TsExporter(self).write(filename)
+        return TsExporter(self, validate_params=validate_params).write_dir(
+            dirname, manifest
+        )
+
+    def py_dump(self, filename):
+        """Dumps typed python client (see PyExporter) to a file."""
+        from ._py_export import PyExporter
+
+        return PyExporter(self).write(filename)
 
 
 class AbstractAsyncRpc(abc.ABC):
     """Abstract class of a asynchronous RPC service."""
 
-    __slots__ = ["procedures"]
+    __slots__ = ["procedures", "compressor", "idempotency_store"]
+
+    # every Rpc gets its own ResponseCompressor, unless a subclass sets one
+    # (None disables compression)
+    compressor: Optional[ResponseCompressor]
+    # results of procedures with RESULT_CACHE_TTL are cached there
+    result_cache: Optional[SharedResultCache] = None
+    # every Rpc gets its own IdempotencyStore of results of calls with
+    # idempotency keys, unless a subclass sets one (None ignores the keys)
+    idempotency_store: Optional[IdempotencyStore]
+    # HTTP responses get Server-Timing header with durations of call phases
+    server_timing: bool = False
 
     def __init__(self):
         self.procedures = {}
+        if not hasattr(self, "compressor"):
+            self.compressor = ResponseCompressor()
+        if not hasattr(self, "idempotency_store"):
+            self.idempotency_store = IdempotencyStore()
 
     def register(self, *procedures):
         for procedure in procedures:
@@ -243,26 +943,96 @@ class AbstractAsyncRpc(abc.ABC):
         return self
 
     async def call_async(self, raw_data, context) -> bytes:
-        buf = BytesIO()
-        write_ = buf.write
-        request_id = b"null"
+        return b"".join(
+            await self.call_async_chunks(raw_data, context, lazy=False)
+        )
+
+    async def call_async_chunks(
+        self, raw_data, context, from_query=False, timing=None, lazy=True
+    ) -> Iterable[bytes]:
+        """Same as call_async, but returns the response body as buffers.
+
+        The serialized result is one of the buffers as is, so the body can be
+        written piece by piece (e.g. ASGI "more_body" messages or
+        socket.sendmsg) without copying it once again.
+
+        Results of procedures with RESULT_CHUNK_SIZE set are serialized lazily
+        while the returned iterator is consumed, so errors of serialization
+        are raised by it, rather than passed to prepare_exception; lazy=False
+        serializes them eagerly.
+
+        If from_query is True, raw_data is a mapping of query parameters:
+        "method" and "params" (JSON); only QUERY procedures can be called so.
+
+        If timing (ServerTiming) is passed, phases of the call are marked and
+        the result is serialized eagerly.
+
+        BatchLoaders with "request" scope cache values for the call.
+        """
+        chunks, _ = await self._call_async_chunks(
+            raw_data, context, from_query, timing, lazy
+        )
+        return chunks
+
+    async def _call_async_chunks(
+        self, raw_data, context, from_query, timing, lazy
+    ):
+        """Same as call_async_chunks, also returns whether it's cached.
+
+        Compression of results of result_cache is memoized by call_http_async.
+        """
+        token = REQUEST_CACHES.set({})
+        try:
+            return await self._call_procedure(
+                raw_data, context, from_query, timing, lazy
+            )
+        finally:
+            REQUEST_CACHES.reset(token)
+
+    async def _call_procedure(
+        self, raw_data, context, from_query, timing, lazy
+    ):
+        request_id = NULL_ID_SUFFIX
         try:
             rpc_request = (
-                RpcRequest.model_validate_json(raw_data)
-                if isinstance(raw_data, (str, bytes, bytearray))
-                else RpcRequest.model_validate(raw_data)
+                parse_rpc_query(raw_data)
+                if from_query
+                else parse_rpc_request(raw_data)
             )
+            request_id = id_suffix(rpc_request.id)
+            if timing is not None:
+                timing.mark("parse")
+            procedure = self.procedures.get(rpc_request.method)
+            if procedure is None or from_query and not procedure.QUERY:
+                return (METHOD_NOT_FOUND_PREFIX, request_id), False
 
-            request_id = str(rpc_request.id).encode("utf-8")
-            if rpc_request.method not in self.procedures:
-                write_(
-                    b'{"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": '
+            store = self.idempotency_store
+            key = (
+                idempotency_key(procedure, rpc_request, context)
+                if store is not None
+                else None
+            )
+            if key is not None:
+                chunks = await self._call_idempotent(
+                    store, key, procedure, rpc_request, context, request_id
                 )
-                write_(request_id)
-                write_(b"}")
-                return buf.getvalue()
+                return chunks, False
+            result_cache = self.result_cache
+            if result_cache is not None and procedure.RESULT_CACHE_TTL:
+                return await self._call_cached(
+                    result_cache,
+                    procedure,
+                    rpc_request,
+                    context,
+                    request_id,
+                    lazy,
+                )
+            if timing is not None:
+                chunks = await self._call_timed(
+                    procedure, rpc_request, context, request_id, timing
+                )
+                return chunks, False
 
-            procedure = self.procedures[rpc_request.method]
             if isinstance(procedure, AbstractAsyncProcedure):
                 result = (
                     await procedure._call(  # pylint: disable=protected-access
@@ -273,31 +1043,177 @@ class AbstractAsyncRpc(abc.ABC):
                 result = procedure._call(  # pylint: disable=protected-access
                     rpc_request.params, context
                 )
-
-            write_(b'{"jsonrpc": "2.0", "result": ')
-            write_(result.__pydantic_serializer__.to_json(result))
-            write_(b', "id": ')
-            write_(request_id)
-            write_(b"}")
-            return buf.getvalue()
+            chunks = result_chunks(procedure, result, request_id, lazy)
+            return chunks, False
 
         except Exception as e:  # pylint: disable=broad-exception-caught
             data = self.prepare_exception(raw_data, context, e)
             if data is None:
                 raise
-            write_(b'{"jsonrpc": "2.0", "error": ')
-            write_(to_json(data))
-            write_(b', "id": ')
-            write_(request_id)
-            write_(b"}")
-            return buf.getvalue()
+            return (ERROR_PREFIX, to_json(data), request_id), False
+
+    async def _call_timed(
+        self, procedure, rpc_request, context, request_id, timing
+    ):
+        # pylint: disable=protected-access
+        if isinstance(procedure, AbstractAsyncProcedure):
+            result = await procedure._call_timed(
+                rpc_request.params, context, timing
+            )
+        else:
+            result = procedure._call_timed(rpc_request.params, context, timing)
+        serialized = serialize_result(procedure, result)
+        timing.mark("serialize")
+        return (RESULT_PREFIX, serialized, request_id)
+
+    async def _call_idempotent(
+        self, store, key, procedure, rpc_request, context, request_id
+    ):
+        """Calls a procedure once per idempotency key.
+
+        Repeated calls wait for the first one and respond with its result
+        (permissions are checked anyway), unless their params differ; failed
+        calls are not stored.
+        """
+        is_async = isinstance(procedure, AbstractAsyncProcedure)
+        if is_async:
+            await procedure.check_permissions(context)
+        else:
+            procedure.check_permissions(context)
+        digest = params_digest(rpc_request)
+        while True:
+            is_owner, call = store.claim(key, digest)
+            if is_owner:
+                break
+            if call.params_digest != digest:
+                return (IDEMPOTENCY_KEY_REUSED_PREFIX, request_id)
+            serialized = await call.wait_async(store.ttl)
+            if serialized is not None:
+                return (RESULT_PREFIX, serialized, request_id)
+
+        serialized = None
+        try:
+            # pylint: disable=protected-access
+            result = procedure._call_unchecked(rpc_request.params, context)
+            if is_async:
+                result = await result
+            serialized = serialize_result(procedure, result)
+        finally:
+            store.done(key, call, serialized)
+        return (RESULT_PREFIX, serialized, request_id)
+
+    async def _call_cached(
+        self, result_cache, procedure, rpc_request, context, request_id, lazy
+    ):
+        """Calls a procedure unless its result is in result_cache.
+
+        Permissions are checked on cache hits too. Returns the response
+        chunks and whether the result is stored in result_cache.
+        """
+        is_async = isinstance(procedure, AbstractAsyncProcedure)
+        if is_async:
+            await procedure.check_permissions(context)
+        else:
+            procedure.check_permissions(context)
+        key = result_cache_key(procedure, rpc_request, context)
+        if key is not None:
+            serialized = result_cache.get(key)
+            if serialized is not None:
+                return (RESULT_PREFIX, serialized, request_id), True
+
+        # pylint: disable=protected-access
+        result = procedure._call_unchecked(rpc_request.params, context)
+        if is_async:
+            result = await result
+        if key is None:
+            chunks = result_chunks(procedure, result, request_id, lazy)
+            return chunks, False
+        serialized = serialize_result(procedure, result)
+        result_cache.set(key, serialized, procedure.RESULT_CACHE_TTL)
+        return (RESULT_PREFIX, serialized, request_id), True
+
+    async def call_http_async(
+        self, raw_data, context, headers=None, http_method="POST", query=None
+    ) -> HttpResponse:
+        """Same as call_async, but returns HTTP response.
+
+        Args:
+          raw_data: request body
+          context: anything to be passed to procedures
+          headers: case-insensitive mapping of request headers (or a dict
+            with lowercase keys), used for content negotiation
+          http_method: GET requests call QUERY procedures, responding with
+            Cache-Control and ETag headers (304 if the ETag matches)
+          query: mapping of query parameters, used by GET requests
+        """
+        timing = ServerTiming() if self.server_timing else None
+        chunks: Iterable[bytes]
+        if http_method == "GET":
+            chunks = tuple(
+                await self.call_async_chunks(
+                    query, context, True, timing=timing, lazy=False
+                )
+            )
+            response = make_query_http_response(
+                chunks,
+                headers,
+                self.compressor,
+                query_cache_control(self.procedures, query, chunks),
+            )
+        else:
+            chunks, is_cached = await self._call_async_chunks(
+                raw_data, context, False, timing, True
+            )
+            response = make_http_response(
+                chunks, headers, self.compressor, is_cached
+            )
+        if timing is not None:
+            response.headers["Server-Timing"] = timing.to_header()
+        return response
+
+    async def invoke_async(self, procedure, in_, context, revalidate=False):
+        """Same as AbstractRpc.invoke, for sync and async procedures."""
+        procedure = find_procedure(self.procedures, procedure)
+        # pylint: disable=protected-access
+        if isinstance(procedure, AbstractAsyncProcedure):
+            return await procedure._invoke(in_, context, revalidate)
+        return procedure._invoke(in_, context, revalidate)
+
+    def warm(self):
+        """Builds models of lazy procedures (see LAZY), returns self."""
+        for procedure in self.procedures.values():
+            for model in (procedure.in_type, procedure.out_type):
+                if not model.__pydantic_complete__:
+                    model.model_rebuild()
+        return self
 
     @abc.abstractmethod
     def prepare_exception(self, raw_data, context, exc):
         raise NotImplementedError
 
-    def ts_dump(self, filename):
-        """Dumps typescript type definitions and client to a file."""
+    def ts_dump(self, filename, validate_params=False, manifest=True):
+        """Dumps typescript type definitions and client to a file.
+
+        validate_params makes the client check params against constraints of
+        models before sending them. manifest=False skips writing of the
+        manifest of the file (see TsExporter.write).
+        """
         from ._export import TsExporter
 
-        return TsExporter(self).write(filename)
+        return TsExporter(self, validate_params=validate_params).write(
+            filename, manifest
+        )
+
+    def ts_dump_dir(self, dirname, validate_params=False, manifest=True):
+        """Dumps typescript client to a directory, a module per namespace."""
+        from ._export import TsExporter
+
+        return TsExporter(self, validate_params=validate_params).write_dir(
+            dirname, manifest
+        )
+
+    def py_dump(self, filename):
+        """Dumps typed python client (see PyExporter) to a file."""
+        from ._py_export import PyExporter
+
+        return PyExporter(self).write(filename)
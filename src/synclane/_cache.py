@@ -0,0 +1,310 @@
+"""Defines caches of results: shared by workers and idempotent calls."""
+
+import asyncio
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+
+MAGIC = b"SYNCLNC1"
+# magic, number of sets, ways per set, slot size
+FILE_HEADER = struct.Struct("<8sIII")
+FILE_HEADER_SIZE = 64
+# seq, key digest, expires at, used at, data length
+SLOT_HEADER = struct.Struct("<I16sddI")
+SEQ = struct.Struct("<I")
+USED_AT = struct.Struct("<d")
+USED_AT_OFFSET = 28
+READ_ATTEMPTS = 4
+
+
+def begin_slot_write(mm, offset) -> int:
+    """Marks the slot as being written, returns its (odd) sequence number.
+
+    One left odd by a crashed writer stays odd, rather than becoming even
+    (i.e. readable) in the middle of the write.
+    """
+    seq = SEQ.unpack_from(mm, offset)[0] | 1
+    SEQ.pack_into(mm, offset, seq)
+    return seq
+
+
+def end_slot_write(mm, offset, seq):
+    """Marks the slot as written: its sequence number becomes even."""
+    SEQ.pack_into(mm, offset, (seq + 1) & 0xFFFFFFFF)
+
+
+class SharedResultCache:
+    """Cache of serialized results in a memory-mapped file (POSIX only).
+
+    Workers of a host, which open the same file, share cached results. The
+    file is a fixed-size hash index: a key digest picks a set of slots, a
+    value is stored in a matching, expired or least recently used slot of the
+    set. Values longer than a slot are not cached.
+
+    Reads take no locks: every slot has a sequence number, which is odd
+    while the slot is being written, so readers retry on changes (seqlock).
+    Writes lock the byte range of their set with fcntl (and a thread lock,
+    since fcntl locks are per process).
+
+    Args:
+      path: file to share, created if missing
+      sets: number of sets of the index
+      ways: slots per set
+      slot_size: bytes per slot, including a 40-byte header
+    """
+
+    def __init__(self, path, sets=1024, ways=4, slot_size=4096):
+        if fcntl is None:  # pragma: no cover
+            raise RuntimeError("SharedResultCache requires fcntl (POSIX)")
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError("slot_size is too small", slot_size)
+        self.path = path
+        self.sets = sets
+        self.ways = ways
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT_HEADER.size
+        self.size = FILE_HEADER_SIZE + sets * ways * slot_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._mm = self._open()
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def _open(self):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < self.size:
+                os.ftruncate(self._fd, self.size)
+            mm = mmap.mmap(self._fd, self.size)
+            magic, sets, ways, slot_size = FILE_HEADER.unpack_from(mm, 0)
+            if magic != MAGIC:
+                FILE_HEADER.pack_into(
+                    mm, 0, MAGIC, self.sets, self.ways, self.slot_size
+                )
+            elif (sets, ways, slot_size) != (
+                self.sets,
+                self.ways,
+                self.slot_size,
+            ):
+                mm.close()
+                raise ValueError(
+                    "cache file has different sets, ways or slot_size",
+                    self.path,
+                    (sets, ways, slot_size),
+                )
+            return mm
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+    def _locate(self, key: bytes):
+        """Returns key digest and offset of its set."""
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        set_index = int.from_bytes(digest[:8], "little") % self.sets
+        return (
+            digest,
+            FILE_HEADER_SIZE + set_index * self.ways * self.slot_size,
+        )
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        """Returns the value or None if it is missing or expired."""
+        digest, set_offset = self._locate(key)
+        mm = self._mm
+        now = time.time()
+        for way in range(self.ways):
+            offset = set_offset + way * self.slot_size
+            for _ in range(READ_ATTEMPTS):
+                seq, slot_digest, expires_at, _, length = (
+                    SLOT_HEADER.unpack_from(mm, offset)
+                )
+                if seq & 1:
+                    continue
+                if slot_digest != digest or length > self.capacity:
+                    break
+                start = offset + SLOT_HEADER.size
+                value = mm[start : start + length]
+                if SEQ.unpack_from(mm, offset)[0] != seq:
+                    continue
+                if expires_at <= now:
+                    break
+                # racy, but only affects which slot gets evicted
+                USED_AT.pack_into(mm, offset + USED_AT_OFFSET, now)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key: bytes, value: bytes, ttl: float) -> bool:
+        """Stores the value for ttl seconds; False if it doesn't fit."""
+        if len(value) > self.capacity:
+            return False
+        digest, set_offset = self._locate(key)
+        mm = self._mm
+        set_size = self.ways * self.slot_size
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, set_size, set_offset)
+            try:
+                now = time.time()
+                offset = None
+                lru_offset, lru_used_at = set_offset, float("inf")
+                for way in range(self.ways):
+                    way_offset = set_offset + way * self.slot_size
+                    _, slot_digest, expires_at, used_at, _ = (
+                        SLOT_HEADER.unpack_from(mm, way_offset)
+                    )
+                    if slot_digest == digest:
+                        offset = way_offset
+                        break
+                    if expires_at <= now:
+                        used_at = float("-inf")
+                    if used_at < lru_used_at:
+                        lru_offset, lru_used_at = way_offset, used_at
+                if offset is None:
+                    offset = lru_offset
+
+                seq = begin_slot_write(mm, offset)
+                start = offset + SLOT_HEADER.size
+                mm[start : start + len(value)] = value
+                SLOT_HEADER.pack_into(
+                    mm, offset, seq, digest, now + ttl, now, len(value)
+                )
+                end_slot_write(mm, offset, seq)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, set_size, set_offset)
+        return True
+
+    def clear(self):
+        """Drops all values."""
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                for index in range(self.sets * self.ways):
+                    offset = FILE_HEADER_SIZE + index * self.slot_size
+                    seq = begin_slot_write(self._mm, offset)
+                    SLOT_HEADER.pack_into(
+                        self._mm, offset, seq, bytes(16), 0.0, 0.0, 0
+                    )
+                    end_slot_write(self._mm, offset, seq)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+
+class IdempotentCall:
+    """Call of an IdempotencyStore: in flight until done is called."""
+
+    __slots__ = ["result", "expires_at", "params_digest", "_event", "_futures"]
+
+    def __init__(self, expires_at, params_digest=b""):
+        self.result: Optional[bytes] = None
+        self.expires_at = expires_at
+        self.params_digest = params_digest
+        self._event = threading.Event()
+        self._futures: "list[asyncio.Future]" = []
+
+    def done(self, result: Optional[bytes]):
+        self.result = result
+        self._event.set()
+        # futures added from now on see the event set
+        futures = tuple(self._futures)
+        self._futures.clear()
+        for future in futures:
+            future.get_loop().call_soon_threadsafe(_set_future_result, future)
+
+    def wait(self, timeout=None) -> Optional[bytes]:
+        self._event.wait(timeout)
+        return self.result
+
+    async def wait_async(self, timeout=None) -> Optional[bytes]:
+        future = asyncio.get_running_loop().create_future()
+        self._futures.append(future)
+        # done may have been called before the future was added
+        if self._event.is_set():
+            _set_future_result(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            try:
+                self._futures.remove(future)
+            except ValueError:
+                pass
+        return self.result
+
+
+def _set_future_result(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class IdempotencyStore:
+    """Bounded store of serialized results of calls with idempotency keys.
+
+    The first call with a key runs, the repeated ones wait for it and get its
+    result. Only successful results are kept (for ttl seconds); on errors the
+    key is released, so a retry runs again. Calls keep the digest of their
+    params, so reuse of a key with other params can be told apart.
+
+    Args:
+      max_size: max number of keys to keep, the oldest ones are evicted
+      ttl: seconds to keep results (and to wait for calls in flight)
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._calls: "OrderedDict[bytes, IdempotentCall]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(
+        self, key: bytes, params_digest=b""
+    ) -> Tuple[bool, IdempotentCall]:
+        """Returns whether the caller is to run the call and the call.
+
+        The call is a running or done one of the key, if any (which may have
+        a different params_digest), otherwise a new one.
+        """
+        now = time.time()
+        with self._lock:
+            calls = self._calls
+            while calls and next(iter(calls.values())).expires_at <= now:
+                calls.popitem(last=False)
+
+            call = calls.get(key)
+            if call is not None and call.expires_at > now:
+                return False, call
+
+            while len(calls) >= self.max_size:
+                calls.popitem(last=False)
+            call = calls[key] = IdempotentCall(now + self.ttl, params_digest)
+            return True, call
+
+    def done(self, key: bytes, call: IdempotentCall, result: Optional[bytes]):
+        """Stores the result of a claimed call (None on errors)."""
+        with self._lock:
+            if self._calls.get(key) is call:
+                if result is None:
+                    del self._calls[key]
+                else:
+                    call.expires_at = time.time() + self.ttl
+                    self._calls.move_to_end(key)
+        call.done(result)
@@ -0,0 +1,376 @@
+"""Defines runtime of generated python clients: pooled HTTP transports."""
+
+import asyncio
+import http.client
+import itertools
+import json
+import ssl
+import threading
+import zlib
+from typing import Any, Generic, MutableMapping, Optional, TypeVar
+from urllib.parse import urlsplit
+
+from pydantic import BaseModel, TypeAdapter
+
+
+T = TypeVar("T")
+REQUEST_HEADERS = {
+    "Content-Type": "application/json;charset=UTF-8",
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+}
+
+
+class RpcError(Exception):
+    """Error response of a call (or HTTP error status of the endpoint)."""
+
+    def __init__(self, error):
+        if not isinstance(error, dict):
+            error = {"code": None, "message": str(error), "data": error}
+        super().__init__(error.get("code"), error.get("message"))
+        self.error = error
+        self.code = error.get("code")
+        self.message = error.get("message")
+
+
+class RpcResponse(BaseModel, Generic[T]):
+    result: Optional[T] = None
+    error: Any = None
+
+
+def decode_body(body, content_encoding) -> bytes:
+    if content_encoding == "gzip":
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if content_encoding == "deflate":
+        return zlib.decompress(body)
+    return body
+
+
+class ClientProcedure:
+    """Procedure of a generated client: name, in & out types.
+
+    Type adapters are built on first use, so importing a client is cheap.
+    """
+
+    __slots__ = [
+        "name",
+        "in_annotation",
+        "out_annotation",
+        "_in_adapter",
+        "_response_model",
+        "_prefix",
+    ]
+
+    def __init__(self, name, in_annotation, out_annotation):
+        self.name = name
+        self.in_annotation = in_annotation
+        self.out_annotation = out_annotation
+        self._in_adapter = None
+        self._response_model = None
+        self._prefix = b'{"jsonrpc": "2.0", "method": %s, "params": ' % (
+            json.dumps(name).encode()
+        )
+
+    def dump_request(self, request_id, params) -> bytes:
+        if self._in_adapter is None:
+            self._in_adapter = TypeAdapter(self.in_annotation)
+        return b'%s%s, "id": %d}' % (
+            self._prefix,
+            self._in_adapter.dump_json(params),
+            request_id,
+        )
+
+    def load_result(self, body):
+        """Validates the result of a response body, raises RpcError."""
+        if self._response_model is None:
+            out_annotation: Any = self.out_annotation
+            self._response_model = RpcResponse[out_annotation]
+        response = self._response_model.model_validate_json(body)
+        if response.error is not None or (
+            "result" not in response.model_fields_set
+        ):
+            raise RpcError(response.error)
+        return response.result
+
+
+class HttpTransport:
+    """Posts requests over a keep-alive pool of http.client connections.
+
+    Idle connections are reused most recently used first; a request which
+    fails on a reused connection (e.g. closed by the server while idle) is
+    retried once on a new one.
+
+    Args:
+      url: http or https url of the endpoint
+      pool_size: max number of idle connections to keep
+      timeout: socket timeout in seconds
+      headers: extra request headers (e.g. Authorization)
+      ssl_context: ssl.SSLContext of https connections
+    """
+
+    def __init__(
+        self, url, pool_size=10, timeout=None, headers=None, ssl_context=None
+    ):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError("unsupported url scheme", url)
+        self.is_https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = (parts.path or "/") + (
+            f"?{parts.query}" if parts.query else ""
+        )
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.headers = dict(REQUEST_HEADERS, **(headers or {}))
+        self.ssl_context = ssl_context
+        self.connections_opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+            self.connections_opened += 1
+        if self.is_https:
+            return (
+                http.client.HTTPSConnection(
+                    self.host,
+                    self.port,
+                    timeout=self.timeout,
+                    context=self.ssl_context,
+                ),
+                False,
+            )
+        return (
+            http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            ),
+            False,
+        )
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def post(self, body: bytes) -> bytes:
+        """Returns the (decompressed) response body."""
+        for attempt in range(2):
+            connection, is_reused = self._acquire()
+            try:
+                connection.request("POST", self.path, body, self.headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (ConnectionError, http.client.BadStatusLine):
+                connection.close()
+                if is_reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            if response.status != 200:
+                raise RpcError(
+                    {"code": response.status, "message": response.reason}
+                )
+            return decode_body(data, response.getheader("Content-Encoding"))
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+async def read_response(reader):
+    """Reads an HTTP/1.x response: status, headers, body, keep-alive."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    version, status, *reason = lines[0].split(" ", 2)
+    headers: MutableMapping[str, str] = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    connection = headers.get("connection", "").lower()
+    keep_alive = (
+        connection == "keep-alive"
+        if version == "HTTP/1.0"
+        else connection != "close"
+    )
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                while await reader.readline() not in (b"\r\n", b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        keep_alive = False
+    return int(status), " ".join(reason), headers, body, keep_alive
+
+
+class AsyncHttpTransport:
+    """Posts requests over a keep-alive pool of asyncio stream connections.
+
+    Same as HttpTransport, but for asyncio; connections are bound to the
+    event loop they were opened in.
+
+    Args:
+      url: http or https url of the endpoint
+      pool_size: max number of idle connections to keep
+      timeout: seconds to wait for a response
+      headers: extra request headers (e.g. Authorization)
+      ssl_context: ssl.SSLContext of https connections
+    """
+
+    def __init__(
+        self, url, pool_size=10, timeout=None, headers=None, ssl_context=None
+    ):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError("unsupported url scheme", url)
+        self.ssl = (
+            (ssl_context or ssl.create_default_context())
+            if parts.scheme == "https"
+            else None
+        )
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.ssl else 80)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        host = parts.netloc.rpartition("@")[2]
+        self.head = "".join(
+            [f"POST {path} HTTP/1.1\r\nHost: {host}\r\n"]
+            + [
+                f"{name}: {value}\r\n"
+                for name, value in dict(
+                    REQUEST_HEADERS, **(headers or {})
+                ).items()
+            ]
+        ).encode("latin-1")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = []
+
+    async def _acquire(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return (reader, writer), True
+            writer.close()
+        self.connections_opened += 1
+        return (
+            await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        ), False
+
+    async def _request(self, reader, writer, body):
+        writer.write(b"%sContent-Length: %d\r\n\r\n" % (self.head, len(body)))
+        writer.write(body)
+        await writer.drain()
+        return await read_response(reader)
+
+    async def post(self, body: bytes) -> bytes:
+        """Returns the (decompressed) response body."""
+        for attempt in range(2):
+            (reader, writer), is_reused = await self._acquire()
+            try:
+                status, reason, headers, data, keep_alive = (
+                    await asyncio.wait_for(
+                        self._request(reader, writer, body), self.timeout
+                    )
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if is_reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+
+            if keep_alive and len(self._idle) < self.pool_size:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            if status != 200:
+                raise RpcError({"code": status, "message": reason})
+            return decode_body(data, headers.get("content-encoding"))
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+
+class RpcClient:
+    """Base class of generated synchronous clients (see PyExporter).
+
+    Args:
+      transport: HttpTransport or an url to create one
+    """
+
+    def __init__(self, transport):
+        if isinstance(transport, str):
+            transport = HttpTransport(transport)
+        self.transport = transport
+        self._ids = itertools.count(1)
+
+    def _call(self, procedure: ClientProcedure, params):
+        body = procedure.dump_request(next(self._ids), params)
+        return procedure.load_result(self.transport.post(body))
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncRpcClient:
+    """Base class of generated asynchronous clients (see PyExporter).
+
+    Args:
+      transport: AsyncHttpTransport or an url to create one
+    """
+
+    def __init__(self, transport):
+        if isinstance(transport, str):
+            transport = AsyncHttpTransport(transport)
+        self.transport = transport
+        self._ids = itertools.count(1)
+
+    async def _call(self, procedure: ClientProcedure, params):
+        body = procedure.dump_request(next(self._ids), params)
+        return procedure.load_result(await self.transport.post(body))
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -1,18 +1,41 @@
 """Defines exporter to Typescript."""
 
 import abc
+import hashlib
+import json
 import os
+import re
 import sys
+import tempfile
+from collections import namedtuple
 from datetime import date, datetime
 from enum import Enum
 from inspect import isclass
-from itertools import cycle
-from typing import MutableMapping, TypeVar, Union  # type: ignore
+from itertools import chain, cycle
+from typing import (  # type: ignore
+    Any,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
 from uuid import UUID
 
 from pydantic import BaseModel
+from typing_extensions import Annotated, Literal
 
 from ._base import AbstractAsyncRpc, AbstractRpc
+from ._types import DayNumberDate, EpochDatetime
+
+
+try:
+    # private API: pydantic puts these refs in place of recursive generic
+    # models, which aren't supported without it
+    from pydantic._internal._forward_ref import PydanticRecursiveRef
+except ImportError:  # pragma: no cover
+    PydanticRecursiveRef = None  # type: ignore
 
 
 _NUMBERS = iter(cycle(range(1000)))
@@ -115,71 +138,572 @@ class CodeLines:
             return cls([], False)
         return cls([f"{dest} = {src}"], False)
 
+    def instantiate(self, src, dest):
+        """Substitutes SRC/DEST placeholders of a memoized template."""
+        if not self.mutate:
+            return CodeLines.naive(src, dest)
+
+        lines = [
+            line.replace(SRC, src).replace(DEST, dest) for line in self.lines
+        ]
+        depth = 0
+        for line in lines:
+            if depth == 0 and line.startswith("let "):
+                # the same template may be instantiated twice in one scope
+                lines.insert(0, "{")
+                lines.append("}")
+                break
+            depth += line.count("{") - line.count("}")
+        return CodeLines(lines, True)
+
+
+SRC = "$src$"
+DEST = "$dest$"
+RESERVED_MODULE_NAMES = {"runtime", "types", "converters", "index"}
+# module of procedures, which define no NAMESPACE
+DEFAULT_NAMESPACE = "procedures"
+RUNTIME_EXPORT_PATTERN = re.compile(
+    r"^export (?:const|let|class|interface|function|enum|type) ([\w$]+)",
+    re.MULTILINE,
+)
+NAME_PATTERN = re.compile(r"\b[A-Za-z_$][\w$]*\b")
+MANIFEST_SUFFIX = ".synclane-manifest.json"
+
+
+def is_file_up_to_date(filename, data, digest, file_manifest) -> bool:
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return False
+    if stat.st_size != len(data):
+        return False
+    if (
+        file_manifest is not None
+        and file_manifest.get("digest") == digest
+        and file_manifest.get("size") == stat.st_size
+        and file_manifest.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        return True
+    with open(filename, "rb") as f:
+        return f.read() == data
+
+
+def atomic_write(filename, data: bytes):
+    """Writes to a temporary file and renames it.
+
+    So readers never see a partially written file.
+    """
+    fd, tmp_filename = tempfile.mkstemp(
+        prefix=f".{os.path.basename(filename)}.",
+        suffix=".tmp",
+        dir=os.path.dirname(filename) or None,
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        try:
+            mode = os.stat(filename).st_mode & 0o777
+        except OSError:
+            mode = 0o644
+        os.chmod(tmp_filename, mode)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+
+
+AnnotatedAlias: Any = type(Annotated[int, 0])
+DiscriminatorTag = namedtuple("DiscriminatorTag", ["discriminator"])
+
+
+def get_field_annotation(field_info):
+    """Returns annotation of a model field, keeping its discriminator."""
+    discriminator = getattr(
+        field_info.discriminator, "discriminator", field_info.discriminator
+    )
+    if discriminator is None:
+        return field_info.annotation
+
+    args = field_info.annotation.__args__
+    not_none_args = tuple(arg for arg in args if arg is not NoneType)
+    annotation = Annotated[
+        Union[not_none_args], DiscriminatorTag(discriminator)  # type: ignore
+    ]
+    if len(not_none_args) < len(args):
+        return Optional[annotation]
+    return annotation
+
+
+CONSTRAINT_NAMES = (
+    "gt",
+    "ge",
+    "lt",
+    "le",
+    "multiple_of",
+    "min_length",
+    "max_length",
+    "pattern",
+)
+
+
+def get_constrained_annotation(field_info):
+    """Returns field annotation along with its constraints (as Annotated)."""
+    annotation = get_field_annotation(field_info)
+    metadata = [
+        item
+        for item in field_info.metadata
+        if any(
+            getattr(item, name, None) is not None for name in CONSTRAINT_NAMES
+        )
+    ]
+    if not metadata:
+        return annotation
+    return Annotated[tuple([annotation] + metadata)]
+
+
+def render_loc(loc):
+    if not loc:
+        return "loc"
+    return "loc.concat([{}])".format(", ".join(loc))
+
+
+def render_error(error_type, src, loc, msg, ctx=None):
+    """Renders pushing of an error shaped like pydantic's ones.
+
+    msg and ctx values are typescript expressions.
+    """
+    error = f"type: {json.dumps(error_type)}, loc: {render_loc(loc)}, "
+    error += f"msg: {msg}, input: {src}"
+    if ctx:
+        error += ", ctx: {%s}" % ", ".join(
+            f"{name}: {value}" for name, value in ctx.items()
+        )
+    return f"errors.push({{{error}}})"
+
+
+def render_expected(values):
+    """Renders expected values the way pydantic does: 'a', 'b' or 'c'."""
+    reprs = [repr(value) for value in values]
+    if len(reprs) == 1:
+        return reprs[0]
+    return "{} or {}".format(", ".join(reprs[:-1]), reprs[-1])
+
+
+def constraints_validate(exporter, type_, metadata, src, loc) -> CodeLines:
+    """Renders checks of numeric bounds, string and list constraints."""
+    constraints = {}
+    for item in chain.from_iterable(
+        getattr(item, "metadata", [item]) for item in metadata
+    ):
+        for name in CONSTRAINT_NAMES:
+            value = getattr(item, name, None)
+            if value is not None:
+                constraints[name] = value
+
+    code_lines = CodeLines([], False)
+    origin = getattr(type_, "__origin__", type_)
+    if not isclass(origin):
+        return code_lines
+
+    if issubclass(origin, (int, float)) and not issubclass(origin, bool):
+        for name, operator, error_type, text in (
+            ("gt", "<=", "greater_than", "greater than"),
+            ("ge", "<", "greater_than_equal", "greater than or equal to"),
+            ("lt", ">=", "less_than", "less than"),
+            ("le", ">", "less_than_equal", "less than or equal to"),
+        ):
+            value = constraints.get(name)
+            if not isinstance(value, (int, float)):
+                continue
+            code_lines.lines.append(f"if ({src} {operator} {value}) {{")
+            code_lines.lines.append(
+                render_error(
+                    error_type,
+                    src,
+                    loc,
+                    json.dumps(f"Input should be {text} {value}"),
+                    {name: json.dumps(value)},
+                )
+            )
+            code_lines.lines.append("}")
+        value = constraints.get("multiple_of")
+        if isinstance(value, (int, float)):
+            # floats are multiples within a tolerance, like in pydantic
+            code_lines.lines.append(
+                f"if ({src} % {value} !== 0) {{"
+                if issubclass(origin, int) and isinstance(value, int)
+                else f"if (!isMultipleOf({src}, {value})) {{"
+            )
+            code_lines.lines.append(
+                render_error(
+                    "multiple_of",
+                    src,
+                    loc,
+                    json.dumps(f"Input should be a multiple of {value}"),
+                    {"multiple_of": json.dumps(value)},
+                )
+            )
+            code_lines.lines.append("}")
+
+    elif issubclass(origin, str):
+        length = f"strLength({src})"
+        for name, operator, error_type, text in (
+            ("min_length", "<", "string_too_short", "at least"),
+            ("max_length", ">", "string_too_long", "at most"),
+        ):
+            value = constraints.get(name)
+            if not value and name == "min_length" or value is None:
+                continue
+            code_lines.lines.append(f"if ({length} {operator} {value}) {{")
+            code_lines.lines.append(
+                render_error(
+                    error_type,
+                    src,
+                    loc,
+                    json.dumps(
+                        "String should have {} {} character{}".format(
+                            text, value, "" if value == 1 else "s"
+                        )
+                    ),
+                    {name: json.dumps(value)},
+                )
+            )
+            code_lines.lines.append("}")
+        pattern = constraints.get("pattern")
+        if pattern is not None:
+            pattern = getattr(pattern, "pattern", pattern)
+            # None if the pattern can't be translated, the server checks it
+            pattern_name = exporter.name_pattern(pattern)
+            if pattern_name is not None:
+                code_lines.lines.append(f"if (!{pattern_name}.test({src})) {{")
+                code_lines.lines.append(
+                    render_error(
+                        "string_pattern_mismatch",
+                        src,
+                        loc,
+                        json.dumps(f"String should match pattern '{pattern}'"),
+                        {"pattern": json.dumps(pattern)},
+                    )
+                )
+                code_lines.lines.append("}")
+
+    elif issubclass(origin, (list, tuple, set, frozenset)):
+        field_type = origin.__name__.capitalize()
+        for name, operator, error_type, text in (
+            ("min_length", "<", "too_short", "at least"),
+            ("max_length", ">", "too_long", "at most"),
+        ):
+            value = constraints.get(name)
+            if not value and name == "min_length" or value is None:
+                continue
+            code_lines.lines.append(f"if ({src}.length {operator} {value}) {{")
+            code_lines.lines.append(
+                render_error(
+                    error_type,
+                    src,
+                    loc,
+                    "{} + {}.length".format(
+                        json.dumps(
+                            "{} should have {} {} item{} after validation, "
+                            "not ".format(
+                                field_type,
+                                text,
+                                value,
+                                "" if value == 1 else "s",
+                            )
+                        ),
+                        src,
+                    ),
+                    {
+                        "field_type": json.dumps(field_type),
+                        name: json.dumps(value),
+                        "actual_length": f"{src}.length",
+                    },
+                )
+            )
+            code_lines.lines.append("}")
+
+    code_lines.mutate = bool(code_lines.lines)
+    return code_lines
+
+
+def guarded(condition, code_lines) -> CodeLines:
+    """Wraps checks with "if", unless there are none."""
+    if not code_lines.mutate:
+        return code_lines
+    return CodeLines([f"if ({condition}) {{", *code_lines.lines, "}"], True)
+
+
+def choice_validate(error_type, values, src, loc) -> CodeLines:
+    """Renders a check that the value is one of values."""
+    expected = render_expected(values)
+    return CodeLines(
+        [
+            "if ({}) {{".format(
+                " && ".join(
+                    f"{src} !== {json.dumps(value)}" for value in values
+                )
+            ),
+            render_error(
+                error_type,
+                src,
+                loc,
+                json.dumps(f"Input should be {expected}"),
+                {"expected": json.dumps(expected)},
+            ),
+            "}",
+        ],
+        True,
+    )
+
+
+JS_FLAGS = {"i": "i", "m": "m", "s": "s", "u": ""}
+# python only groups: comments, conditionals, atomic and scoped flags ones
+JS_GROUP_PATTERN = re.compile(r"\(\?(?:[:=!]|<[=!]|<\w+>)")
+NAMED_GROUP_REF_PATTERN = re.compile(r"\(\?P=(\w+)\)")
+GLOBAL_FLAGS_PATTERN = re.compile(r"\(\?([a-zA-Z]+)\)")
+# "]" right after "[" or "[^" is a literal one in python
+LEADING_BRACKET_PATTERN = re.compile(r"\[\^?\]")
+
+
+def to_js_regexp(pattern: str) -> Optional[Tuple[str, str]]:
+    r"""Translates a python regexp to javascript source and flags.
+
+    Named groups & their references, leading global flags (i, m, s) and
+    \A, \Z anchors are translated; None is returned if the pattern has
+    other python only syntax (e.g. verbose, scoped flags, comments,
+    conditional, atomic groups or possessive quantifiers).
+    """
+    flags = ""
+    match = GLOBAL_FLAGS_PATTERN.match(pattern)
+    if match:
+        for flag in match.group(1):
+            if flag not in JS_FLAGS:
+                return None
+            if JS_FLAGS[flag] not in flags:
+                flags += JS_FLAGS[flag]
+        pattern = pattern[match.end() :]
+
+    parts = []
+    index = 0
+    in_class = False
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\":
+            escape = pattern[index : index + 2]
+            if escape == "\\A" and not in_class:
+                escape = "(?<![\\s\\S])"
+            elif escape in ("\\Z", "\\z") and not in_class:
+                escape = "(?![\\s\\S])"
+            parts.append(escape)
+            index += 2
+            continue
+
+        if in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+            match = LEADING_BRACKET_PATTERN.match(pattern, index)
+            if match:
+                parts.append(match.group(0)[:-1] + "\\]")
+                index = match.end()
+                continue
+        elif pattern.startswith("(?", index):
+            if pattern.startswith("(?P<", index):
+                parts.append("(?<")
+                index += 4
+                continue
+            match = NAMED_GROUP_REF_PATTERN.match(pattern, index)
+            if match:
+                parts.append(f"\\k<{match.group(1)}>")
+                index = match.end()
+                continue
+            if not JS_GROUP_PATTERN.match(pattern, index):
+                return None
+        elif char in "*+?}" and pattern.startswith("+", index + 1):
+            return None
+        parts.append(char)
+        index += 1
+    return "".join(parts), flags
+
+
+def dispatch_keys_of(type_):
+    """Returns keys to find handlers of a type by, most specific first.
+
+    - ("origin", X): parametrized generics of X, e.g. List[int] of list
+    - ("class", X): X and its subclasses
+    - ("instance", X): instances of X, e.g. TypeVar("T") of TypeVar
+    """
+    keys = []
+    origin = getattr(type_, "__origin__", None)
+    if origin is not None:
+        keys.append(("origin", origin))
+    if isclass(type_):
+        keys.extend(("class", cls) for cls in type_.__mro__)
+    keys.extend(("instance", cls) for cls in type(type_).__mro__)
+    return keys
+
 
 class BaseTsExporter:
     """Exporter to Typescript."""
 
     handlers: "list[TypeHandler]" = []
 
-    def __init__(self, rpc: Union[AbstractAsyncRpc, AbstractRpc]):
+    def __init__(
+        self,
+        rpc: Union[AbstractAsyncRpc, AbstractRpc],
+        validate_params: bool = False,
+    ):
         self.rpc = rpc
+        self.validate_params = validate_params
         self.name_to_interface_def: MutableMapping[str, str] = {}
         self.name_to_enum_def: MutableMapping[str, str] = {}
+        self.type_to_interface_cache: MutableMapping[Any, str] = {}
+        self.type_to_ts_to_primitive: MutableMapping[
+            Tuple[Any, bool], CodeLines
+        ] = {}
+        self.type_to_primitive_to_ts: MutableMapping[
+            Tuple[Any, bool], CodeLines
+        ] = {}
+        self.converter_names: MutableMapping[
+            Tuple[Any, str], Optional[str]
+        ] = {}
+        self.converters_in_progress: MutableMapping[Tuple[Any, str], str] = {}
+        self.assume_no_recursive_conversion = True
+        self.has_recursive_refs = False
+        self.converter_defs: MutableMapping[str, str] = {}
+        self.pattern_names: MutableMapping[str, Optional[str]] = {}
+        self.changed_filenames: "list[str]" = []
+        self.type_to_handlers: MutableMapping[Any, Sequence[TypeHandler]] = {}
+        self.key_to_handlers: MutableMapping[
+            Tuple[str, Any], "list[Tuple[int, TypeHandler]]"
+        ] = {}
+        self.unkeyed_handlers: "list[Tuple[int, TypeHandler]]" = []
+        for index, handler in enumerate(self.handlers):
+            if handler.dispatch_keys is None:
+                self.unkeyed_handlers.append((index, handler))
+                continue
+            for key in handler.dispatch_keys:
+                self.key_to_handlers.setdefault(key, []).append(
+                    (index, handler)
+                )
 
-    def to_code_pieces(self):
+    @classmethod
+    def register_handler(cls, handler, keys=None, priority=0):
+        """Adds a type handler; see TypeHandler for keys and priority."""
+        if keys is not None:
+            handler.dispatch_keys = keys
+        handler.priority = priority
+        if "handlers" not in cls.__dict__:
+            # don't alter handlers of parent classes
+            cls.handlers = list(cls.handlers)
+        cls.handlers.append(handler)
+        return handler
+
+    def get_handlers(self, type_) -> "Sequence[TypeHandler]":
+        """Returns handlers relevant to the type, including unkeyed ones.
+
+        They are ordered by priority, then by position in handlers, so the
+        handlers list keeps its precedence, whether handlers have keys or not.
+        """
+        try:
+            return self.type_to_handlers[type_]
+        except (KeyError, TypeError):
+            pass
+
+        candidates = [
+            (-handler.priority, index, handler)
+            for index, handler in self.unkeyed_handlers
+        ]
+        for key in dispatch_keys_of(type_):
+            try:
+                handlers = self.key_to_handlers.get(key, ())
+            except TypeError:
+                continue
+            for index, handler in handlers:
+                candidates.append((-handler.priority, index, handler))
+        candidates.sort(key=lambda candidate: candidate[:2])
+
+        result: "list[TypeHandler]" = []
+        for *_, handler in candidates:
+            if handler not in result:
+                result.append(handler)
+        try:
+            self.type_to_handlers[type_] = result
+        except TypeError:
+            pass
+        return result
+
+    def read_runtime(self):
         with open(
             os.path.join(os.path.dirname(__file__), "ts/base.ts"),
             encoding="utf-8",
         ) as f:
-            yield f.read()
+            return f.read()
 
-        function_defs = []
-        prepare_params_defs = {}
-        prepare_result_defs = {}
-        for ts_name, procedure in self.rpc.procedures.items():
-            in_type_def = self.root_type_to_interface(procedure.in_type)
-            out_type_def = self.root_type_to_interface(procedure.out_type)
+    def procedure_defs(self, ts_name, procedure):
+        """Returns params & result converters and call function of a procedure."""
+        in_type_def = self.root_type_to_interface(procedure.in_type)
+        out_type_def = self.root_type_to_interface(procedure.out_type)
 
-            prepare_params_defs[ts_name] = (
-                """const _%(ts_name)sParamsToPrimitive = (params: %(in_type_def)s): any => {
+        prepare_params_def = """const _%(ts_name)sParamsToPrimitive = (params: %(in_type_def)s): any => {
 let preparedParams: any;
 %(ts_to_primitive_code)s
 return preparedParams;
-}"""
-                % {
-                    "ts_name": ts_name,
-                    "in_type_def": in_type_def,
-                    "ts_to_primitive_code": self.root_ts_to_primitive(
-                        procedure.in_type, "params", "preparedParams"
-                    ).get_joined()
-                    or "preparedParams = params",
-                }
-            )
-            prepare_result_defs[ts_name] = (
-                """const _%(ts_name)sPrimitiveToResult = (data: any): %(out_type_def)s => {
+}""" % {
+            "ts_name": ts_name,
+            "in_type_def": in_type_def,
+            "ts_to_primitive_code": self.root_ts_to_primitive(
+                procedure.in_type, "params", "preparedParams"
+            ).get_joined()
+            or "preparedParams = params",
+        }
+        prepare_result_def = """const _%(ts_name)sPrimitiveToResult = (data: any): %(out_type_def)s => {
 %(primitive_to_ts_code)s
 return data;
-}"""
-                % {
-                    "ts_name": ts_name,
-                    "out_type_def": out_type_def,
-                    "primitive_to_ts_code": self.root_primitive_to_ts(
-                        procedure.out_type, "data", "data"
-                    ).get_joined()
-                    or "",
-                }
+}""" % {
+            "ts_name": ts_name,
+            "out_type_def": out_type_def,
+            "primitive_to_ts_code": self.root_primitive_to_ts(
+                procedure.out_type, "data", "data"
+            ).get_joined()
+            or "",
+        }
+        validator = None
+        if self.validate_params:
+            validate_code_lines = self.root_validate(
+                procedure.in_type, "params"
             )
-
-            function_defs.append(
-                """export const call%(ts_name)s = (params: %(in_type_def)s): AbortableRequest<%(out_type_def)s> => {
-    return abortableFetch<%(in_type_def)s, %(out_type_def)s>("%(ts_name)s", params, _%(ts_name)sParamsToPrimitive, _%(ts_name)sPrimitiveToResult);
-}"""
-                % {
+            if validate_code_lines.mutate:
+                validator = f"_{ts_name}ValidateParams"
+                prepare_params_def += """
+const %(validator)s = (params: %(in_type_def)s): Array<ValidationErrorDetail> => {
+const errors: Array<ValidationErrorDetail> = [];
+const loc: Array<string | number> = [];
+%(validate_code)s
+return errors;
+}""" % {
+                    "validator": validator,
                     "in_type_def": in_type_def,
-                    "out_type_def": out_type_def,
-                    "ts_name": ts_name,
+                    "validate_code": validate_code_lines.get_joined(),
                 }
-            )
+        function_def = """export const call%(ts_name)s = (params: %(in_type_def)s, callOptions?: CallOptions): AbortableRequest<%(out_type_def)s> => {
+    return abortableFetch<%(in_type_def)s, %(out_type_def)s>("%(ts_name)s", params, _%(ts_name)sParamsToPrimitive, _%(ts_name)sPrimitiveToResult, %(options)s, callOptions);
+}""" % {
+            "in_type_def": in_type_def,
+            "out_type_def": out_type_def,
+            "ts_name": ts_name,
+            "options": self.procedure_options(procedure, validator),
+        }
+        return prepare_params_def, prepare_result_def, function_def
+
+    def to_code_pieces(self):
+        yield self.read_runtime()
+
+        procedure_defs = [
+            self.procedure_defs(ts_name, procedure)
+            for ts_name, procedure in self.rpc.procedures.items()
+        ]
 
         for name, enum_def in self.name_to_enum_def.items():
             yield "\n"
@@ -189,27 +713,217 @@ return data;
             yield "\n"
             yield f"export interface {name} {interface_def}\n"
 
-        for code in prepare_params_defs.values():
+        for code in self.converter_defs.values():
             yield "\n"
             yield code
 
-        for code in prepare_result_defs.values():
-            yield "\n"
-            yield code
+        for defs_index in range(3):
+            for defs in procedure_defs:
+                yield "\n"
+                yield defs[defs_index]
+
+    def procedure_options(self, procedure, validator=None):
+        """Renders ProcedureOptions argument of abortableFetch."""
+        options = []
+        if procedure.QUERY:
+            options.append("query: true")
+        if validator is not None:
+            options.append(f"validate: {validator}")
+        if procedure.CLIENT_CACHE_TTL or procedure.CLIENT_CACHE_SWR:
+            options.append(
+                "cacheTtl: %d" % round(procedure.CLIENT_CACHE_TTL * 1000)
+            )
+            if procedure.CLIENT_CACHE_SWR:
+                options.append(
+                    "cacheStaleWhileRevalidate: %d"
+                    % round(procedure.CLIENT_CACHE_SWR * 1000)
+                )
+        if procedure.PRIORITY:
+            options.append(f"priority: {procedure.PRIORITY}")
+        if options:
+            return "{%s}" % ", ".join(options)
+        return "undefined"
+
+    def write(self, filename, manifest=True):
+        """Writes the client to a file, unless it is up to date.
+
+        The manifest is a hidden ".<name>.synclane-manifest.json" file next
+        to it (see write_files), without it the file is compared by content.
+        """
+        dir_name, name = os.path.split(filename)
+        self.write_files(
+            dir_name,
+            {name: "".join(self.to_code_pieces())},
+            f".{name}{MANIFEST_SUFFIX}" if manifest else None,
+        )
+        return filename
 
-        for code in function_defs:
-            yield "\n"
-            yield code
+    def write_files(self, dir_name, name_to_code, manifest_name):
+        """Writes files atomically, only those whose content changed.
 
-    def write(self, filename):
-        dir_name = os.path.dirname(filename)
+        The manifest next to them (unless manifest_name is None) keeps
+        digests, sizes and mtimes of written files, so unchanged ones are
+        detected without reading them; files edited by hand are compared by
+        content. Files of the previous export, which are no longer produced,
+        are removed.
+
+        Returns names of changed files.
+        """
         if dir_name:
-            os.makedirs(dir_name, exist_ok=True)  # pragma: no cover
+            os.makedirs(dir_name, exist_ok=True)
+        manifest_filename = None
+        manifest = {}
+        if manifest_name is not None:
+            manifest_filename = os.path.join(dir_name, manifest_name)
+            try:
+                with open(manifest_filename, encoding="utf-8") as f:
+                    manifest = json.load(f)["files"]
+            except (OSError, ValueError, KeyError, TypeError):
+                manifest = {}
+
+        new_manifest = {}
+        changed_names = []
+        for name, code in name_to_code.items():
+            filename = os.path.join(dir_name, name)
+            data = code.encode("utf-8")
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            if not is_file_up_to_date(
+                filename, data, digest, manifest.get(name)
+            ):
+                atomic_write(filename, data)
+                changed_names.append(name)
+            stat = os.stat(filename)
+            new_manifest[name] = {
+                "digest": digest,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+
+        for name in manifest:
+            if name not in name_to_code:
+                try:
+                    os.remove(os.path.join(dir_name, name))
+                except OSError:
+                    pass
+                changed_names.append(name)
+
+        if manifest_filename is not None and new_manifest != manifest:
+            atomic_write(
+                manifest_filename,
+                json.dumps({"files": new_manifest}, indent=2).encode("utf-8"),
+            )
+        self.changed_filenames.extend(
+            os.path.join(dir_name, name) for name in changed_names
+        )
+        return changed_names
+
+    def procedure_namespace(self, ts_name, procedure):
+        """Returns NAMESPACE of a procedure or DEFAULT_NAMESPACE."""
+        namespace = procedure.NAMESPACE
+        if namespace is None:
+            return DEFAULT_NAMESPACE
+        namespace = namespace.lower()
+        if not re.fullmatch(r"[a-z_][a-z0-9_]*", namespace) or (
+            namespace in RESERVED_MODULE_NAMES
+        ):
+            raise ValueError("invalid namespace", namespace, procedure)
+        return namespace
+
+    def to_module_codes(self) -> "dict[str, str]":
+        """Splits the client into modules (module name to its code).
+
+        runtime (base.ts), types (enums & interfaces) and converters (shared
+        model converters) are imported by one module per namespace of
+        procedures, so bundlers can drop unused procedures.
+        """
+        namespace_to_defs: MutableMapping[str, list] = {}
+        for ts_name, procedure in self.rpc.procedures.items():
+            namespace_to_defs.setdefault(
+                self.procedure_namespace(ts_name, procedure), []
+            ).append(self.procedure_defs(ts_name, procedure))
+
+        runtime_code = self.read_runtime()
+        exports = {
+            "runtime": set(RUNTIME_EXPORT_PATTERN.findall(runtime_code)),
+            "types": {
+                name.split("<", 1)[0]
+                for name in chain(
+                    self.name_to_enum_def, self.name_to_interface_def
+                )
+            },
+            "converters": set(self.converter_defs),
+        }
 
-        with open(filename, "w", encoding="utf-8") as f:
-            for piece in self.to_code_pieces():
-                f.write(piece)
-        return filename
+        types_code = "\n".join(
+            [
+                f"export enum {name} {enum_def}"
+                for name, enum_def in self.name_to_enum_def.items()
+            ]
+            + [
+                f"export interface {name} {interface_def}"
+                for name, interface_def in self.name_to_interface_def.items()
+            ]
+        )
+        module_codes = {
+            "runtime": runtime_code,
+            "types": types_code + "\n",
+            "converters": self.with_imports(
+                "\n".join(
+                    f"export {code}" for code in self.converter_defs.values()
+                ),
+                exports,
+                "converters",
+            ),
+        }
+        for namespace, procedure_defs in namespace_to_defs.items():
+            module_codes[namespace] = self.with_imports(
+                "\n".join(
+                    defs[defs_index]
+                    for defs_index in range(3)
+                    for defs in procedure_defs
+                ),
+                exports,
+            )
+        module_codes["index"] = "".join(
+            f'export * from "./{module_name}";\n'
+            for module_name in ["runtime", "types", *namespace_to_defs]
+        )
+        return module_codes
+
+    def with_imports(self, code, exports, own_module_name=None):
+        """Prepends imports of names, which the code references."""
+        names = set(NAME_PATTERN.findall(code))
+        imports = []
+        for module_name, module_exports in exports.items():
+            if module_name == own_module_name:
+                continue
+            used_names = sorted(names & module_exports)
+            if used_names:
+                imports.append(
+                    'import %s{%s} from "./%s";'
+                    % (
+                        "type " if module_name == "types" else "",
+                        ", ".join(used_names),
+                        module_name,
+                    )
+                )
+        return "\n".join(imports + [code]) + "\n"
+
+    def write_dir(self, dirname, manifest=True):
+        """Writes the client as a directory of modules (see to_module_codes).
+
+        Only modules whose content changed are rewritten. Without the
+        manifest (".synclane-manifest.json") modules of removed namespaces
+        are not deleted.
+        """
+        name_to_code = {
+            f"{module_name}.ts": code
+            for module_name, code in self.to_module_codes().items()
+        }
+        self.write_files(
+            dirname, name_to_code, MANIFEST_SUFFIX if manifest else None
+        )
+        return [os.path.join(dirname, name) for name in name_to_code]
 
     def name_interface(self, name, interface_def):
         self.name_to_interface_def[name] = interface_def
@@ -219,36 +933,247 @@ return data;
         self.name_to_enum_def[name] = enum_def
         return name
 
+    def define_interface(self, type_, name, get_interface_def):
+        """Names interface, which may reference itself (recursive models)."""
+        self.type_to_interface_cache[type_] = name
+        try:
+            return self.name_interface(name, get_interface_def())
+        except Exception:
+            del self.type_to_interface_cache[type_]
+            raise
+
     def root_type_to_interface(self, type_):
+        try:
+            return self.type_to_interface_cache[type_]
+        except (KeyError, TypeError):
+            pass
+
         result = None
-        for handler in self.handlers:
+        for handler in self.get_handlers(type_):
             result = handler.type_to_interface(self, type_)
             if result is not None:
+                try:
+                    self.type_to_interface_cache[type_] = result
+                except TypeError:  # pragma: no cover
+                    pass
                 return result
 
         raise TypeError("unsupported type", type_)
 
-    def root_ts_to_primitive(self, type_, src, dest) -> CodeLines:
-        result = None
-        for handler in self.handlers:
-            result = handler.ts_to_primitive(self, type_, src, dest)
-            if result is not None:
-                return result
+    def _convert(self, cache, method_name, type_, src, dest):
+        """Instantiates memoized code template with SRC/DEST placeholders.
+
+        In-place (src is dest) conversions have separate templates, so no
+        excessive assignments are generated.
+        """
+        in_place = src == dest
+        try:
+            return cache[(type_, in_place)].instantiate(src, dest)
+        except KeyError:
+            is_hashable = True
+        except TypeError:
+            is_hashable = False
+
+        for handler in self.get_handlers(type_):
+            if is_hashable:
+                result = getattr(handler, method_name)(
+                    self, type_, SRC, SRC if in_place else DEST
+                )
+                if result is not None:
+                    cache[(type_, in_place)] = result
+                    return result.instantiate(src, dest)
+            else:
+                result = getattr(handler, method_name)(self, type_, src, dest)
+                if result is not None:
+                    return result
 
         raise TypeError("unsupported type", type_)
 
+    def name_converter(self, type_, method_name):
+        name = re.sub(r"\W+", "_", self.root_type_to_interface(type_)).strip(
+            "_"
+        )
+        if method_name == "ts_to_primitive":
+            name = f"_{name}ToPrimitive"
+        elif method_name == "validate":
+            name = f"_Validate{name}"
+        else:
+            name = f"_PrimitiveTo{name}"
+
+        unique_name = name
+        index = 1
+        while (
+            unique_name in self.converter_defs
+            or unique_name in self.converters_in_progress.values()
+        ):
+            index += 1
+            unique_name = f"{name}{index}"
+        return unique_name
+
+    def define_converter(self, type_, method_name, get_code_lines):
+        """Defines a named converter function, so it is generated only once.
+
+        Returns its name or None if the type needs no conversion.
+
+        Recursive models are first walked assuming that references to
+        converters being defined need no conversion; if the assumption turns
+        out to be wrong, everything cached during the walk is dropped and the
+        references are resolved by name.
+        """
+        key = (type_, method_name)
+        try:
+            return self.converter_names[key]
+        except KeyError:
+            pass
+        if key in self.converters_in_progress:
+            self.has_recursive_refs = True
+            if self.assume_no_recursive_conversion:
+                return None
+            return self.converters_in_progress[key]
+
+        if self.converters_in_progress:
+            return self._define_converter(type_, method_name, get_code_lines)
+
+        caches: Tuple[MutableMapping[Any, Any], ...] = (
+            self.converter_names,
+            self.converter_defs,
+            self.type_to_ts_to_primitive,
+            self.type_to_primitive_to_ts,
+            self.pattern_names,
+        )
+        sizes = [len(cache) for cache in caches]
+        self.has_recursive_refs = False
+        self.assume_no_recursive_conversion = True
+        try:
+            name = self._define_converter(type_, method_name, get_code_lines)
+            if name is None or not self.has_recursive_refs:
+                return name
+
+            for cache, size in zip(caches, sizes):
+                while len(cache) > size:
+                    cache.popitem()
+            self.assume_no_recursive_conversion = False
+            return self._define_converter(type_, method_name, get_code_lines)
+        finally:
+            self.assume_no_recursive_conversion = True
+
+    def _define_converter(self, type_, method_name, get_code_lines):
+        key = (type_, method_name)
+        name = self.name_converter(type_, method_name)
+        self.converters_in_progress[key] = name
+        try:
+            code_lines = get_code_lines()
+        finally:
+            del self.converters_in_progress[key]
+
+        if not code_lines.mutate:
+            self.converter_names[key] = None
+            return None
+
+        interface = self.root_type_to_interface(type_)
+        if method_name == "ts_to_primitive":
+            code = """const %(name)s = (src: %(interface)s): any => {
+let dest: any;
+%(code)s
+return dest;
+}"""
+        elif method_name == "validate":
+            code = """const %(name)s = (src: %(interface)s, loc: Array<string | number>, errors: Array<ValidationErrorDetail>): void => {
+%(code)s
+}"""
+        else:
+            code = """const %(name)s = (data: any): %(interface)s => {
+%(code)s
+return data;
+}"""
+        self.converter_defs[name] = code % {
+            "name": name,
+            "interface": interface,
+            "code": "\n".join(code_lines.lines),
+        }
+        self.converter_names[key] = name
+        return name
+
+    def resolve_recursive_ref(self, ref):
+        """Finds the generic model a PydanticRecursiveRef points to.
+
+        Refs look like "module.Model:id(Model)[arg:id(arg), ...]"; only
+        models, whose converters are being defined, may be referenced.
+        """
+        for type_, _ in self.converters_in_progress:
+            metadata = type_.__pydantic_generic_metadata__
+            origin = metadata["origin"]
+            if origin is None:
+                continue
+            prefix, _, args = ref.type_ref.partition("[")
+            if prefix != "{}.{}:{}".format(
+                origin.__module__, origin.__qualname__, id(origin)
+            ):
+                continue
+            if all(f":{id(arg)}" in args for arg in metadata["args"]):
+                return type_
+        raise TypeError("unresolved recursive reference", ref)
+
+    def root_ts_to_primitive(self, type_, src, dest) -> CodeLines:
+        return self._convert(
+            self.type_to_ts_to_primitive, "ts_to_primitive", type_, src, dest
+        )
+
     def root_primitive_to_ts(self, type_, src, dest) -> CodeLines:
-        result = None
-        for handler in self.handlers:
-            result = handler.primitive_to_ts(self, type_, src, dest)
+        return self._convert(
+            self.type_to_primitive_to_ts, "primitive_to_ts", type_, src, dest
+        )
+
+    def root_validate(self, type_, src, loc=()) -> CodeLines:
+        """Renders checks of constraints, which push errors to "errors".
+
+        loc holds expressions of the location within "loc"; types without
+        constraints render no checks (mutate is False).
+        """
+        for handler in self.get_handlers(type_):
+            result = handler.validate(self, type_, src, loc)
             if result is not None:
                 return result
-
-        raise TypeError("unsupported type", type_)
+        return CodeLines([], False)
+
+    def name_pattern(self, pattern) -> Optional[str]:
+        """Defines a regexp constant, returns its name.
+
+        Returns None if the pattern can't be translated to javascript (see
+        to_js_regexp).
+        """
+        try:
+            return self.pattern_names[pattern]
+        except KeyError:
+            pass
+        js_regexp = to_js_regexp(pattern)
+        if js_regexp is None:
+            self.pattern_names[pattern] = None
+            return None
+        name = f"_Pattern{len(self.pattern_names) + 1}"
+        source, flags = js_regexp
+        self.converter_defs[name] = "const {} = new RegExp({});".format(
+            name,
+            ", ".join(
+                json.dumps(arg)
+                for arg in ((source, flags) if flags else (source,))
+            ),
+        )
+        self.pattern_names[pattern] = name
+        return name
 
 
 class TypeHandler(metaclass=abc.ABCMeta):
-    """Base type handler to export python types to typescript ones."""
+    """Base type handler to export python types to typescript ones.
+
+    dispatch_keys tell which types the handler supports, so only relevant
+    handlers are tried (see dispatch_keys_of); handlers without them are
+    relevant to every type. Relevant handlers are tried in order of priority
+    (higher first), then of their position in TsExporter.handlers.
+    """
+
+    dispatch_keys: Optional[Sequence[Tuple[str, Any]]] = None
+    priority: int = 0
 
     @abc.abstractmethod
     def type_to_interface(self, exporter, type_):
@@ -262,10 +1187,22 @@ class TypeHandler(metaclass=abc.ABCMeta):
     def primitive_to_ts(self, exporter, type_, src, dest):
         pass
 
+    def validate(self, exporter, type_, src, loc):
+        """Renders checks of constraints (see BaseTsExporter.root_validate).
+
+        Returns None for types, which have no constraints.
+        """
+        return None
+
 
 class SimpleTypeHandler(TypeHandler):
     """Exports simple python types to typescript ones."""
 
+    dispatch_keys = [
+        ("class", type_)
+        for type_ in (str, UUID, bool, int, float, dict, tuple, list, NoneType)
+    ]
+
     simple_types = {
         str: "string",
         UUID: "string",
@@ -292,7 +1229,13 @@ class SimpleTypeHandler(TypeHandler):
 
 
 class DateHandler(TypeHandler):
-    """Exports python dates to typescript ones."""
+    """Exports python dates to typescript ones.
+
+    EpochDatetime and DayNumberDate travel as numbers, which saves the browser
+    from parsing ISO strings.
+    """
+
+    dispatch_keys = [("class", date)]
 
     def type_to_interface(self, exporter, type_):
         if not isclass(type_):
@@ -303,8 +1246,12 @@ class DateHandler(TypeHandler):
     def ts_to_primitive(self, exporter, type_, src, dest):
         if not isclass(type_):
             return
+        if issubclass(type_, EpochDatetime):
+            return CodeLines([f"{dest} = {src}.getTime()"], True)
         if issubclass(type_, datetime):
             return CodeLines([f"{dest} = {src}.toISOString()"], True)
+        if issubclass(type_, DayNumberDate):
+            return CodeLines([f"{dest} = dateToDayNumber({src})"], True)
         if issubclass(type_, date):
             return CodeLines([f"{dest} = dateToStr({src})"], True)
 
@@ -313,6 +1260,8 @@ class DateHandler(TypeHandler):
             return
         if issubclass(type_, datetime):
             return CodeLines([f"{dest} = new Date({src})"], True)
+        if issubclass(type_, DayNumberDate):
+            return CodeLines([f"{dest} = dayNumberToDate({src})"], True)
         if issubclass(type_, date):
             return CodeLines([f"{dest} = strToDate({src})"], True)
 
@@ -320,6 +1269,12 @@ class DateHandler(TypeHandler):
 class PydanticModelHandler(TypeHandler):
     """Exports pydantic models to typescript interfaces."""
 
+    dispatch_keys = [("class", BaseModel)] + (
+        [("instance", PydanticRecursiveRef)]
+        if PydanticRecursiveRef is not None
+        else []
+    )
+
     def _is_supported(self, type_):
         return isclass(type_) and issubclass(type_, BaseModel)
 
@@ -355,17 +1310,32 @@ class PydanticModelHandler(TypeHandler):
                     ]
                 ),
             )
-            return exporter.name_interface(
+            return exporter.define_interface(
+                type_,
                 name,
-                self._model_to_def(exporter, type_),
+                lambda: self._model_to_def(exporter, type_),
             )
         else:
-            return exporter.name_interface(
+            return exporter.define_interface(
+                type_,
                 type_.__name__,
-                self._model_to_def(exporter, type_),
+                lambda: self._model_to_def(exporter, type_),
             )
 
+    def _resolve(self, exporter, type_):
+        if PydanticRecursiveRef is not None and isinstance(
+            type_, PydanticRecursiveRef
+        ):
+            return exporter.resolve_recursive_ref(type_)
+        return type_
+
+    def _call_converter(self, name, src, dest):
+        if name is None:
+            return CodeLines.naive(src, dest)
+        return CodeLines([f"{dest} = {name}({src})"], True)
+
     def ts_to_primitive(self, exporter, type_, src, dest):
+        type_ = self._resolve(exporter, type_)
         if not self._is_supported(type_):
             return
 
@@ -374,6 +1344,17 @@ class PydanticModelHandler(TypeHandler):
                 type_.model_fields["root"].annotation, src, dest
             )
 
+        return self._call_converter(
+            exporter.define_converter(
+                type_,
+                "ts_to_primitive",
+                lambda: self._fields_to_primitive(exporter, type_),
+            ),
+            src,
+            dest,
+        )
+
+    def _fields_to_primitive(self, exporter, type_, src="src", dest="dest"):
         code_lines = CodeLines(
             [f"{dest} = {{}}"],
             False,
@@ -383,7 +1364,7 @@ class PydanticModelHandler(TypeHandler):
             is_optional = not field_info.is_required()
             if is_optional:
                 code_lines.lines.append(
-                    'if ("%(field_name)s" in %(src)s) {'
+                    "if (%(src)s.%(field_name)s !== undefined) {"
                     % {
                         "field_name": field_name,
                         "src": src,
@@ -391,7 +1372,7 @@ class PydanticModelHandler(TypeHandler):
                 )
             code_lines.add(
                 exporter.root_ts_to_primitive(
-                    field_info.annotation,
+                    get_field_annotation(field_info),
                     f"{src}.{field_name}",
                     f"{dest}.{field_name}",
                 )
@@ -401,6 +1382,7 @@ class PydanticModelHandler(TypeHandler):
         return code_lines
 
     def primitive_to_ts(self, exporter, type_, src, dest):
+        type_ = self._resolve(exporter, type_)
         if not self._is_supported(type_):
             return
 
@@ -409,12 +1391,57 @@ class PydanticModelHandler(TypeHandler):
                 type_.model_fields["root"].annotation, src, dest
             )
 
+        return self._call_converter(
+            exporter.define_converter(
+                type_,
+                "primitive_to_ts",
+                lambda: self._fields_to_ts(exporter, type_),
+            ),
+            src,
+            dest,
+        )
+
+    def validate(self, exporter, type_, src, loc):
+        type_ = self._resolve(exporter, type_)
+        if not self._is_supported(type_):
+            return
+
+        if type_.__pydantic_root_model__:
+            return exporter.root_validate(
+                get_constrained_annotation(type_.model_fields["root"]),
+                src,
+                loc,
+            )
+
+        name = exporter.define_converter(
+            type_, "validate", lambda: self._fields_validate(exporter, type_)
+        )
+        if name is None:
+            return CodeLines([], False)
+        return CodeLines([f"{name}({src}, {render_loc(loc)}, errors)"], True)
+
+    def _fields_validate(self, exporter, type_, src="src"):
+        code_lines = CodeLines([], False)
+        for field_name, field_info in type_.model_fields.items():
+            field_code_lines = exporter.root_validate(
+                get_constrained_annotation(field_info),
+                f"{src}.{field_name}",
+                (json.dumps(field_info.alias or field_name),),
+            )
+            if not field_info.is_required():
+                field_code_lines = guarded(
+                    f"{src}.{field_name} !== undefined", field_code_lines
+                )
+            code_lines.add(field_code_lines)
+        return code_lines
+
+    def _fields_to_ts(self, exporter, type_, src="data", dest="data"):
         code_lines = CodeLines([], False)
 
         for field_name, field_info in type_.model_fields.items():
             code_lines.add(
                 exporter.root_primitive_to_ts(
-                    field_info.annotation,
+                    get_field_annotation(field_info),
                     f"{src}.{field_name}",
                     f"{dest}.{field_name}",
                 )
@@ -427,7 +1454,9 @@ class PydanticModelHandler(TypeHandler):
                 "{}{}: {}".format(
                     field_name,
                     "" if field_info.is_required() else "?",
-                    exporter.root_type_to_interface(field_info.annotation),
+                    exporter.root_type_to_interface(
+                        get_field_annotation(field_info)
+                    ),
                 )
                 for field_name, field_info in type_.model_fields.items()
             ]
@@ -437,6 +1466,10 @@ class PydanticModelHandler(TypeHandler):
 class UnionHandler(TypeHandler):
     """Exports python union types to typescript ones."""
 
+    dispatch_keys = [("origin", Union)] + (
+        [("instance", UnionType)] if sys.version_info[0:2] > (3, 9) else []
+    )
+
     def _is_supported(self, type_):
         if not is_union(type_):
             return False
@@ -445,7 +1478,9 @@ class UnionHandler(TypeHandler):
         if len(args) == 2 and NoneType in args:
             return True
 
-        raise TypeError("union of two or more not none types is unsupported")
+        raise TypeError(
+            "union of two or more not none types requires a discriminator"
+        )
 
     def type_to_interface(self, exporter, type_):
         if self._is_supported(type_):
@@ -483,10 +1518,165 @@ class UnionHandler(TypeHandler):
             code_lines.lines.append("}")
             return code_lines
 
+    def validate(self, exporter, type_, src, loc):
+        if self._is_supported(type_):
+            args = type_.__args__
+            not_none_type = args[0] if args[1] is NoneType else args[1]
+            return guarded(
+                f"{src} !== undefined && {src} !== null",
+                exporter.root_validate(not_none_type, src, loc),
+            )
+
+
+class AnnotatedHandler(TypeHandler):
+    """Exports Annotated types as the underlying ones.
+
+    Unions of models discriminated by a tag field (discriminator) are
+    converted with a switch on the tag, so only the matching variant's
+    converter runs.
+    """
+
+    dispatch_keys = [("instance", AnnotatedAlias)]
+
+    def _get_discriminator(self, type_):
+        if not is_union(type_.__origin__):
+            return None
+        for item in type_.__metadata__:
+            discriminator = getattr(item, "discriminator", None)
+            discriminator = getattr(
+                discriminator, "discriminator", discriminator
+            )
+            if isinstance(discriminator, str):
+                return discriminator
+        return None
+
+    def _get_variants(self, type_, discriminator):
+        """Yields variant models and their tag values."""
+        for variant in type_.__origin__.__args__:
+            if not (isclass(variant) and issubclass(variant, BaseModel)):
+                raise TypeError(
+                    "discriminated union of non models is unsupported", type_
+                )
+            tag_type: Any = variant.model_fields[discriminator].annotation
+            if getattr(tag_type, "__origin__", None) is not Literal:
+                raise TypeError("tag field must be a Literal", variant)
+            yield variant, [
+                value.value if isinstance(value, Enum) else value
+                for value in tag_type.__args__
+            ]
+
+    def type_to_interface(self, exporter, type_):
+        if not isinstance(type_, AnnotatedAlias):
+            return
+        if self._get_discriminator(type_) is None:
+            return exporter.root_type_to_interface(type_.__origin__)
+        return " | ".join(
+            exporter.root_type_to_interface(arg)
+            for arg in type_.__origin__.__args__
+        )
+
+    def _convert(self, exporter, convert, type_, src, dest, cast=False):
+        discriminator = self._get_discriminator(type_)
+        if discriminator is None:
+            return convert(type_.__origin__, src, dest)
+
+        code_lines = CodeLines([f"switch ({src}.{discriminator}) {{"], False)
+        for variant, tag_values in self._get_variants(type_, discriminator):
+            variant_src = src
+            if cast:
+                # element access expressions are not narrowed by typescript
+                variant_src = "({} as {})".format(
+                    src, exporter.root_type_to_interface(variant)
+                )
+            variant_code_lines = convert(variant, variant_src, dest)
+            if not variant_code_lines.mutate:
+                continue
+            code_lines.lines.extend(
+                f"case {json.dumps(tag_value)}:" for tag_value in tag_values
+            )
+            code_lines.add(variant_code_lines)
+            code_lines.lines.append("break;")
+
+        if not code_lines.mutate:
+            return CodeLines.naive(src, dest)
+        if src != dest:
+            code_lines.lines.extend(["default:", f"{dest} = {src};"])
+        code_lines.lines.append("}")
+        return code_lines
+
+    def ts_to_primitive(self, exporter, type_, src, dest):
+        if isinstance(type_, AnnotatedAlias):
+            return self._convert(
+                exporter,
+                exporter.root_ts_to_primitive,
+                type_,
+                src,
+                dest,
+                cast=True,
+            )
+
+    def primitive_to_ts(self, exporter, type_, src, dest):
+        if isinstance(type_, AnnotatedAlias):
+            return self._convert(
+                exporter, exporter.root_primitive_to_ts, type_, src, dest
+            )
+
+    def validate(self, exporter, type_, src, loc):
+        if not isinstance(type_, AnnotatedAlias):
+            return
+        discriminator = self._get_discriminator(type_)
+        if discriminator is not None:
+            code_lines = CodeLines(
+                [f"switch ({src}.{discriminator}) {{"], False
+            )
+            variants = self._get_variants(type_, discriminator)
+            for variant, tag_values in variants:
+                variant_src = "({} as {})".format(
+                    src, exporter.root_type_to_interface(variant)
+                )
+                for tag_value in tag_values:
+                    variant_code_lines = exporter.root_validate(
+                        variant, variant_src, (*loc, json.dumps(tag_value))
+                    )
+                    if not variant_code_lines.mutate:
+                        continue
+                    code_lines.lines.append(f"case {json.dumps(tag_value)}:")
+                    code_lines.add(variant_code_lines)
+                    code_lines.lines.append("break;")
+            code_lines.lines.append("}")
+            return code_lines if code_lines.mutate else CodeLines([], False)
+
+        origin = type_.__origin__
+        if is_union(origin) and NoneType in origin.__args__:
+            # constraints of optional values apply to non-null ones
+            not_none_types = [
+                arg for arg in origin.__args__ if arg is not NoneType
+            ]
+            if len(not_none_types) == 1:
+                return guarded(
+                    f"{src} !== undefined && {src} !== null",
+                    self.validate(
+                        exporter,
+                        Annotated[
+                            tuple([not_none_types[0], *type_.__metadata__])
+                        ],
+                        src,
+                        loc,
+                    ),
+                )
+
+        code_lines = constraints_validate(
+            exporter, origin, type_.__metadata__, src, loc
+        )
+        code_lines.add(exporter.root_validate(origin, src, loc))
+        return code_lines
+
 
 class TypeVarHandler(TypeHandler):
     """Exports python type vars to typescript ones."""
 
+    dispatch_keys = [("instance", TypeVar)]
+
     def type_to_interface(self, exporter, type_):
         if isinstance(type_, TypeVar):
             return type_.__name__
@@ -498,9 +1688,79 @@ class TypeVarHandler(TypeHandler):
         pass
 
 
+def array_to_primitive(exporter, item_type, src, dest) -> CodeLines:
+    """Converts arrays with an indexed loop over a preallocated array."""
+    index_name = f"i{get_next_number()}"
+    code_lines = CodeLines(
+        [
+            f"{dest} = new Array({src}.length)",
+            f"for (let {index_name} = 0; {index_name} < {dest}.length; "
+            f"{index_name}++) {{",
+        ],
+        False,
+    )
+    code_lines.add(
+        exporter.root_ts_to_primitive(
+            item_type,
+            f"{src}[{index_name}]",
+            f"{dest}[{index_name}]",
+        )
+    )
+    if code_lines.mutate:
+        code_lines.lines.append("}")
+        return code_lines
+
+    return CodeLines.naive(src, dest)
+
+
+def array_to_ts(exporter, item_type, src, dest) -> CodeLines:
+    """Converts arrays in place with an indexed loop."""
+    index_name = f"i{get_next_number()}"
+    code_lines = CodeLines([], False)
+    if src != dest:
+        code_lines.lines.append(f"{dest} = new Array({src}.length)")
+    code_lines.lines.append(
+        f"for (let {index_name} = 0; {index_name} < {src}.length; "
+        f"{index_name}++) {{"
+    )
+    code_lines.add(
+        exporter.root_primitive_to_ts(
+            item_type,
+            f"{src}[{index_name}]",
+            f"{dest}[{index_name}]",
+        )
+    )
+    if code_lines.mutate:
+        code_lines.lines.append("}")
+        return code_lines
+
+    return CodeLines.naive(src, dest)
+
+
+def array_validate(exporter, item_type, src, loc) -> CodeLines:
+    """Validates items with an indexed loop."""
+    index_name = f"i{get_next_number()}"
+    code_lines = exporter.root_validate(
+        item_type, f"{src}[{index_name}]", (*loc, index_name)
+    )
+    if not code_lines.mutate:
+        return code_lines
+    return CodeLines(
+        [
+            f"for (let {index_name} = 0; {index_name} < {src}.length; "
+            f"{index_name}++) {{",
+            *code_lines.lines,
+            "}",
+        ],
+        True,
+    )
+
+
 class GenericListHandler(TypeHandler):
     """Exports python generic lists to typescript arrays."""
 
+    dispatch_keys = [("origin", list)]
+
     def _is_supported(self, type_):
         if is_parametrized_generic(type_) and type_.__origin__ is list:
             args = type_.__args__
@@ -517,49 +1777,22 @@ class GenericListHandler(TypeHandler):
 
     def ts_to_primitive(self, exporter, type_, src, dest):
         if self._is_supported(type_):
-            args = type_.__args__
-            index_name = f"i{get_next_number()}"
-
-            code_lines = CodeLines(
-                [f"{dest} = []", f"for (var {index_name} in {src}) {{"], False
-            )
-            code_lines.add(
-                exporter.root_ts_to_primitive(
-                    args[0],
-                    f"{src}[{index_name}]",
-                    f"{dest}[{index_name}]",
-                )
-            )
-            if code_lines.mutate:
-                code_lines.lines.append("}")
-                return code_lines
-
-            return CodeLines.naive(src, dest)
+            return array_to_primitive(exporter, type_.__args__[0], src, dest)
 
     def primitive_to_ts(self, exporter, type_, src, dest):
         if self._is_supported(type_):
-            args = type_.__args__
-            index_name = f"i{get_next_number()}"
-            code_lines = CodeLines(
-                [f"for (var {index_name} in {src}) {{"], False
-            )
-            code_lines.add(
-                exporter.root_primitive_to_ts(
-                    args[0],
-                    f"{src}[{index_name}]",
-                    f"{dest}[{index_name}]",
-                )
-            )
-            if code_lines.mutate:
-                code_lines.lines.append("}")
-                return code_lines
+            return array_to_ts(exporter, type_.__args__[0], src, dest)
 
-            return CodeLines.naive(src, dest)
+    def validate(self, exporter, type_, src, loc):
+        if self._is_supported(type_):
+            return array_validate(exporter, type_.__args__[0], src, loc)
 
 
 class GenericTupleHandler(TypeHandler):
     """Exports python generic tuples to typescript arrays."""
 
+    dispatch_keys = [("origin", tuple)]
+
     def _is_supported(self, type_):
         if is_parametrized_generic(type_) and type_.__origin__ is tuple:
             args = type_.__args__
@@ -584,44 +1817,27 @@ class GenericTupleHandler(TypeHandler):
 
     def ts_to_primitive(self, exporter, type_, src, dest):
         if self._is_supported(type_):
-            if Ellipsis in type_.__args__:
-                args = type_.__args__
-                index_name = f"i{get_next_number()}"
-
-                code_lines = CodeLines(
-                    [
-                        f"{dest} = []",
-                        f"for (var {index_name} in {src}) {{",
-                    ],
-                    False,
-                )
-                code_lines.add(
-                    exporter.root_ts_to_primitive(
-                        args[0] if args[1] is Ellipsis else args[1],
-                        f"{src}[{index_name}]",
-                        f"{dest}[{index_name}]",
-                    )
+            args = type_.__args__
+            if Ellipsis in args:
+                return array_to_primitive(
+                    exporter,
+                    args[0] if args[1] is Ellipsis else args[1],
+                    src,
+                    dest,
                 )
-                if code_lines.mutate:
-                    code_lines.lines.append("}")
-                    return code_lines
-
-                return CodeLines.naive(src, dest)
 
             else:
-                value_name = f"v{get_next_number()}"
                 code_lines = CodeLines(
-                    [f"let {value_name}: any;", f"{dest} = []"], False
+                    [f"{dest} = new Array({len(args)})"], False
                 )
-                for index, arg in enumerate(type_.__args__):
+                for index, arg in enumerate(args):
                     code_lines.add(
                         exporter.root_ts_to_primitive(
                             arg,
                             f"{src}[{index}]",
-                            f"{value_name}",
+                            f"{dest}[{index}]",
                         )
                     )
-                    code_lines.lines.append(f"{dest}.push({value_name})")
 
                 if code_lines.mutate:
                     return code_lines
@@ -630,24 +1846,14 @@ class GenericTupleHandler(TypeHandler):
 
     def primitive_to_ts(self, exporter, type_, src, dest):
         if self._is_supported(type_):
-            if Ellipsis in type_.__args__:
-                args = type_.__args__
-                index_name = f"i{get_next_number()}"
-                code_lines = CodeLines(
-                    [f"for (var {index_name} in {src}) {{"], False
-                )
-                code_lines.add(
-                    exporter.root_primitive_to_ts(
-                        args[0] if args[1] is Ellipsis else args[1],
-                        f"{src}[{index_name}]",
-                        f"{dest}[{index_name}]",
-                    )
+            args = type_.__args__
+            if Ellipsis in args:
+                return array_to_ts(
+                    exporter,
+                    args[0] if args[1] is Ellipsis else args[1],
+                    src,
+                    dest,
                 )
-                if code_lines.mutate:
-                    code_lines.lines.append("}")
-                    return code_lines
-
-                return CodeLines.naive(src, dest)
 
             else:
                 return CodeLines.concat(
@@ -656,12 +1862,35 @@ class GenericTupleHandler(TypeHandler):
                         f"{src}[{index}]",
                         f"{dest}[{index}]",
                     )
-                    for index, arg in enumerate(type_.__args__)
+                    for index, arg in enumerate(args)
+                )
+
+    def validate(self, exporter, type_, src, loc):
+        if self._is_supported(type_):
+            args = type_.__args__
+            if Ellipsis in args:
+                return array_validate(
+                    exporter,
+                    args[0] if args[1] is Ellipsis else args[1],
+                    src,
+                    loc,
+                )
+            return CodeLines.concat(
+                exporter.root_validate(
+                    arg, f"{src}[{index}]", (*loc, str(index))
                 )
+                for index, arg in enumerate(args)
+            )
 
 
 class GenericDictHandler(TypeHandler):
-    """Exports python generic dicts to typescript ones."""
+    """Exports python generic dicts to typescript ones.
+
+    Keys are iterated over with Object.keys, so the prototype chain is not
+    walked.
+    """
+
+    dispatch_keys = [("origin", dict)]
 
     def _is_supported(self, type_):
         return is_parametrized_generic(type_) and type_.__origin__ is dict
@@ -675,25 +1904,35 @@ class GenericDictHandler(TypeHandler):
             return f"{{ [k: {interface_key}]: {interface_value}}}"
         pass
 
+    def _loop(self, convert, key_type, src):
+        """Renders loop header and converts the key (only if needed)."""
+        keys_name = f"k{get_next_number()}"
+        index_name = f"i{get_next_number()}"
+        key_name = f"k{get_next_number()}"
+        prepared_key_name = f"k{get_next_number()}"
+        code_lines = CodeLines(
+            [
+                f"for (let {keys_name} = Object.keys({src}), {index_name} = 0; "
+                f"{index_name} < {keys_name}.length; {index_name}++) {{",
+                f"const {key_name}: any = {keys_name}[{index_name}]",
+            ],
+            False,
+        )
+        key_code_lines = convert(key_type, key_name, prepared_key_name)
+        if not key_code_lines.mutate:
+            return code_lines, key_name, key_name
+
+        code_lines.lines.append(f"let {prepared_key_name}: any")
+        code_lines.add(key_code_lines)
+        return code_lines, key_name, prepared_key_name
+
     def ts_to_primitive(self, exporter, type_, src, dest):
         if self._is_supported(type_):
-            key_name = f"k{get_next_number()}"
-            prepared_key_name = f"k{get_next_number()}"
-            code_lines = CodeLines(
-                [
-                    f"let {prepared_key_name}: any;",
-                    f"{dest} = {{}}",
-                    f"for (var {key_name} in {src}) {{",
-                ],
-                False,
-            )
-            code_lines.add(
-                exporter.root_ts_to_primitive(
-                    type_.__args__[0],
-                    f"{key_name}",
-                    f"{prepared_key_name}",
-                )
+            loop_lines, key_name, prepared_key_name = self._loop(
+                exporter.root_ts_to_primitive, type_.__args__[0], src
             )
+            code_lines = CodeLines([f"{dest} = {{}}"], False)
+            code_lines.add(loop_lines)
             code_lines.add(
                 exporter.root_ts_to_primitive(
                     type_.__args__[1],
@@ -710,21 +1949,8 @@ class GenericDictHandler(TypeHandler):
 
     def primitive_to_ts(self, exporter, type_, src, dest):
         if self._is_supported(type_):
-            key_name = f"k{get_next_number()}"
-            prepared_key_name = f"k{get_next_number()}"
-            code_lines = CodeLines(
-                [
-                    f"let {prepared_key_name}: any",
-                    f"for (var {key_name} in {src}) {{",
-                ],
-                False,
-            )
-            code_lines.add(
-                exporter.root_primitive_to_ts(
-                    type_.__args__[0],
-                    f"{key_name}",
-                    f"{prepared_key_name}",
-                )
+            code_lines, key_name, prepared_key_name = self._loop(
+                exporter.root_primitive_to_ts, type_.__args__[0], src
             )
             code_lines.add(
                 exporter.root_primitive_to_ts(
@@ -740,10 +1966,34 @@ class GenericDictHandler(TypeHandler):
             return CodeLines.naive(src, dest)
         pass
 
+    def validate(self, exporter, type_, src, loc):
+        if self._is_supported(type_):
+            keys_name = f"k{get_next_number()}"
+            index_name = f"i{get_next_number()}"
+            key_name = f"k{get_next_number()}"
+            code_lines = exporter.root_validate(
+                type_.__args__[1], f"{src}[{key_name}]", (*loc, key_name)
+            )
+            if not code_lines.mutate:
+                return code_lines
+            return CodeLines(
+                [
+                    f"for (let {keys_name} = Object.keys({src}), "
+                    f"{index_name} = 0; {index_name} < {keys_name}.length; "
+                    f"{index_name}++) {{",
+                    f"const {key_name}: any = {keys_name}[{index_name}]",
+                    *code_lines.lines,
+                    "}",
+                ],
+                True,
+            )
+
 
 class EnumHandler(TypeHandler):
     """Exports python enums to typescript ones."""
 
+    dispatch_keys = [("class", Enum)]
+
     def _is_supported(self, type_):
         return isclass(type_) and issubclass(type_, Enum)
 
@@ -765,6 +2015,12 @@ class EnumHandler(TypeHandler):
         if self._is_supported(type_):
             return CodeLines.naive(src, dest)
 
+    def validate(self, exporter, type_, src, loc):
+        if self._is_supported(type_):
+            return choice_validate(
+                "enum", [item.value for item in type_], src, loc
+            )
+
 
 class TsExporter(BaseTsExporter):
     handlers = [
@@ -775,30 +2031,48 @@ class TsExporter(BaseTsExporter):
         GenericDictHandler(),
         EnumHandler(),
         UnionHandler(),
+        AnnotatedHandler(),
         TypeVarHandler(),
         PydanticModelHandler(),
     ]
 
 
-if sys.version_info[0:2] >= (3, 8):
-    from typing import Literal
+class LiteralHandler(TypeHandler):
+    """Exports Literal types as unions of typescript literals."""
 
-    class LiteralHandler(TypeHandler):
-        def _is_supported(self, type_):
-            return getattr(type_, "__origin__", None) is Literal
+    dispatch_keys = [("origin", Literal)]
 
-        def type_to_interface(self, exporter, type_):
-            if self._is_supported(type_):
-                return " | ".join([f'"{arg}"' for arg in type_.__args__])
+    def _is_supported(self, type_):
+        return getattr(type_, "__origin__", None) is Literal
 
-        def ts_to_primitive(self, exporter, type_, src, dest):
-            if self._is_supported(type_):
-                return CodeLines.naive(src, dest)
+    def type_to_interface(self, exporter, type_):
+        if self._is_supported(type_):
+            return " | ".join(
+                [
+                    json.dumps(arg.value if isinstance(arg, Enum) else arg)
+                    for arg in type_.__args__
+                ]
+            )
 
-        def primitive_to_ts(self, exporter, type_, src, dest):
-            if self._is_supported(type_):
-                return CodeLines.naive(src, dest)
+    def ts_to_primitive(self, exporter, type_, src, dest):
+        if self._is_supported(type_):
+            return CodeLines.naive(src, dest)
 
-    TsExporter.handlers.append(LiteralHandler())
-else:
-    pass
+    def primitive_to_ts(self, exporter, type_, src, dest):
+        if self._is_supported(type_):
+            return CodeLines.naive(src, dest)
+
+    def validate(self, exporter, type_, src, loc):
+        if self._is_supported(type_):
+            return choice_validate(
+                "literal_error",
+                [
+                    arg.value if isinstance(arg, Enum) else arg
+                    for arg in type_.__args__
+                ],
+                src,
+                loc,
+            )
+
+
+TsExporter.handlers.append(LiteralHandler())
@@ -0,0 +1,304 @@
+"""Defines RPC over TCP or Unix sockets with length-prefixed frames."""
+
+import asyncio
+import itertools
+import struct
+from typing import Any, Callable, MutableMapping, Optional
+
+
+# body length, stream id
+FRAME_HEADER = struct.Struct("<II")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+INTERNAL_ERROR = (
+    b'{"jsonrpc": "2.0", "error": {"code": -32603, "message": '
+    b'"Internal error"}, "id": null}'
+)
+
+
+class FrameServerMetrics:
+    """Counters of a FrameServer.
+
+    read_pauses counts how many times reading of a connection stopped, since
+    max_concurrency calls were in flight; write_pauses - how many times
+    responses waited for a full write buffer to drain.
+    """
+
+    __slots__ = [
+        "connections_opened",
+        "connections_active",
+        "requests",
+        "requests_in_flight",
+        "frames_rejected",
+        "read_pauses",
+        "write_pauses",
+        "bytes_received",
+        "bytes_sent",
+    ]
+
+    def __init__(self):
+        self.connections_opened = 0
+        self.connections_active = 0
+        self.requests = 0
+        self.requests_in_flight = 0
+        self.frames_rejected = 0
+        self.read_pauses = 0
+        self.write_pauses = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def as_dict(self) -> MutableMapping[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class FrameServer:
+    """Serves an AbstractAsyncRpc over TCP or Unix sockets.
+
+    Every frame is a header (body length and stream id, two little-endian
+    uint32) followed by a JSON-RPC request body; responses are sent in frames
+    with the same stream id, as soon as calls complete, so a connection
+    multiplexes concurrent calls.
+
+    Reading of a connection pauses while max_concurrency of its calls are in
+    flight, so clients are slowed down by TCP flow control rather than
+    buffered. Frames longer than max_frame_size close the connection.
+
+    Args:
+      rpc: AbstractAsyncRpc to dispatch requests to
+      make_context: called with StreamWriter of every new connection, returns
+        context of its calls (None if not set)
+      max_concurrency: max number of calls in flight per connection
+      max_frame_size: max length of a request body
+    """
+
+    def __init__(
+        self,
+        rpc,
+        make_context: Optional[Callable[[asyncio.StreamWriter], Any]] = None,
+        max_concurrency=64,
+        max_frame_size=MAX_FRAME_SIZE,
+    ):
+        self.rpc = rpc
+        self.make_context = make_context
+        self.max_concurrency = max_concurrency
+        self.max_frame_size = max_frame_size
+        self.metrics = FrameServerMetrics()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host=None, port=None, **kwargs):
+        """Starts listening on TCP host and port, returns self."""
+        self.server = await asyncio.start_server(
+            self._handle_connection, host, port, **kwargs
+        )
+        return self
+
+    async def start_unix(self, path, **kwargs):
+        """Starts listening on a Unix socket, returns self."""
+        self.server = await asyncio.start_unix_server(
+            self._handle_connection, path, **kwargs
+        )
+        return self
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def wait_closed(self):
+        if self.server is not None:
+            await self.server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        metrics = self.metrics
+        metrics.connections_opened += 1
+        metrics.connections_active += 1
+        context = (
+            None if self.make_context is None else self.make_context(writer)
+        )
+        slots = asyncio.Semaphore(self.max_concurrency)
+        drain_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                if slots.locked():
+                    metrics.read_pauses += 1
+                await slots.acquire()
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                    length, stream_id = FRAME_HEADER.unpack(header)
+                    if length > self.max_frame_size:
+                        metrics.frames_rejected += 1
+                        break
+                    body = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                metrics.bytes_received += FRAME_HEADER.size + length
+                task = asyncio.ensure_future(
+                    self._call(
+                        body, stream_id, context, writer, slots, drain_lock
+                    )
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            metrics.connections_active -= 1
+            writer.close()
+
+    async def _call(self, body, stream_id, context, writer, slots, lock):
+        metrics = self.metrics
+        metrics.requests += 1
+        metrics.requests_in_flight += 1
+        try:
+            try:
+                chunks = tuple(
+                    await self.rpc.call_async_chunks(body, context, lazy=False)
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                asyncio.get_running_loop().call_exception_handler(
+                    {
+                        "message": "unhandled exception of an rpc call",
+                        "exception": e,
+                    }
+                )
+                chunks = (INTERNAL_ERROR,)
+            length = sum(len(chunk) for chunk in chunks)
+            if writer.is_closing():
+                return
+            writer.writelines((FRAME_HEADER.pack(length, stream_id),) + chunks)
+            metrics.bytes_sent += FRAME_HEADER.size + length
+            transport = writer.transport
+            if (
+                transport.get_write_buffer_size()
+                > transport.get_write_buffer_limits()[1]
+            ):
+                metrics.write_pauses += 1
+                async with lock:
+                    await writer.drain()
+        finally:
+            metrics.requests_in_flight -= 1
+            slots.release()
+
+
+class FrameConnection:
+    """Client connection, which multiplexes calls by stream ids."""
+
+    def __init__(self, reader, writer, max_frame_size):
+        self.reader = reader
+        self.writer = writer
+        self.max_frame_size = max_frame_size
+        self.pending: MutableMapping[int, asyncio.Future] = {}
+        self.stream_ids = itertools.count(1)
+        self.drain_lock = asyncio.Lock()
+        self.read_task = asyncio.ensure_future(self._read_responses())
+
+    @property
+    def is_alive(self):
+        return not self.read_task.done()
+
+    async def _read_responses(self):
+        reader = self.reader
+        error: BaseException = ConnectionError("connection closed")
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                length, stream_id = FRAME_HEADER.unpack(header)
+                if length > self.max_frame_size:
+                    error = ConnectionError("frame is too long", length)
+                    break
+                body = await reader.readexactly(length)
+                future = self.pending.pop(stream_id, None)
+                if future is not None and not future.done():
+                    future.set_result(body)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            if isinstance(e, ConnectionError):
+                error = e
+        finally:
+            self.writer.close()
+            pending, self.pending = self.pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def post(self, body: bytes) -> bytes:
+        if not self.is_alive:
+            raise ConnectionError("connection closed")
+        stream_id = next(self.stream_ids) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self.pending[stream_id] = future
+        try:
+            self.writer.write(FRAME_HEADER.pack(len(body), stream_id) + body)
+            if (
+                self.writer.transport.get_write_buffer_size()
+                > self.writer.transport.get_write_buffer_limits()[1]
+            ):
+                async with self.drain_lock:
+                    await self.writer.drain()
+            return await future
+        finally:
+            self.pending.pop(stream_id, None)
+
+    def close(self):
+        self.read_task.cancel()
+        self.writer.close()
+
+
+class AsyncFrameTransport:
+    """Pool of multiplexed connections to a FrameServer.
+
+    Calls are spread over the connections round robin, each connection
+    carries many concurrent calls; closed connections are reopened on next
+    calls. Can be passed to AsyncRpcClient (e.g. a generated AsyncClient).
+
+    Args:
+      address: (host, port) of a TCP server or path of a Unix socket
+      pool_size: number of connections
+      max_frame_size: max length of a response body
+    """
+
+    def __init__(self, address, pool_size=1, max_frame_size=MAX_FRAME_SIZE):
+        self.address = address
+        self.pool_size = pool_size
+        self.max_frame_size = max_frame_size
+        self.connections_opened = 0
+        self._connections: "list[Optional[FrameConnection]]" = [
+            None
+        ] * pool_size
+        self._opening: "list[Optional[asyncio.Future]]" = [None] * pool_size
+        self._next_index = itertools.cycle(range(pool_size))
+
+    async def _open(self):
+        if isinstance(self.address, str):
+            reader, writer = await asyncio.open_unix_connection(self.address)
+        else:
+            reader, writer = await asyncio.open_connection(*self.address)
+        self.connections_opened += 1
+        return FrameConnection(reader, writer, self.max_frame_size)
+
+    async def _get_connection(self, index):
+        connection = self._connections[index]
+        if connection is not None and connection.is_alive:
+            return connection
+        # concurrent calls share a connection being opened
+        opening = self._opening[index]
+        if opening is None:
+            opening = self._opening[index] = asyncio.ensure_future(
+                self._open()
+            )
+        try:
+            connection = await asyncio.shield(opening)
+        finally:
+            if self._opening[index] is opening and opening.done():
+                self._opening[index] = None
+        self._connections[index] = connection
+        return connection
+
+    async def post(self, body: bytes) -> bytes:
+        """Returns the response body."""
+        connection = await self._get_connection(next(self._next_index))
+        return await connection.post(body)
+
+    async def close(self):
+        for index, connection in enumerate(self._connections):
+            if connection is not None:
+                connection.close()
+                self._connections[index] = None
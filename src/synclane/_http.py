@@ -0,0 +1,262 @@
+"""Defines HTTP helpers: responses and their compression."""
+
+import hashlib
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Iterable, Iterator, MutableMapping, Optional
+
+
+JSON_CONTENT_TYPE = "application/json"
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+ZLIB_HEADER = b"\x78\x9c"
+ENCODING_PREFERENCE = {"gzip": 2, "deflate": 1}
+
+
+class HttpResponse:
+    """HTTP response of an Rpc: status, headers and body buffers."""
+
+    __slots__ = ["status", "headers", "chunks", "_body"]
+
+    def __init__(self, status, headers, chunks):
+        self.status: int = status
+        self.headers: MutableMapping[str, str] = headers
+        self.chunks: Iterable[bytes] = chunks
+        self._body: Optional[bytes] = None
+
+    @property
+    def body(self) -> bytes:
+        """Joined chunks; don't mix with iterating over chunks directly."""
+        if self._body is None:
+            self._body = b"".join(self.chunks)
+            self.chunks = (self._body,)
+        return self._body
+
+
+class ServerTiming:
+    """Durations of phases of a call, rendered as Server-Timing header.
+
+    Phases are consecutive: each one lasts from the end of the previous one
+    (or creation) until it is marked.
+    """
+
+    __slots__ = ["durations", "_started_at"]
+
+    def __init__(self):
+        self.durations: MutableMapping[str, float] = {}
+        self._started_at = time.perf_counter()
+
+    def mark(self, phase):
+        """Ends the phase, adding its duration in seconds."""
+        now = time.perf_counter()
+        self.durations[phase] = (
+            self.durations.get(phase, 0.0) + now - self._started_at
+        )
+        self._started_at = now
+
+    def to_header(self) -> str:
+        return ", ".join(
+            f"{phase};dur={duration * 1000:.3f}"
+            for phase, duration in self.durations.items()
+        )
+
+
+def negotiate_encoding(accept_encoding) -> Optional[str]:
+    """Picks gzip or deflate from Accept-Encoding header value."""
+    if not accept_encoding:
+        return None
+
+    best = None
+    best_key = (0.0, 0)
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if name == "*":
+            name = "gzip"
+        if name not in ENCODING_PREFERENCE:
+            continue
+
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        key = (q, ENCODING_PREFERENCE[name])
+        if q > 0 and key > best_key:
+            best, best_key = name, key
+    return best
+
+
+class ResponseCompressor:
+    """Compresses response bodies with stdlib zlib (gzip or deflate).
+
+    Every chunk of at least min_size bytes (i.e. a serialized result) is
+    deflated into an independent, byte-aligned segment; the small envelope
+    pieces around it are compressed on every call. Segments of reused results
+    (compressed with memoize=True, e.g. cached results and query responses)
+    are kept in an LRU cache keyed by digests of the results, so they are
+    compressed only once.
+
+    Args:
+      min_size: bodies shorter than this are sent as is
+      level: zlib compression level
+      cache_bytes: max total size of compressed segments to keep
+    """
+
+    def __init__(self, min_size=1024, level=6, cache_bytes=8 * 1024 * 1024):
+        self.min_size = min_size
+        self.level = level
+        self.cache_bytes = cache_bytes
+        self._cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def _new_deflater(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    def _deflate_segment(self, chunk: bytes) -> bytes:
+        deflater = self._new_deflater()
+        return deflater.compress(chunk) + deflater.flush(zlib.Z_SYNC_FLUSH)
+
+    def _deflate_memoized(self, chunk: bytes) -> bytes:
+        key = hashlib.blake2b(chunk, digest_size=16).digest()
+        with self._lock:
+            segment = self._cache.get(key)
+            if segment is not None:
+                self._cache.move_to_end(key)
+                return segment
+
+        segment = self._deflate_segment(chunk)
+        if len(segment) <= self.cache_bytes:
+            with self._lock:
+                if key not in self._cache:
+                    self._cache[key] = segment
+                    self._cached_bytes += len(segment)
+                    while self._cached_bytes > self.cache_bytes:
+                        _, evicted = self._cache.popitem(last=False)
+                        self._cached_bytes -= len(evicted)
+        return segment
+
+    def iter_compressed(
+        self, chunks, encoding, memoize=False
+    ) -> Iterator[bytes]:
+        is_gzip = encoding == "gzip"
+        checksum = zlib.crc32(b"") if is_gzip else zlib.adler32(b"")
+        update_checksum = zlib.crc32 if is_gzip else zlib.adler32
+        size = 0
+
+        yield GZIP_HEADER if is_gzip else ZLIB_HEADER
+        deflater = None
+        for chunk in chunks:
+            checksum = update_checksum(chunk, checksum)
+            size += len(chunk)
+            if isinstance(chunk, bytes) and len(chunk) >= self.min_size:
+                # cached segments never reference data outside of them, so
+                # the running deflater must not reference them either
+                if deflater is not None:
+                    yield deflater.flush(zlib.Z_SYNC_FLUSH)
+                    deflater = None
+                yield (
+                    self._deflate_memoized(chunk)
+                    if memoize
+                    else self._deflate_segment(chunk)
+                )
+                continue
+
+            if deflater is None:
+                deflater = self._new_deflater()
+            data = deflater.compress(chunk)
+            if data:
+                yield data
+
+        if deflater is None:
+            deflater = self._new_deflater()
+        yield deflater.flush(zlib.Z_FINISH)
+        if is_gzip:
+            yield struct.pack("<II", checksum, size & 0xFFFFFFFF)
+        else:
+            yield struct.pack(">I", checksum)
+
+    def compress(self, chunks, accept_encoding, memoize=False):
+        """Returns compressed chunks and the content encoding (or None).
+
+        memoize caches compressed results, pass it for reused ones only.
+        """
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None:
+            return chunks, None
+        if isinstance(chunks, (tuple, list)) and (
+            sum(len(chunk) for chunk in chunks) < self.min_size
+        ):
+            return chunks, None
+        return self.iter_compressed(chunks, encoding, memoize), encoding
+
+
+def make_http_response(
+    chunks, headers, compressor, memoize=False
+) -> HttpResponse:
+    response_headers = {"Content-Type": JSON_CONTENT_TYPE}
+    if compressor is not None:
+        response_headers["Vary"] = "Accept-Encoding"
+        if headers is not None:
+            chunks, encoding = compressor.compress(
+                chunks, headers.get("accept-encoding"), memoize
+            )
+            if encoding is not None:
+                response_headers["Content-Encoding"] = encoding
+    return HttpResponse(200, response_headers, chunks)
+
+
+def parse_etags(if_none_match):
+    """Returns body digests of If-None-Match ETags (encoding suffix dropped)."""
+    if not if_none_match:
+        return ()
+
+    digests = set()
+    for item in if_none_match.split(","):
+        etag = item.strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+        digests.add(etag.strip('"').split("-", 1)[0])
+    return digests
+
+
+def make_query_http_response(
+    chunks, headers, compressor, cache_control
+) -> HttpResponse:
+    """Makes response to a GET query; only successful ones are cacheable.
+
+    ETag is derived from the serialized body; if compressed, the encoding
+    is appended to it, so representations are distinguished, while
+    If-None-Match is compared to the uncompressed body digest.
+    """
+    if cache_control is None:
+        response = make_http_response(chunks, headers, compressor)
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    body = b"".join(chunks)
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    if headers is not None:
+        etags = parse_etags(headers.get("if-none-match"))
+        if digest in etags or "*" in etags:
+            response_headers = {
+                "Cache-Control": cache_control,
+                "ETag": f'"{digest}"',
+            }
+            if compressor is not None:
+                response_headers["Vary"] = "Accept-Encoding"
+            return HttpResponse(304, response_headers, ())
+
+    response = make_http_response((body,), headers, compressor, True)
+    encoding = response.headers.get("Content-Encoding")
+    response.headers["Cache-Control"] = cache_control
+    response.headers["ETag"] = (
+        f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    )
+    return response
@@ -0,0 +1,150 @@
+"""Defines batching loader of async procedures (a fix for N+1 queries)."""
+
+import asyncio
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+
+# caches of BatchLoaders of the current call, set by AbstractAsyncRpc
+REQUEST_CACHES: ContextVar[
+    Optional[MutableMapping[Any, MutableMapping[Any, asyncio.Future]]]
+] = ContextVar("synclane_request_caches", default=None)
+
+
+class BatchLoader:
+    """Batches loads of keys made during one event loop iteration.
+
+    Keys requested by load / load_many are collected until the loop runs
+    ready callbacks, then batch_load is called once with unique keys (in
+    slices of max_batch_size). Loads are batched across concurrent calls of
+    an AbstractAsyncRpc, so keep a loader at module level (or on the Rpc).
+
+    With "request" scope values are cached for the duration of an rpc call:
+    repeated loads of a key within a call return the same value without
+    fetching. With "batch" scope (and outside of rpc calls) only loads of the
+    same batch are shared. Failed loads are not cached.
+
+    Args:
+      batch_load: async callable taking a list of keys, returning a list of
+        values in the same order or a mapping of keys to values (missing
+        keys raise KeyError)
+      scope: "request" or "batch"
+      max_batch_size: max number of keys per batch_load call
+    """
+
+    def __init__(
+        self,
+        batch_load: Callable[
+            [List[Any]], Awaitable[Union[Sequence[Any], Mapping[Any, Any]]]
+        ],
+        scope="request",
+        max_batch_size: Optional[int] = None,
+    ):
+        if scope not in ("request", "batch"):
+            raise ValueError("unknown scope", scope)
+        self.batch_load = batch_load
+        self.scope = scope
+        self.max_batch_size = max_batch_size
+        self._pending: MutableMapping[Any, asyncio.Future] = {}
+        self._dispatch_scheduled = False
+        # the loop keeps weak references to tasks only
+        self._tasks: "set[asyncio.Task]" = set()
+
+    async def load(self, key: Hashable):
+        cache = None
+        if self.scope == "request":
+            caches = REQUEST_CACHES.get()
+            if caches is not None:
+                cache = caches.get(self)
+                if cache is None:
+                    cache = caches[self] = {}
+
+        future = None if cache is None else cache.get(key)
+        if future is None:
+            future = self._pending.get(key)
+            if future is None:
+                loop = asyncio.get_running_loop()
+                future = self._pending[key] = loop.create_future()
+                if not self._dispatch_scheduled:
+                    self._dispatch_scheduled = True
+                    loop.call_soon(self._dispatch)
+            if cache is not None:
+                cache[key] = future
+        try:
+            # a cancelled waiter must not cancel loads of others
+            return await asyncio.shield(future)
+        except BaseException:
+            # failed (or cancelled) loads are not cached
+            if (
+                cache is not None
+                and cache.get(key) is future
+                and future.done()
+                and (future.cancelled() or future.exception() is not None)
+            ):
+                del cache[key]
+            raise
+
+    async def load_many(self, keys: Sequence[Hashable]) -> List[Any]:
+        return list(await asyncio.gather(*[self.load(key) for key in keys]))
+
+    def _dispatch(self):
+        self._dispatch_scheduled = False
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        size = self.max_batch_size or len(keys)
+        for index in range(0, len(keys), size):
+            task = asyncio.ensure_future(
+                self._load_batch(keys[index : index + size], pending)
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, keys, futures):
+        results: Sequence[Tuple[Any, Optional[Exception]]]
+        try:
+            values = await self.batch_load(keys)
+            if isinstance(values, Mapping):
+                results = [
+                    (
+                        (values[key], None)
+                        if key in values
+                        else (None, KeyError(key))
+                    )
+                    for key in keys
+                ]
+            elif len(values) != len(keys):
+                raise ValueError(
+                    "batch_load returned a different number of values",
+                    len(keys),
+                    len(values),
+                )
+            else:
+                results = [(value, None) for value in values]
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            results = [(None, e)] * len(keys)
+        except BaseException:
+            # e.g. the task is cancelled on shutdown: waiters must not hang
+            for key in keys:
+                futures[key].cancel()
+            raise
+
+        for key, (value, error) in zip(keys, results):
+            future = futures[key]
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
@@ -0,0 +1,227 @@
+"""Defines export of typed python clients of rpcs."""
+
+import keyword
+import os
+import re
+import sys
+import typing
+from enum import Enum
+from typing import Any, MutableMapping, Tuple, Union
+
+from typing_extensions import Annotated, Literal, get_args, get_origin
+
+from ._base import AbstractAsyncProcedure, ProcedureMeta
+from ._export import atomic_write
+
+
+if sys.version_info[0:2] > (3, 9):
+    from types import UnionType
+else:  # pragma: no cover
+    UnionType = None
+
+NoneType = type(None)
+# modules, whose types are imported from their public package
+PUBLIC_MODULES = {"synclane._types": "synclane"}
+# names, which the client module defines itself
+RESERVED_NAMES = {"Client", "AsyncClient"}
+TYPING_NAMES = {
+    list: "List",
+    dict: "Dict",
+    tuple: "Tuple",
+    set: "Set",
+    frozenset: "FrozenSet",
+}
+
+
+def to_method_name(name: str) -> str:
+    """Converts a procedure name to a method one: GetUserURL -> get_user_url."""
+    method_name = re.sub(
+        r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])", "_", name
+    ).lower()
+    if keyword.iskeyword(method_name):
+        method_name += "_"
+    return method_name
+
+
+class PyExporter:
+    """Exporter of a typed python client (sync and async ones).
+
+    The client module has a method per procedure, taking and returning
+    python objects of the procedure types, which are imported from modules
+    they are defined in: they have to be importable by the client (e.g. live
+    in a package shared by services). Annotated metadata (e.g. constraints)
+    is dropped, the server validates params anyway.
+    """
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+        self.imports: MutableMapping[Tuple[str, str], str] = {}
+        self.changed_filenames: "list[str]" = []
+        for name in ("AsyncRpcClient", "ClientProcedure", "RpcClient"):
+            self.import_name("synclane", name)
+
+    def import_name(self, module: str, name: str) -> str:
+        """Returns the local name of an imported object."""
+        key = (module, name)
+        if key not in self.imports:
+            local_name = name
+            taken = RESERVED_NAMES.union(self.imports.values())
+            index = 2
+            while local_name in taken:
+                local_name = f"{name}_{index}"
+                index += 1
+            self.imports[key] = local_name
+        return self.imports[key]
+
+    def render_class(self, type_) -> str:
+        module = type_.__module__
+        if module == "builtins":
+            return type_.__qualname__
+        if "<locals>" in type_.__qualname__:
+            raise ValueError(
+                "type is not importable, define it at module level", type_
+            )
+        module = PUBLIC_MODULES.get(module, module)
+        name, _, rest = type_.__qualname__.partition(".")
+        local_name = self.import_name(module, name)
+        return f"{local_name}.{rest}" if rest else local_name
+
+    def render_annotation(self, type_) -> str:
+        """Renders a type as python code, collecting imports."""
+        if type_ is None or type_ is NoneType:
+            return "None"
+        if type_ is Any:
+            return self.import_name("typing", "Any")
+        if type_ is Ellipsis:
+            return "..."
+
+        origin = get_origin(type_)
+        args = get_args(type_)
+        if origin is Annotated:
+            return self.render_annotation(args[0])
+        if origin is Literal:
+            values = [
+                (
+                    f"{self.render_class(type(value))}.{value.name}"
+                    if isinstance(value, Enum)
+                    else repr(value)
+                )
+                for value in args
+            ]
+            return "%s[%s]" % (
+                self.import_name("typing_extensions", "Literal"),
+                ", ".join(values),
+            )
+        if origin is Union or (UnionType is not None and origin is UnionType):
+            if len(args) == 2 and NoneType in args:
+                return "%s[%s]" % (
+                    self.import_name("typing", "Optional"),
+                    self.render_annotation(
+                        args[0] if args[1] is NoneType else args[1]
+                    ),
+                )
+            origin_name = self.import_name("typing", "Union")
+        elif origin in TYPING_NAMES:
+            origin_name = self.import_name("typing", TYPING_NAMES[origin])
+        elif origin is not None and hasattr(typing, origin.__name__):
+            # collections.abc ones: Sequence, Mapping, ...
+            origin_name = self.import_name("typing", origin.__name__)
+        elif origin is None and isinstance(type_, type):
+            metadata = getattr(type_, "__pydantic_generic_metadata__", None)
+            if metadata and metadata["origin"] is not None:
+                # Model[T] instantiations
+                origin_name = self.render_class(metadata["origin"])
+                args = metadata["args"]
+            else:
+                return self.render_class(type_)
+        else:
+            raise TypeError("unsupported type", type_)
+
+        if not args:
+            return origin_name
+        return "%s[%s]" % (
+            origin_name,
+            ", ".join(self.render_annotation(arg) for arg in args),
+        )
+
+    def procedure_types(self, procedure):
+        method = (
+            type(procedure).call_async
+            if isinstance(procedure, AbstractAsyncProcedure)
+            else type(procedure).call
+        )
+        return ProcedureMeta.get_in_n_out_types(method)
+
+    def to_code(self) -> str:
+        definitions = []
+        sync_methods = []
+        async_methods = []
+        method_names = set()
+        for name, procedure in sorted(self.rpc.procedures.items()):
+            method_name = to_method_name(name)
+            if method_name in method_names:
+                raise ValueError("non unique method name", method_name, name)
+            method_names.add(method_name)
+
+            in_annotation, out_annotation = self.procedure_types(procedure)
+            in_code = self.render_annotation(in_annotation)
+            out_code = self.render_annotation(out_annotation)
+            const_name = f"_{method_name.upper()}"
+            arguments = f'"{name}", {in_code}, {out_code}'
+            definition = f"{const_name} = ClientProcedure({arguments})\n"
+            if len(definition) > 80:
+                definition = (
+                    f"{const_name} = ClientProcedure(\n    {arguments}\n)\n"
+                )
+            definitions.append(definition)
+            sync_methods.append(
+                f"    def {method_name}(self, params: {in_code}) -> "
+                f"{out_code}:\n"
+                f"        return self._call({const_name}, params)\n"
+            )
+            async_methods.append(
+                f"    async def {method_name}(self, params: {in_code}) -> "
+                f"{out_code}:\n"
+                f"        return await self._call({const_name}, params)\n"
+            )
+
+        imports = []
+        module_to_names: MutableMapping[str, "list[str]"] = {}
+        for (module, name), local_name in self.imports.items():
+            module_to_names.setdefault(module, []).append(
+                name if name == local_name else f"{name} as {local_name}"
+            )
+        for module in sorted(module_to_names):
+            imports.append(
+                "from %s import %s\n"
+                % (module, ", ".join(sorted(module_to_names[module])))
+            )
+
+        return "".join(
+            [
+                '"""Python client of the rpc, generated by synclane."""\n\n',
+                *imports,
+                "\n\n",
+                "\n".join(definitions),
+                "\n\nclass Client(RpcClient):\n",
+                "\n".join(sync_methods) or "    pass\n",
+                "\n\nclass AsyncClient(AsyncRpcClient):\n",
+                "\n".join(async_methods) or "    pass\n",
+            ]
+        )
+
+    def write(self, filename):
+        """Writes the client module, unless it is up to date."""
+        data = self.to_code().encode("utf-8")
+        try:
+            with open(filename, "rb") as f:
+                is_up_to_date = f.read() == data
+        except OSError:
+            is_up_to_date = False
+        if not is_up_to_date:
+            dir_name = os.path.dirname(filename)
+            if dir_name:
+                os.makedirs(dir_name, exist_ok=True)
+            atomic_write(filename, data)
+            self.changed_filenames.append(filename)
+        return filename
@@ -0,0 +1,64 @@
+"""Defines opt-in types with alternative wire encodings."""
+
+from datetime import date, datetime, timedelta, timezone
+
+from pydantic_core import core_schema
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+ONE_MS = timedelta(milliseconds=1)
+
+
+def datetime_to_epoch_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // ONE_MS
+
+
+def epoch_ms_to_datetime(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return EPOCH + timedelta(milliseconds=value)
+    return value
+
+
+def date_to_day_number(value: date) -> int:
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def day_number_to_date(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return date.fromordinal(value + EPOCH_ORDINAL)
+    return value
+
+
+class EpochDatetime(datetime):
+    """datetime, which is passed over the wire as epoch milliseconds.
+
+    Naive datetimes are considered to be in UTC; integers are validated to
+    aware datetime instances.
+    """
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        return core_schema.no_info_before_validator_function(
+            epoch_ms_to_datetime,
+            core_schema.datetime_schema(),
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                datetime_to_epoch_ms, when_used="json"
+            ),
+        )
+
+
+class DayNumberDate(date):
+    """date, which is passed over the wire as days since 1970-01-01."""
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        return core_schema.no_info_before_validator_function(
+            day_number_to_date,
+            core_schema.date_schema(),
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                date_to_day_number, when_used="json"
+            ),
+        )
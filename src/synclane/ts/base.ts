@@ -10,6 +10,13 @@ export const dateToStr = (d: Date): string => {
         .toISOString()
         .split("T")[0];
 }
+const MS_IN_DAY: number = 86400000;
+export const dayNumberToDate = (n: number): Date => {
+    return new Date(1970, 0, 1 + n);
+}
+export const dateToDayNumber = (d: Date): number => {
+    return Date.UTC(d.getFullYear(), d.getMonth(), d.getDate()) / MS_IN_DAY;
+}
 export const setHeaders = (
     headersInit: HeadersInit,
     headersToSet: Record<string, string>,
@@ -35,77 +42,487 @@ interface RpcConfig {
     url?: string;
     initFetch?: (init: RequestInit) => RequestInit;
     readResponse?: (response: Response) => void;
+    // builds the error, which calls with invalid params are rejected with
+    makeValidationError?: (details: Array<ValidationErrorDetail>) => any;
+    // max number of results in the client cache (1000 by default)
+    cacheMaxSize?: number;
+    // max number of requests in flight, the rest wait in a priority queue
+    maxInFlight?: number;
+    // reports durations of phases of every sent call
+    onTiming?: (timing: CallTiming) => void;
 }
 export let rpcConfig: RpcConfig = {};
+export interface ValidationErrorDetail {
+    type: string;
+    loc: Array<string | number>;
+    msg: string;
+    input: any;
+    ctx?: Record<string, any>;
+}
+export interface ProcedureOptions {
+    // call via GET with params in the url, so responses can be cached
+    query?: boolean;
+    // checks params before sending them, returns errors
+    validate?: (params: any) => Array<ValidationErrorDetail>;
+    // ms to serve results from the client cache
+    cacheTtl?: number;
+    // ms to serve stale results, while refetching them in background
+    cacheStaleWhileRevalidate?: number;
+    // default priority of calls, higher ones are sent first
+    priority?: number;
+}
+export interface CallOptions {
+    // the server runs calls with the same key (e.g. retries) only once, if
+    // the procedure has idempotency_scope
+    idempotencyKey?: string;
+    // overrides the priority of the procedure
+    priority?: number;
+}
+// ms spent on phases of a call: on the client & on the server (reported via
+// Server-Timing header: parse, permissions, validate, call, serialize)
+export interface CallTiming {
+    method: string;
+    build: number;
+    network: number;
+    parse: number;
+    convert: number;
+    server: Record<string, number>;
+}
+const now = (): number => {
+    return typeof performance !== "undefined" ? performance.now() : Date.now();
+}
+export const parseServerTiming = (
+    header: string | null,
+): Record<string, number> => {
+    const durations: Record<string, number> = {};
+    if (!header) {
+        return durations;
+    }
+    const metrics = header.split(",");
+    for (let i = 0; i < metrics.length; i++) {
+        const params = metrics[i].split(";");
+        const name = params[0].trim();
+        for (let j = 1; j < params.length; j++) {
+            const param = params[j].trim();
+            if (param.slice(0, 4) === "dur=") {
+                durations[name] = parseFloat(param.slice(4));
+            }
+        }
+    }
+    return durations;
+}
+export const newIdempotencyKey = (): string => {
+    if (typeof crypto !== "undefined" && crypto.randomUUID !== undefined) {
+        return crypto.randomUUID();
+    }
+    let key = "";
+    for (let i = 0; i < 4; i++) {
+        key += Math.random().toString(36).slice(2, 10);
+    }
+    return key;
+}
+// counts code points like python does, not UTF-16 code units
+export const strLength = (s: string): number => {
+    let length = s.length;
+    for (let i = 0; i < s.length; i++) {
+        const code = s.charCodeAt(i);
+        if (code >= 0xd800 && code <= 0xdbff) {
+            length--;
+            i++;
+        }
+    }
+    return length;
+}
+// like pydantic does for floats: within 1e-9 of a multiple
+export const isMultipleOf = (value: number, multipleOf: number): boolean => {
+    const multiple = Math.round(value / multipleOf) * multipleOf;
+    return Math.abs(value - multiple) <= 1e-9;
+}
+export const canonicalJson = (value: any): string => {
+    if (value === undefined || value === null) {
+        return "null";
+    }
+    if (typeof value !== "object") {
+        return JSON.stringify(value);
+    }
+    if (Array.isArray(value)) {
+        return "[" + value.map(canonicalJson).join(",") + "]";
+    }
+    const keys = Object.keys(value).sort();
+    const pieces: Array<string> = [];
+    for (let i = 0; i < keys.length; i++) {
+        const item = value[keys[i]];
+        if (item !== undefined) {
+            pieces.push(JSON.stringify(keys[i]) + ":" + canonicalJson(item));
+        }
+    }
+    return "{" + pieces.join(",") + "}";
+}
 
 export class AbortableRequest<T> {
     public $promise: Promise<T>;
+    // result served from the client cache synchronously (maybe stale)
+    public value: T | undefined;
+    public isCached: boolean;
     private controller: AbortController;
     public abort() { this.controller.abort(); }
 
-    constructor($promise: Promise<T>, controller: AbortController) {
+    constructor(
+        $promise: Promise<T>,
+        controller: AbortController,
+        isCached: boolean = false,
+        value?: T,
+    ) {
         this.$promise = $promise;
         this.controller = controller;
+        this.isCached = isCached;
+        this.value = value;
     }
 }
 let REQUEST_COUNTER = 1;
 const fetchAndPrepare = <U>(
     init: RequestInit,
     primitiveToResult: (data: any) => U,
+    query?: string,
+    timing?: CallTiming,
 ): Promise<U> => {
     return new Promise((resolve, reject) => {
         if (rpcConfig.url === undefined) {
             return reject("rpcConfig.url is not initialized");
         }
-        return fetch(rpcConfig.url, init)
+        let url = rpcConfig.url;
+        if (query !== undefined) {
+            url += (url.indexOf("?") === -1 ? "?" : "&") + query;
+        }
+        let startedAt = timing !== undefined ? now() : 0;
+        return fetch(url, init)
             .then((response) => {
                 if (rpcConfig.readResponse) {
                     rpcConfig.readResponse(response);
                 }
+                if (timing !== undefined) {
+                    const t = now();
+                    timing.network = t - startedAt;
+                    startedAt = t;
+                    timing.server = parseServerTiming(
+                        response.headers.get("Server-Timing"),
+                    );
+                }
                 return response.json();
             })
             .then(
                 (data) => {
+                    if (timing !== undefined) {
+                        const t = now();
+                        timing.parse = t - startedAt;
+                        startedAt = t;
+                    }
                     if (data.result === undefined) {
                         reject(data.error);
                     } else {
-                        resolve(primitiveToResult(data.result));
+                        const result = primitiveToResult(data.result);
+                        if (timing !== undefined) {
+                            timing.convert = now() - startedAt;
+                        }
+                        resolve(result);
+                    }
+                    if (timing !== undefined && rpcConfig.onTiming) {
+                        rpcConfig.onTiming(timing);
                     }
                 },
                 (err) => reject(err),
             );
     });
 }
-export const abortableFetch = <T, U>(
+const sendRequest = <U>(
     method: string,
-    params: T,
-    paramsToPrimitive: (params: T) => any,
+    primitiveParams: any,
     primitiveToResult: (data: any) => U,
-): AbortableRequest<U> => {
-    let controller = new AbortController();
+    options: ProcedureOptions | undefined,
+    callOptions: CallOptions | undefined,
+    controller: AbortController,
+    timing?: CallTiming,
+): Promise<U> => {
+    const startedAt = timing !== undefined ? now() : 0;
     let headers = new Headers();
     headers.set("Accept", "application/json");
-    headers.set("Content-Type", "application/json;charset=UTF-8");
-    let init: RequestInit = {
-        method: "POST",
-        headers: headers,
-        signal: controller.signal,
-        body: JSON.stringify({
-            id: REQUEST_COUNTER++,
-            method: method,
-            params: paramsToPrimitive(params),
-        }),
-    };
+    // browsers manage it on their own, node's fetch decompresses responses
+    headers.set("Accept-Encoding", "gzip, deflate");
+    let init: RequestInit;
+    let query: string | undefined;
+    if (options !== undefined && options.query) {
+        init = { method: "GET", headers: headers };
+        query = "method=" + encodeURIComponent(method)
+            + "&params=" + encodeURIComponent(canonicalJson(primitiveParams));
+    } else {
+        headers.set("Content-Type", "application/json;charset=UTF-8");
+        init = {
+            method: "POST",
+            headers: headers,
+            body: JSON.stringify({
+                id: REQUEST_COUNTER++,
+                method: method,
+                params: primitiveParams,
+                idempotency_key: callOptions !== undefined
+                    ? callOptions.idempotencyKey
+                    : undefined,
+            }),
+        };
+    }
 
     init.signal = controller.signal;
     if (rpcConfig && rpcConfig.initFetch !== undefined) {
         init = rpcConfig.initFetch(init);
     }
+    if (timing !== undefined) {
+        timing.build += now() - startedAt;
+    }
+    return fetchAndPrepare(init, primitiveToResult, query, timing);
+}
 
-    return new AbortableRequest<U>(
-        fetchAndPrepare(init, primitiveToResult),
+// requests waiting for rpcConfig.maxInFlight, FIFO within a priority
+interface QueuedRequest {
+    priority: number;
+    start: () => void;
+}
+const QUEUE: Array<QueuedRequest> = [];
+let IN_FLIGHT = 0;
+const makeAbortError = () => new DOMException(
+    "The operation was aborted.",
+    "AbortError",
+);
+const runQueued = () => {
+    while (
+        QUEUE.length > 0
+        && (rpcConfig.maxInFlight === undefined
+            || IN_FLIGHT < rpcConfig.maxInFlight)
+    ) {
+        let next = 0;
+        for (let i = 1; i < QUEUE.length; i++) {
+            if (QUEUE[i].priority > QUEUE[next].priority) {
+                next = i;
+            }
+        }
+        QUEUE.splice(next, 1)[0].start();
+    }
+}
+const schedule = <U>(
+    priority: number,
+    controller: AbortController,
+    send: () => Promise<U>,
+): Promise<U> => {
+    return new Promise<U>((resolve, reject) => {
+        if (controller.signal.aborted) {
+            return reject(makeAbortError());
+        }
+        const done = () => {
+            IN_FLIGHT--;
+            runQueued();
+        };
+        const queued: QueuedRequest = {
+            priority: priority,
+            start: () => {
+                IN_FLIGHT++;
+                send().then(
+                    (value) => { done(); resolve(value); },
+                    (err) => { done(); reject(err); },
+                );
+            },
+        };
+        // aborted while queued: dropped without ever being sent
+        controller.signal.addEventListener("abort", () => {
+            const index = QUEUE.indexOf(queued);
+            if (index !== -1) {
+                QUEUE.splice(index, 1);
+                reject(makeAbortError());
+            }
+        });
+        QUEUE.push(queued);
+        runQueued();
+    });
+}
+
+// a request shared by identical calls, aborted once all of them abort
+interface SharedRequest<U> {
+    promise: Promise<U>;
+    controller: AbortController;
+    users: number;
+}
+interface CacheEntry {
+    value: any;
+    hasValue: boolean;
+    storedAt: number;
+    inFlight?: SharedRequest<any>;
+}
+const CACHE: Map<string, CacheEntry> = new Map();
+const shareRequest = <U>(shared: SharedRequest<U>): AbortableRequest<U> => {
+    const controller = new AbortController();
+    shared.users++;
+    const promise = new Promise<U>((resolve, reject) => {
+        shared.promise.then(resolve, reject);
+        controller.signal.addEventListener("abort", () => {
+            reject(makeAbortError());
+            if (--shared.users === 0) {
+                shared.controller.abort();
+            }
+        });
+    });
+    return new AbortableRequest<U>(promise, controller);
+}
+const startCachedRequest = <U>(
+    key: string,
+    entry: CacheEntry,
+    send: (controller: AbortController) => Promise<U>,
+    users: number,
+): SharedRequest<U> => {
+    const controller = new AbortController();
+    const shared: SharedRequest<U> = {
+        promise: send(controller),
+        controller: controller,
+        users: users,
+    };
+    entry.inFlight = shared;
+    shared.promise.then(
+        (value) => {
+            entry.inFlight = undefined;
+            // unless invalidated meanwhile
+            if (CACHE.get(key) === entry) {
+                entry.value = value;
+                entry.hasValue = true;
+                entry.storedAt = Date.now();
+            }
+        },
+        () => {
+            entry.inFlight = undefined;
+            if (!entry.hasValue && CACHE.get(key) === entry) {
+                CACHE.delete(key);
+            }
+        },
+    );
+    return shared;
+}
+const cachedFetch = <U>(
+    method: string,
+    primitiveParams: any,
+    send: (controller: AbortController) => Promise<U>,
+    ttl: number,
+    staleWhileRevalidate: number,
+): AbortableRequest<U> => {
+    const key = method + ":" + canonicalJson(primitiveParams);
+    let entry = CACHE.get(key);
+    if (entry !== undefined && entry.hasValue) {
+        const age = Date.now() - entry.storedAt;
+        if (age < ttl + staleWhileRevalidate) {
+            if (age >= ttl && entry.inFlight === undefined) {
+                // revalidated in background, never aborted
+                startCachedRequest(key, entry, send, 1);
+            }
+            return new AbortableRequest<U>(
+                Promise.resolve(entry.value),
+                new AbortController(),
+                true,
+                entry.value,
+            );
+        }
+    }
+    if (entry === undefined) {
+        const maxSize = rpcConfig.cacheMaxSize !== undefined
+            ? rpcConfig.cacheMaxSize
+            : 1000;
+        while (CACHE.size >= maxSize && CACHE.size > 0) {
+            CACHE.delete(CACHE.keys().next().value as string);
+        }
+        entry = { value: undefined, hasValue: false, storedAt: 0 };
+        CACHE.set(key, entry);
+    }
+    const shared = entry.inFlight !== undefined
+        ? entry.inFlight
+        : startCachedRequest(key, entry, send, 0);
+    return shareRequest(shared);
+}
+// drops cached results of a procedure (e.g. "GetUser") or all of them
+export const invalidateCache = (procedureName?: string) => {
+    if (procedureName === undefined) {
+        CACHE.clear();
+        return;
+    }
+    const prefix = procedureName + ":";
+    const keys: Array<string> = [];
+    CACHE.forEach((_, key) => {
+        if (key.slice(0, prefix.length) === prefix) {
+            keys.push(key);
+        }
+    });
+    for (let i = 0; i < keys.length; i++) {
+        CACHE.delete(keys[i]);
+    }
+}
+export const abortableFetch = <T, U>(
+    method: string,
+    params: T,
+    paramsToPrimitive: (params: T) => any,
+    primitiveToResult: (data: any) => U,
+    options?: ProcedureOptions,
+    callOptions?: CallOptions,
+): AbortableRequest<U> => {
+    const startedAt = rpcConfig.onTiming !== undefined ? now() : 0;
+    if (options !== undefined && options.validate !== undefined) {
+        const details = options.validate(params);
+        if (details.length > 0) {
+            const error = rpcConfig.makeValidationError !== undefined
+                ? rpcConfig.makeValidationError(details)
+                : {
+                    code: -32600,
+                    message: "Validation error",
+                    details: details,
+                };
+            return new AbortableRequest<U>(
+                Promise.reject(error),
+                new AbortController(),
+            );
+        }
+    }
+    const primitiveParams = paramsToPrimitive(params);
+    const timing: CallTiming | undefined = rpcConfig.onTiming !== undefined
+        ? {
+            method: method,
+            build: now() - startedAt,
+            network: 0,
+            parse: 0,
+            convert: 0,
+            server: {},
+        }
+        : undefined;
+    let priority = 0;
+    if (callOptions !== undefined && callOptions.priority !== undefined) {
+        priority = callOptions.priority;
+    } else if (options !== undefined && options.priority !== undefined) {
+        priority = options.priority;
+    }
+    const send = (controller: AbortController) => schedule(
+        priority,
         controller,
+        () => sendRequest(
+            method,
+            primitiveParams,
+            primitiveToResult,
+            options,
+            callOptions,
+            controller,
+            timing,
+        ),
     );
+    if (options !== undefined && options.cacheTtl !== undefined) {
+        return cachedFetch(
+            method,
+            primitiveParams,
+            send,
+            options.cacheTtl,
+            options.cacheStaleWhileRevalidate || 0,
+        );
+    }
+    const controller = new AbortController();
+    return new AbortableRequest<U>(send(controller), controller);
 }
 
 // ===========================================================================
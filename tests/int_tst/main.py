@@ -12,6 +12,7 @@ from synclane import (
     AbstractAsyncRpc,
     AbstractProcedure,
     AbstractRpc,
+    ResponseCompressor,
 )
 
 
@@ -44,6 +45,10 @@ def is_authorized(context):
 
 class GetUser(AbstractProcedure):
     PERMISSIONS = (is_authorized,)
+    # called via GET, so browsers can cache it for a minute (privately, as it
+    # depends on the caller)
+    QUERY = True
+    QUERY_MAX_AGE = 60
 
     def call(self, in_: GetObjectParams, context) -> UserDetails:
         return UserDetails(
@@ -99,6 +104,9 @@ class UnauthorizedError(Exception):
 
 
 class Rpc(AbstractAsyncRpc):  # OR AbstractRpc for sync only procedures
+    # gzip/deflate responses of 100+ bytes as negotiated by Accept-Encoding
+    compressor = ResponseCompressor(min_size=100, level=6)
+
     def prepare_exception(self, raw_data, context, exc):
         # it can be anything, but the below tries to adhere to
         # https://www.jsonrpc.org/specification
@@ -126,9 +134,8 @@ class Rpc(AbstractAsyncRpc):  # OR AbstractRpc for sync only procedures
 
 rpc = Rpc().register(GetUsers, GetUser)
 
-
-# dump TypeScript client
-rpc.ts_dump("src/out.ts")
+# TypeScript client is exported out of the server process:
+#   python -m synclane export main:rpc src/out.ts [--watch]
 # --8<-- [end:def_rpc]
 
 
@@ -153,9 +160,11 @@ from django.http import HttpResponse
 
 
 async def index(request):
+    response = await rpc.call_http_async(
+        request.body, request, request.headers, request.method, request.GET
+    )
     return HttpResponse(
-        await rpc.call_async(request.body, request),
-        content_type="application/json",
+        response.body, status=response.status, headers=response.headers
     )
 
 
@@ -167,9 +176,11 @@ from django.http import HttpResponse
 
 
 def index(request):
+    response = rpc.call_http(
+        request.body, request, request.headers, request.method, request.GET
+    )
     return HttpResponse(
-        rpc.call(request.body, request),
-        content_type="application/json",
+        response.body, status=response.status, headers=response.headers
     )
 
 
@@ -192,14 +203,19 @@ from fastapi import FastAPI, Request, Response
 app_fast_api = FastAPI()
 
 
-@app_fast_api.post("/")
+@app_fast_api.api_route("/", methods=["GET", "POST"])
 async def read_root(request: Request):
+    response = await rpc.call_http_async(
+        await request.body(),  # always full body as is
+        request,  # anything to be passed to procedures as context
+        request.headers,  # to negotiate compression
+        request.method,  # GET is used by QUERY procedures
+        request.query_params,
+    )
     return Response(
-        await rpc.call_async(
-            await request.body(),  # always full body as is
-            request,  # anything to be passed to procedures as context
-        ),
-        media_type="application/json",
+        response.body,
+        status_code=response.status,
+        headers=response.headers,
     )
 
 
@@ -212,14 +228,19 @@ from fastapi import FastAPI, Request, Response
 app_fast_api = FastAPI()
 
 
-@app_fast_api.post("/")
+@app_fast_api.api_route("/", methods=["GET", "POST"])
 async def read_root(request: Request):
+    response = rpc.call_http(
+        await request.body(),  # always full body as is
+        request,  # anything to be passed to procedures as context
+        request.headers,  # to negotiate compression
+        request.method,  # GET is used by QUERY procedures
+        request.query_params,
+    )
     return Response(
-        rpc.call(
-            await request.body(),  # always full body as is
-            request,  # anything to be passed to procedures as context
-        ),
-        media_type="application/json",
+        response.body,
+        status_code=response.status,
+        headers=response.headers,
     )
 
 
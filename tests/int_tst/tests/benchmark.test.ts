@@ -0,0 +1,125 @@
+import {
+    callGetUsers,
+    dateToDayNumber,
+    dateToStr,
+    dayNumberToDate,
+    rpcConfig,
+    strToDate,
+} from "../src/out";
+
+const SIZE = 100000;
+
+const measure = (name: string, func: () => void): number => {
+    func(); // warm up
+    const started = performance.now();
+    func();
+    const elapsed = performance.now() - started;
+    console.log(`${name}: ${elapsed.toFixed(2)}ms per ${SIZE} items`);
+    return elapsed;
+}
+
+test("benchmark: ISO vs numeric dates", () => {
+    const now = Date.now();
+    const isoDatetimes: Array<string> = [];
+    const epochDatetimes: Array<number> = [];
+    const isoDates: Array<string> = [];
+    const dayNumbers: Array<number> = [];
+    for (let i = 0; i < SIZE; i++) {
+        const dt = new Date(now - i * 3600000);
+        isoDatetimes.push(dt.toISOString());
+        epochDatetimes.push(dt.getTime());
+        isoDates.push(dateToStr(dt));
+        dayNumbers.push(dateToDayNumber(dt));
+    }
+    const out: Array<Date> = new Array(SIZE);
+
+    measure("datetime from ISO string", () => {
+        for (let i = 0; i < SIZE; i++) { out[i] = new Date(isoDatetimes[i]); }
+    });
+    measure("datetime from epoch ms", () => {
+        for (let i = 0; i < SIZE; i++) { out[i] = new Date(epochDatetimes[i]); }
+    });
+    measure("date from ISO string", () => {
+        for (let i = 0; i < SIZE; i++) { out[i] = strToDate(isoDates[i]); }
+    });
+    measure("date from day number", () => {
+        for (let i = 0; i < SIZE; i++) { out[i] = dayNumberToDate(dayNumbers[i]); }
+    });
+    measure("date to ISO string", () => {
+        for (let i = 0; i < SIZE; i++) { isoDates[i] = dateToStr(out[i]); }
+    });
+    measure("date to day number", () => {
+        for (let i = 0; i < SIZE; i++) { dayNumbers[i] = dateToDayNumber(out[i]); }
+    });
+
+    for (let i = 0; i < SIZE; i += 997) {
+        expect(dayNumberToDate(dayNumbers[i])).toEqual(strToDate(isoDates[i]));
+    }
+});
+
+test("benchmark: for-in vs indexed loops", async () => {
+    const users: Array<any> = new Array(SIZE);
+    const now = Date.now();
+    for (let i = 0; i < SIZE; i++) {
+        const dt = new Date(now - i * 3600000);
+        users[i] = {
+            uid: "4eeb24a4-ecc1-4d9a-a43c-7263c6c60a07",
+            name: "John",
+            created: dt.toISOString(),
+            dob: dateToStr(dt),
+            access_level: 1,
+        };
+    }
+    const body = JSON.stringify({
+        id: 1,
+        result: { has_next: true, has_prev: false, data: users },
+    });
+
+    // the shape of converters generated before indexed loops were introduced
+    const forInToResult = (data: any): any => {
+        for (var i in data.data) {
+            data.data[i].created = new Date(data.data[i].created);
+            data.data[i].dob = strToDate(data.data[i].dob);
+        }
+        return data;
+    };
+    const indexedToResult = (data: any): any => {
+        for (let i = 0; i < data.data.length; i++) {
+            data.data[i].created = new Date(data.data[i].created);
+            data.data[i].dob = strToDate(data.data[i].dob);
+        }
+        return data;
+    };
+
+    const parse = measure("JSON.parse", () => {
+        JSON.parse(body);
+    });
+    const forIn = measure("JSON.parse + for-in loop", () => {
+        forInToResult(JSON.parse(body).result);
+    }) - parse;
+    const indexed = measure("JSON.parse + indexed loop", () => {
+        indexedToResult(JSON.parse(body).result);
+    }) - parse;
+    console.log(`indexed loop is ${(forIn / indexed).toFixed(2)}x faster`);
+
+    // end to end: response parsing and the generated converter
+    const originalFetch = global.fetch;
+    rpcConfig.url = "http://benchmark";
+    global.fetch = () => Promise.resolve(new Response(body));
+    try {
+        const started = performance.now();
+        const result = await callGetUsers({ page: 1 }).$promise;
+        const elapsed = performance.now() - started;
+        console.log(`callGetUsers: ${elapsed.toFixed(2)}ms per ${SIZE} items`);
+        expect(result.data.length).toEqual(SIZE);
+        expect(result.data[SIZE - 1].created).toEqual(
+            new Date(users[SIZE - 1].created),
+        );
+        expect(result.data[SIZE - 1].dob).toEqual(
+            strToDate(users[SIZE - 1].dob),
+        );
+    } finally {
+        global.fetch = originalFetch;
+        rpcConfig.url = undefined;
+    }
+});
@@ -0,0 +1,75 @@
+from datetime import date
+from typing import List
+
+from pydantic import BaseModel
+
+from synclane import AbstractProcedure, TsExporter
+
+from .base import rpc_cls
+
+
+def make_procedures(count, lazy=False):
+    class Address(BaseModel):
+        city: str
+        moved_in: date
+
+    class UserDetails(BaseModel):
+        uid: str
+        addresses: List[Address]
+        previous: List[Address]
+
+    class Page(BaseModel):
+        users: List[UserDetails]
+        admins: List[UserDetails]
+
+    procedures = []
+    for index in range(count):
+
+        class GetPage(AbstractProcedure):
+            LAZY = lazy
+
+            def call(self, in_: UserDetails, context) -> Page:
+                pass
+
+        GetPage.name = f"GetPage{index}"
+        procedures.append(GetPage)
+    return procedures
+
+
+def test_benchmark_export(benchmark, rpc_cls):
+    rpc = rpc_cls().register(*make_procedures(200))
+    benchmark(lambda: "".join(TsExporter(rpc).to_code_pieces()))
+
+
+def make_list_procedures(count, lazy=False):
+    """Defines procedures, whose types are wrapped into root models."""
+    procedures = []
+    for index in range(count):
+
+        class Row(BaseModel):
+            uid: str
+            created: date
+
+        class GetRows(AbstractProcedure):
+            LAZY = lazy
+
+            def call(self, in_: List[str], context) -> List[Row]:
+                pass
+
+        GetRows.name = f"GetRows{index}"
+        procedures.append(GetRows)
+    return procedures
+
+
+def test_benchmark_startup(benchmark):
+    benchmark(lambda: make_list_procedures(50))
+
+
+def test_benchmark_lazy_startup(benchmark):
+    benchmark(lambda: make_list_procedures(50, lazy=True))
+
+
+def test_benchmark_warm(benchmark, rpc_cls):
+    benchmark(
+        lambda: rpc_cls().register(*make_list_procedures(50, lazy=True)).warm()
+    )
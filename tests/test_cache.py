@@ -0,0 +1,298 @@
+import gzip
+import json
+import os
+import time
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+
+from synclane import (
+    AbstractAsyncProcedure,
+    AbstractProcedure,
+    ResponseCompressor,
+    SharedResultCache,
+)
+from synclane._cache import FILE_HEADER_SIZE, SEQ
+
+from .base import rpc_async_cls, rpc_cls
+
+
+def test_shared_result_cache(tmp_path):
+    path = str(tmp_path / "results.cache")
+    cache = SharedResultCache(path, sets=1, ways=2, slot_size=64)
+    assert cache.get(b"a") is None
+    assert cache.set(b"a", b"1", 10)
+    assert cache.set(b"b", b"22", 10)
+    assert cache.get(b"a") == b"1"
+    assert cache.get(b"b") == b"22"
+    assert cache.set(b"b", b"2", 10)
+    assert cache.get(b"b") == b"2"
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    # doesn't fit into a slot
+    assert not cache.set(b"c", b"x" * 25, 10)
+
+    # the least recently used one is evicted
+    cache.get(b"a")
+    assert cache.set(b"c", b"3", 10)
+    assert cache.get(b"b") is None
+    assert cache.get(b"a") == b"1"
+    assert cache.get(b"c") == b"3"
+
+    # expired ones are evicted first
+    assert cache.set(b"a", b"1", -1)
+    assert cache.get(b"a") is None
+    assert cache.set(b"d", b"4", 10)
+    assert cache.get(b"c") == b"3"
+
+    # shared by processes
+    pid = os.fork()
+    if pid == 0:
+        child_cache = SharedResultCache(path, sets=1, ways=2, slot_size=64)
+        child_cache.set(b"e", b"5", 10)
+        os._exit(0 if child_cache.get(b"c") == b"3" else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert cache.get(b"e") == b"5"
+
+    # a writer crashed: its slot stays odd, so readers skip it until the
+    # next write of the slot
+    def get_seqs():
+        return sorted(
+            SEQ.unpack_from(cache._mm, FILE_HEADER_SIZE + index * 64)[0]
+            for index in range(2)
+        )
+
+    for index in range(2):
+        SEQ.pack_into(cache._mm, FILE_HEADER_SIZE + index * 64, 7)
+    assert cache.get(b"e") is None
+    assert cache.get(b"c") is None
+    assert cache.set(b"e", b"6", 10)
+    assert get_seqs() == [7, 8]
+    assert cache.get(b"e") == b"6"
+
+    cache.clear()
+    assert get_seqs() == [8, 10]
+    assert cache.get(b"e") is None
+    cache.close()
+
+    with pytest.raises(ValueError):
+        SharedResultCache(path, sets=2, ways=2, slot_size=64)
+
+
+@pytest.mark.asyncio
+async def test_cached_results(rpc_cls, rpc_async_cls, tmp_path):
+    calls = []
+    permission_checks = []
+
+    def permission(context):
+        permission_checks.append(context)
+        if context == "anonymous":
+            raise PermissionError
+
+    class Row(BaseModel):
+        a: int
+
+    class GetRows(AbstractProcedure):
+        PERMISSIONS = [permission]
+        RESULT_CACHE_TTL = 60
+        RESULT_CHUNK_SIZE = 2
+
+        def call(self, in_: int, context) -> List[Row]:
+            calls.append(in_.root)
+            return [Row(a=i) for i in range(in_.root)]
+
+    class GetUserRow(AbstractAsyncProcedure):
+        RESULT_CACHE_TTL = 60
+
+        async def call_async(self, in_: int, context) -> Row:
+            calls.append(context)
+            return Row(a=in_.root)
+
+        def result_cache_key(self, params, context):
+            if context is None:
+                return None
+            return f"{context}:{params}".encode()
+
+    class Rpc(rpc_cls):
+        result_cache = SharedResultCache(str(tmp_path / "rpc.cache"))
+
+    class AsyncRpc(rpc_async_cls):
+        result_cache = Rpc.result_cache
+
+    rpc = Rpc().register(GetRows)
+    for _ in range(2):
+        assert json.loads(
+            rpc.call({"id": 1, "method": "GetRows", "params": 3}, "user")
+        ) == {
+            "jsonrpc": "2.0",
+            "result": [{"a": 0}, {"a": 1}, {"a": 2}],
+            "id": 1,
+        }
+    assert calls == [3]
+    assert permission_checks == ["user", "user"]
+
+    with pytest.raises(PermissionError):
+        rpc.call({"id": 1, "method": "GetRows", "params": 3}, "anonymous")
+
+    async_rpc = AsyncRpc().register(GetRows, GetUserRow)
+    body = {"id": 2, "method": "GetRows", "params": 3}
+    assert json.loads(await async_rpc.call_async(body, "user"))["id"] == 2
+    assert calls == [3]
+
+    calls.clear()
+    for context in ("u1", "u1", "u2", None, None):
+        body = {"id": 1, "method": "GetUserRow", "params": 5}
+        result = json.loads(await async_rpc.call_async(body, context))
+        assert result["result"] == {"a": 5}
+    assert calls == ["u1", "u2", None, None]
+
+    # idempotency keys of procedures without idempotency_scope don't bypass
+    # the cache
+    calls.clear()
+    for index in range(3):
+        body = {
+            "id": 1,
+            "method": "GetUserRow",
+            "params": 6,
+            "idempotency_key": f"k{index}",
+        }
+        await async_rpc.call_async(body, "u1")
+        rpc.call(dict(body, method="GetRows"), "user")
+    assert calls == ["u1", 6]
+
+    # cached results expire
+    GetRows.RESULT_CACHE_TTL = 0.01
+    rpc.call({"id": 1, "method": "GetRows", "params": 1}, "user")
+    time.sleep(0.02)
+    rpc.call({"id": 1, "method": "GetRows", "params": 1}, "user")
+    assert calls[-2:] == [1, 1]
+
+    # compression of cached results is memoized
+    rpc.compressor = ResponseCompressor(min_size=100)
+    body = {"id": 1, "method": "GetRows", "params": 30}
+    for _ in range(2):
+        response = rpc.call_http(body, "user", {"accept-encoding": "gzip"})
+        assert gzip.decompress(response.body) == rpc.call(body, "user")
+    assert len(rpc.compressor._cache) == 1
+
+    async_rpc.compressor = ResponseCompressor(min_size=100)
+    for _ in range(2):
+        response = await async_rpc.call_http_async(
+            body, "user", {"accept-encoding": "gzip"}
+        )
+        assert gzip.decompress(response.body) == rpc.call(body, "user")
+    assert len(async_rpc.compressor._cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_idempotency_keys(rpc_cls, rpc_async_cls):
+    import asyncio
+    import threading
+
+    from synclane import IdempotencyStore
+
+    calls = []
+    release = threading.Event()
+
+    class CreateOrder(AbstractProcedure):
+        def call(self, in_: int, context) -> int:
+            calls.append(in_.root)
+            release.wait(5)
+            if in_.root < 0:
+                raise ValueError("negative")
+            return len(calls)
+
+        def idempotency_scope(self, context):
+            return context.encode()
+
+    class CreateOrderAsync(AbstractAsyncProcedure):
+        async def call_async(self, in_: int, context) -> int:
+            calls.append(in_.root)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        def idempotency_scope(self, context):
+            return b""
+
+    class Ping(AbstractProcedure):
+        def call(self, in_: int, context) -> int:
+            calls.append(in_.root)
+            return len(calls)
+
+    rpc = rpc_cls().register(CreateOrder, Ping)
+    # every rpc has its own store
+    assert rpc.idempotency_store is not rpc_cls().idempotency_store
+
+    def call(request_id, key, params=1, user="u1", method="CreateOrder"):
+        body = {"id": request_id, "method": method, "params": params}
+        if key is not None:
+            body["idempotency_key"] = key
+        return json.loads(rpc.call(body, user))
+
+    responses = {}
+    threads = [
+        threading.Thread(
+            target=lambda i=i: responses.__setitem__(i, call(i, "k1"))
+        )
+        for i in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert responses == {
+        i: {"jsonrpc": "2.0", "result": 1, "id": i} for i in range(3)
+    }
+    assert call(5, "k1") == {"jsonrpc": "2.0", "result": 1, "id": 5}
+    assert call(6, None)["result"] == 2
+    assert call(7, "k2")["result"] == 3
+
+    # errors are not stored
+    with pytest.raises(ValueError):
+        call(8, "k3", -1)
+    assert call(9, "k3", 1)["result"] == 5
+
+    # keys are scoped by user and can't be reused with other params
+    assert call(10, "k1", user="u2")["result"] == 6
+    assert call(11, "k1", 2) == {
+        "jsonrpc": "2.0",
+        "error": {
+            "code": -32602,
+            "message": "Idempotency key is reused with other params",
+        },
+        "id": 11,
+    }
+    assert calls[-1] == 1
+
+    # procedures without idempotency_scope ignore keys
+    assert call(12, "k4", method="Ping")["result"] == 7
+    assert call(13, "k4", method="Ping")["result"] == 8
+
+    class AsyncRpc(rpc_async_cls):
+        idempotency_store = IdempotencyStore(max_size=1, ttl=60)
+
+    async_rpc = AsyncRpc().register(CreateOrderAsync)
+    calls.clear()
+    body = {
+        "id": 1,
+        "method": "CreateOrderAsync",
+        "params": 1,
+        "idempotency_key": "k1",
+    }
+    results = await asyncio.gather(
+        *[async_rpc.call_async(body, None) for _ in range(3)]
+    )
+    assert [json.loads(result)["result"] for result in results] == [1, 1, 1]
+    # waiters' futures are dropped
+    assert [
+        idempotent_call._futures
+        for idempotent_call in AsyncRpc.idempotency_store._calls.values()
+    ] == [[]]
+
+    # the oldest keys are evicted
+    await async_rpc.call_async(dict(body, idempotency_key="k2"), None)
+    await async_rpc.call_async(body, None)
+    assert calls == [1, 1, 1]
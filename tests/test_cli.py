@@ -0,0 +1,89 @@
+import os
+import sys
+
+import pytest
+
+from synclane.__main__ import Watcher, main
+
+
+MODELS_CODE = """
+from pydantic import BaseModel
+
+
+class User(BaseModel):
+    name: str
+"""
+
+API_CODE = """
+from pydantic import ValidationError
+
+from synclane import AbstractProcedure, AbstractRpc
+
+from cli_test_models import User
+
+
+class Rpc(AbstractRpc):
+    def prepare_exception(self, raw_data, context, exc):
+        pass
+
+
+class UserGet(AbstractProcedure):
+    def call(self, in_: int, context) -> User:
+        pass
+
+
+rpc = Rpc().register(UserGet)
+"""
+
+
+@pytest.fixture
+def api_dir(tmp_path, monkeypatch):
+    with open(tmp_path / "cli_test_models.py", "w", encoding="utf-8") as f:
+        f.write(MODELS_CODE)
+    with open(tmp_path / "cli_test_api.py", "w", encoding="utf-8") as f:
+        f.write(API_CODE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    yield tmp_path
+    for module_name in ["cli_test_models", "cli_test_api"]:
+        sys.modules.pop(module_name, None)
+
+
+def test_export(api_dir, capsys):
+    filename = str(api_dir / "out.ts")
+    assert main(["export", "cli_test_api:rpc", filename]) == 0
+    with open(filename, encoding="utf-8") as f:
+        assert "export const callUserGet" in f.read()
+    assert f"updated {filename}" in capsys.readouterr().err
+
+    assert main(["export", "cli_test_api:rpc", filename]) == 0
+    assert capsys.readouterr().err == ""
+
+    assert main(["export", "cli_test_api:rpc", str(api_dir / "client")]) == 0
+    assert os.path.exists(api_dir / "client" / "procedures.ts")
+
+    with pytest.raises(ValueError):
+        main(["export", "cli_test_api", filename])
+
+
+def test_watch(api_dir):
+    filename = str(api_dir / "out.ts")
+    watcher = Watcher("cli_test_api:rpc", filename)
+    assert set(watcher.mtimes) == {"cli_test_models", "cli_test_api"}
+    assert watcher.check() == []
+
+    with open(api_dir / "cli_test_models.py", "w", encoding="utf-8") as f:
+        f.write(
+            "from datetime import date\n" + MODELS_CODE + "    dob: date\n"
+        )
+    stat = os.stat(api_dir / "cli_test_models.py")
+    os.utime(
+        api_dir / "cli_test_models.py",
+        ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9),
+    )
+    assert watcher.check() == [filename]
+    with open(filename, encoding="utf-8") as f:
+        code = f.read()
+    assert "export interface User {name: string, dob: Date}" in code
+    assert "data.dob = strToDate(data.dob)" in code
+    assert watcher.check() == []
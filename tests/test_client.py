@@ -0,0 +1,163 @@
+import asyncio
+import importlib.util
+import threading
+from datetime import datetime, timezone
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import pytest
+from pydantic import BaseModel, Field
+from typing_extensions import Annotated, Literal
+
+from synclane import (
+    AbstractAsyncProcedure,
+    AbstractProcedure,
+    EpochDatetime,
+    PyExporter,
+    RpcError,
+)
+
+from .base import rpc_async_cls
+
+
+# client models are imported, so they are defined at module level
+class Color(Enum):
+    RED = "red"
+    GREEN = "green"
+
+
+class UserParams(BaseModel):
+    uid: str
+    color: Optional[Color] = None
+
+
+class User(BaseModel):
+    uid: str
+    created: EpochDatetime
+    kind: Literal["user", "admin"]
+    tags: List[str] = []
+
+
+def serve(rpc):
+    """Serves an rpc over HTTP/1.1 with keep-alive, counting connections."""
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            connections.append(self.client_address)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            response = asyncio.run(
+                rpc.call_http_async(
+                    body,
+                    None,
+                    {"accept-encoding": self.headers.get("Accept-Encoding")},
+                )
+            )
+            body = response.body
+            self.send_response(response.status)
+            for name, value in response.headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, connections
+
+
+@pytest.mark.asyncio
+async def test_python_client(rpc_async_cls, tmp_path):
+    created = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+    class GetUser(AbstractProcedure):
+        def call(self, in_: UserParams, context) -> User:
+            return User(uid=in_.uid, created=created, kind="user")
+
+    class ListTags(AbstractAsyncProcedure):
+        async def call_async(
+            self, in_: Annotated[int, Field(ge=0)], context
+        ) -> List[str]:
+            return [f"tag{i}" for i in range(in_.root)]
+
+    class GetColor(AbstractProcedure):
+        def call(self, in_: Color, context) -> Optional[Color]:
+            return None if in_.root is Color.RED else in_.root
+
+    rpc = rpc_async_cls().register(GetUser, ListTags, GetColor)
+    filename = str(tmp_path / "client.py")
+    assert rpc.py_dump(filename) == filename
+    with open(filename, encoding="utf-8") as f:
+        code = f.read()
+    assert (
+        "from synclane import AsyncRpcClient, ClientProcedure, RpcClient\n"
+        in code
+    )
+    assert "from tests.test_client import Color, User, UserParams\n" in code
+    assert (
+        "    def get_user(self, params: UserParams) -> User:\n"
+        "        return self._call(_GET_USER, params)\n"
+    ) in code
+    assert (
+        "    async def list_tags(self, params: int) -> List[str]:\n"
+    ) in code
+    assert "-> Optional[Color]:" in code
+
+    exporter = PyExporter(rpc)
+    exporter.write(filename)
+    assert exporter.changed_filenames == []
+
+    spec = importlib.util.spec_from_file_location("client", filename)
+    client_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(client_module)
+
+    server, connections = serve(rpc)
+    url = "http://127.0.0.1:%d/rpc" % server.server_address[1]
+    try:
+        with client_module.Client(url) as client:
+            user = client.get_user(UserParams(uid="u1", color=Color.GREEN))
+            assert user == User(uid="u1", created=created, kind="user")
+            # gzipped response
+            assert len(client.list_tags(300)) == 300
+            assert client.get_color(Color.RED) is None
+            assert client.get_color(Color.GREEN) is Color.GREEN
+            with pytest.raises(RpcError) as exc_info:
+                client.list_tags(-1)
+            assert exc_info.value.code == -32600
+            assert client.transport.connections_opened == 1
+        assert len(connections) == 1
+
+        async with client_module.AsyncClient(url) as client:
+            results = await asyncio.gather(
+                *[client.list_tags(i) for i in range(3)]
+            )
+            assert results == [[], ["tag0"], ["tag0", "tag1"]]
+            assert client.transport.connections_opened == 3
+            user = await client.get_user(UserParams(uid="u2"))
+            assert user.uid == "u2"
+            assert len(await client.list_tags(300)) == 300
+            assert client.transport.connections_opened == 3
+        assert len(connections) == 4
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    class LocalParams(BaseModel):
+        uid: str
+
+    class GetLocal(AbstractProcedure):
+        def call(self, in_: LocalParams, context) -> int:
+            pass
+
+    with pytest.raises(ValueError):
+        PyExporter(rpc_async_cls().register(GetLocal)).to_code()
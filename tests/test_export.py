@@ -1,4 +1,5 @@
 import json
+import os
 import sys
 from datetime import date, datetime
 from decimal import Decimal
@@ -13,9 +14,11 @@ from synclane import (
     AbstractAsyncProcedure,
     AbstractProcedure,
     AbstractRpc,
+    DayNumberDate,
+    EpochDatetime,
     ProcedureNotFound,
 )
-from synclane._export import TsExporter
+from synclane._export import PydanticModelHandler, TsExporter
 
 from .base import check_ts, dumb_rpc_cls, rpc_async_cls, rpc_cls
 
@@ -102,7 +105,7 @@ def test_export_types_to_ts(rpc_cls):
             exporter.root_ts_to_primitive(type_, "x", "x")
 
 
-def test_complex_export_ts(rpc_cls):
+def test_complex_export_ts(rpc_cls, tmp_path):
     T = TypeVar("T")
 
     class UserParams(BaseModel):
@@ -120,6 +123,8 @@ def test_complex_export_ts(rpc_cls):
         tuple_variadic: Tuple[str, ...]
         mapping: Dict[int, str]
         mapping2: Dict[int, date]
+        epoch_created: EpochDatetime
+        day_numbers: List[DayNumberDate]
 
     class Tag(BaseModel, Generic[T]):
         tag_name: str
@@ -136,6 +141,8 @@ def test_complex_export_ts(rpc_cls):
         list_simple: List[T]
         mapping: Dict[int, str]
         mapping2: Dict[int, date]
+        epoch_created: Optional[EpochDatetime]
+        day_number: DayNumberDate
 
     class UserDetails(BaseModel):
         uid: str
@@ -149,10 +156,10 @@ def test_complex_export_ts(rpc_cls):
 
     rpc = rpc_cls().register(GetUser)
 
-    assert check_ts(rpc.ts_dump("generated_output_complex.ts"))
+    assert check_ts(rpc.ts_dump(str(tmp_path / "complex.ts")))
 
 
-def test_simple_export_ts(rpc_async_cls):
+def test_simple_export_ts(rpc_async_cls, tmp_path):
     class Color(Enum):
         RED = 1
         GREEN = 2
@@ -171,4 +178,665 @@ def test_simple_export_ts(rpc_async_cls):
 
     rpc = rpc_async_cls().register(GetUser)
 
-    assert check_ts(rpc.ts_dump("generated_output_simple.ts"))
+    assert check_ts(rpc.ts_dump(str(tmp_path / "simple.ts")))
+
+
+def test_numeric_dates_export(rpc_cls):
+    exporter = TsExporter(rpc_cls())
+    for type_, to_primitive, to_ts in [
+        (datetime, "y = x.toISOString()", "y = new Date(x)"),
+        (EpochDatetime, "y = x.getTime()", "y = new Date(x)"),
+        (date, "y = dateToStr(x)", "y = strToDate(x)"),
+        (DayNumberDate, "y = dateToDayNumber(x)", "y = dayNumberToDate(x)"),
+    ]:
+        assert exporter.root_type_to_interface(type_) == "Date"
+        assert exporter.root_ts_to_primitive(type_, "x", "y").lines == [
+            to_primitive
+        ]
+        assert exporter.root_primitive_to_ts(type_, "x", "y").lines == [to_ts]
+
+
+def test_query_export(rpc_cls, tmp_path):
+    class GetUser(AbstractProcedure):
+        QUERY = True
+
+        def call(self, in_: int, context) -> str:
+            pass
+
+    class AddUser(AbstractProcedure):
+        def call(self, in_: str, context) -> int:
+            pass
+
+    class GetUsers(AbstractProcedure):
+        CLIENT_CACHE_TTL = 30
+        CLIENT_CACHE_SWR = 0.5
+        PRIORITY = -1
+
+        def call(self, in_: int, context) -> List[str]:
+            pass
+
+    rpc = rpc_cls().register(GetUser, AddUser, GetUsers)
+    code = "".join(TsExporter(rpc).to_code_pieces())
+    assert (
+        '("GetUser", params, _GetUserParamsToPrimitive, _GetUserPrimitiveToResult, {query: true}, callOptions)'
+        in code
+    )
+    assert (
+        "_GetUsersPrimitiveToResult, "
+        "{cacheTtl: 30000, cacheStaleWhileRevalidate: 500, priority: -1}, "
+        "callOptions)"
+    ) in code
+    assert (
+        '("AddUser", params, _AddUserParamsToPrimitive, _AddUserPrimitiveToResult, undefined, callOptions)'
+        in code
+    )
+    assert check_ts(rpc.ts_dump(str(tmp_path / "query.ts")))
+
+
+def test_export_memoization(rpc_cls):
+    T = TypeVar("T")
+
+    class Node(BaseModel):
+        name: str
+        children: List["Node"] = []
+
+    class Tree(BaseModel, Generic[T]):
+        value: T
+        children: List["Tree[T]"]
+
+    class Details(BaseModel):
+        created: date
+        pair: Tuple[date, int]
+
+    class Outer(BaseModel):
+        a: Details
+        b: Details
+        c: List[Details]
+
+    exporter = TsExporter(rpc_cls())
+    calls = []
+    model_to_def = PydanticModelHandler._model_to_def
+
+    def counting_model_to_def(self, exporter, type_):
+        calls.append(type_)
+        return model_to_def(self, exporter, type_)
+
+    PydanticModelHandler._model_to_def = counting_model_to_def
+    try:
+        assert exporter.root_type_to_interface(Outer) == "Outer"
+        assert exporter.root_type_to_interface(List[Outer]) == "Array<Outer>"
+        assert exporter.root_type_to_interface(Node) == "Node"
+        assert exporter.root_type_to_interface(Tree[int]) == "Tree<number>"
+    finally:
+        PydanticModelHandler._model_to_def = model_to_def
+
+    assert calls.count(Details) == 1
+    assert exporter.name_to_interface_def["Node"] == (
+        "{name: string, children?: Array<Node>}"
+    )
+    assert exporter.name_to_interface_def["Tree<T>"] == (
+        "{value: T, children: Array<Tree<T>>}"
+    )
+    assert exporter.name_to_interface_def["Outer"] == (
+        "{a: Details, b: Details, c: Array<Details>}"
+    )
+
+    code = exporter.root_ts_to_primitive(Outer, "src", "dest").get_joined()
+    assert code == "dest = _OuterToPrimitive(src)"
+    outer_def = exporter.converter_defs["_OuterToPrimitive"]
+    assert outer_def.count("_DetailsToPrimitive(") == 3
+    details_def = exporter.converter_defs["_DetailsToPrimitive"]
+    assert details_def.count("dest.created = dateToStr(src.created)") == 1
+    assert exporter.root_ts_to_primitive(
+        Tuple[Tuple[date, int], Tuple[date, int]], "x", "y"
+    ).lines == [
+        "y = new Array(2)",
+        "y[0] = new Array(2)",
+        "y[0][0] = dateToStr(x[0][0])",
+        "y[0][1] = x[0][1]",
+        "y[1] = new Array(2)",
+        "y[1][0] = dateToStr(x[1][0])",
+        "y[1][1] = x[1][1]",
+    ]
+    lines = exporter.root_ts_to_primitive(List[date], "x", "y").lines
+    assert lines[:2] == [
+        "y = new Array(x.length)",
+        "for (let {0} = 0; {0} < y.length; {0}++) {{".format(
+            lines[1].split()[2]
+        ),
+    ]
+    lines = exporter.root_primitive_to_ts(Dict[str, date], "x", "x").lines
+    assert lines[0].startswith("for (let ") and "Object.keys(x)" in lines[0]
+
+    assert exporter.root_ts_to_primitive(Node, "x", "y").lines == ["y = x"]
+    assert exporter.root_primitive_to_ts(Node, "x", "x").lines == []
+    assert exporter.root_ts_to_primitive(Tree[int], "x", "y").lines == [
+        "y = x"
+    ]
+    assert exporter.root_ts_to_primitive(Tree[date], "x", "y").lines == [
+        "y = _Tree_DateToPrimitive(x)"
+    ]
+    tree_def = exporter.converter_defs["_Tree_DateToPrimitive"]
+    assert tree_def.startswith(
+        "const _Tree_DateToPrimitive = (src: Tree<Date>): any => {"
+    )
+    assert "_Tree_DateToPrimitive(src.children[i" in tree_def
+    assert "_PrimitiveToTree_Date" not in exporter.converter_defs
+
+    class Bad(BaseModel):
+        a: Decimal
+
+    for _ in range(2):
+        with pytest.raises(TypeError):
+            exporter.root_type_to_interface(Bad)
+
+
+def test_export_converters(rpc_cls, tmp_path):
+    T = TypeVar("T")
+
+    class Comment(BaseModel):
+        created: datetime
+        replies: List["Comment"] = []
+
+    class Thread(BaseModel, Generic[T]):
+        payload: T
+        comments: List[Comment]
+        related: Optional["Thread[T]"] = None
+
+    class Plain(BaseModel):
+        name: str
+        children: List["Plain"] = []
+
+    class GetThread(AbstractProcedure):
+        def call(self, in_: Thread[date], context) -> Thread[date]:
+            return in_
+
+    class GetThreads(AbstractProcedure):
+        def call(self, in_: Plain, context) -> List[Thread[date]]:
+            return []
+
+    rpc = rpc_cls().register(GetThread, GetThreads)
+    filename = rpc.ts_dump(str(tmp_path / "converters.ts"))
+    with open(filename, encoding="utf-8") as f:
+        code = f.read()
+
+    for name in [
+        "_CommentToPrimitive",
+        "_PrimitiveToComment",
+        "_Thread_DateToPrimitive",
+        "_PrimitiveToThread_Date",
+    ]:
+        assert code.count(f"const {name} = ") == 1
+    assert "_CommentToPrimitive(src.replies[" in code
+    assert "_PrimitiveToThread_Date(data.related)" in code
+    assert "ToPrimitive = (src: Plain)" not in code
+    assert "preparedParams = params" in code
+    assert check_ts(filename)
+
+    exporter = TsExporter(rpc)
+    assert exporter.root_ts_to_primitive(Comment, "x", "y").lines == [
+        "y = _CommentToPrimitive(x)"
+    ]
+    assert exporter.root_primitive_to_ts(Plain, "x", "x").lines == []
+
+    class Other(BaseModel):
+        created: datetime
+
+    Other.__name__ = "Comment"
+    assert exporter.root_ts_to_primitive(Other, "x", "y").lines == [
+        "y = _CommentToPrimitive2(x)"
+    ]
+
+
+def test_export_dir(rpc_cls, tmp_path):
+    class Address(BaseModel):
+        city: str
+        since: date
+
+    class User(BaseModel):
+        name: str
+        address: Address
+
+    class GetUser(AbstractProcedure):
+        NAMESPACE = "user"
+
+        def call(self, in_: int, context) -> User:
+            pass
+
+    class ListUsers(AbstractProcedure):
+        NAMESPACE = "user"
+
+        def call(self, in_: int, context) -> List[User]:
+            pass
+
+    class GetOrder(AbstractProcedure):
+        def call(self, in_: int, context) -> int:
+            pass
+
+    class Ping(AbstractProcedure):
+        def call(self, in_: str, context) -> str:
+            pass
+
+    rpc = rpc_cls().register(GetUser, ListUsers, GetOrder, Ping)
+    filenames = rpc.ts_dump_dir(str(tmp_path / "client"))
+    assert sorted(os.path.basename(filename) for filename in filenames) == [
+        "converters.ts",
+        "index.ts",
+        "procedures.ts",
+        "runtime.ts",
+        "types.ts",
+        "user.ts",
+    ]
+
+    def read(name):
+        with open(tmp_path / "client" / name, encoding="utf-8") as f:
+            return f.read()
+
+    user_code = read("user.ts")
+    assert user_code.startswith(
+        "import {AbortableRequest, CallOptions, abortableFetch} "
+        'from "./runtime";\n'
+        'import type {User} from "./types";\n'
+        'import {_PrimitiveToUser} from "./converters";\n'
+    )
+    assert "export const callGetUser" in user_code
+    assert "export const callListUsers" in user_code
+    assert "callGetOrder" not in user_code
+    assert read("converters.ts").startswith(
+        'import {strToDate} from "./runtime";\n'
+        'import type {Address, User} from "./types";\n'
+        "export const _PrimitiveToAddress = "
+    )
+    # not grouped by the first word of names
+    procedures_code = read("procedures.ts")
+    assert "export const callGetOrder" in procedures_code
+    assert "export const callPing" in procedures_code
+    assert "_PrimitiveTo" not in procedures_code
+    assert read("index.ts") == (
+        'export * from "./runtime";\n'
+        'export * from "./types";\n'
+        'export * from "./user";\n'
+        'export * from "./procedures";\n'
+    )
+    assert check_ts(str(tmp_path / "client" / "index.ts"))
+
+    class Bad(AbstractProcedure):
+        NAMESPACE = "types"
+
+        def call(self, in_: str, context) -> str:
+            pass
+
+    with pytest.raises(ValueError):
+        rpc_cls().register(Bad).ts_dump_dir(str(tmp_path / "bad"))
+
+
+def test_incremental_export(rpc_cls, tmp_path):
+    class Address(BaseModel):
+        city: str
+
+    class UserGet(AbstractProcedure):
+        def call(self, in_: int, context) -> Address:
+            pass
+
+    class OrderGet(AbstractProcedure):
+        NAMESPACE = "order"
+
+        def call(self, in_: int, context) -> str:
+            pass
+
+    filename = str(tmp_path / "out.ts")
+    rpc = rpc_cls().register(UserGet)
+    exporter = TsExporter(rpc)
+    name_to_code = {"out.ts": "".join(exporter.to_code_pieces())}
+    manifest_name = ".out.ts.synclane-manifest.json"
+
+    def write():
+        return exporter.write_files(str(tmp_path), name_to_code, manifest_name)
+
+    assert write() == ["out.ts"]
+    assert os.path.exists(tmp_path / manifest_name)
+    assert write() == []
+
+    mtime_ns = os.stat(filename).st_mtime_ns
+    assert rpc.ts_dump(filename) == filename
+    assert os.stat(filename).st_mtime_ns == mtime_ns
+
+    # without a manifest files are compared by content
+    other_filename = str(tmp_path / "other.ts")
+    for _ in range(2):
+        exporter.changed_filenames.clear()
+        exporter.write(other_filename, manifest=False)
+    assert exporter.changed_filenames == []
+    assert not os.path.exists(tmp_path / ".other.ts.synclane-manifest.json")
+
+    # edited by hand, so compared by content and restored
+    with open(filename, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert write() == ["out.ts"]
+    with open(filename, encoding="utf-8") as f:
+        assert f.read() == name_to_code["out.ts"]
+
+    dirname = tmp_path / "client"
+    rpc_cls().register(UserGet, OrderGet).ts_dump_dir(str(dirname))
+    mtimes = {
+        name: os.stat(dirname / name).st_mtime_ns
+        for name in os.listdir(dirname)
+    }
+    assert "order.ts" in mtimes
+
+    class UserGet(AbstractProcedure):
+        def call(self, in_: int, context) -> List[Address]:
+            pass
+
+    rpc_cls().register(UserGet).ts_dump_dir(str(dirname))
+    assert not os.path.exists(dirname / "order.ts")
+    for name in ["runtime.ts", "types.ts", "converters.ts"]:
+        assert os.stat(dirname / name).st_mtime_ns == mtimes[name]
+    for name in ["procedures.ts", "index.ts", ".synclane-manifest.json"]:
+        assert os.stat(dirname / name).st_mtime_ns != mtimes[name]
+    assert sorted(os.listdir(dirname)) == [
+        ".synclane-manifest.json",
+        "converters.ts",
+        "index.ts",
+        "procedures.ts",
+        "runtime.ts",
+        "types.ts",
+    ]
+
+
+def test_handler_dispatch(rpc_cls):
+    from synclane._export import (
+        CodeLines,
+        DateHandler,
+        EnumHandler,
+        SimpleTypeHandler,
+        TypeHandler,
+    )
+
+    class DecimalHandler(TypeHandler):
+        def type_to_interface(self, exporter, type_):
+            return "string"
+
+        def ts_to_primitive(self, exporter, type_, src, dest):
+            return CodeLines.naive(src, dest)
+
+        def primitive_to_ts(self, exporter, type_, src, dest):
+            return CodeLines.naive(src, dest)
+
+    class NeverHandler(DecimalHandler):
+        def type_to_interface(self, exporter, type_):
+            raise AssertionError("irrelevant handler is called")
+
+    class StrictDatetimeHandler(DecimalHandler):
+        def type_to_interface(self, exporter, type_):
+            return "string"
+
+    class Exporter(TsExporter):
+        pass
+
+    for index in range(100):
+        Exporter.register_handler(
+            NeverHandler(), keys=[("class", type(f"T{index}", (), {}))]
+        )
+    Exporter.register_handler(DecimalHandler(), keys=[("class", Decimal)])
+    Exporter.register_handler(
+        StrictDatetimeHandler(), keys=[("class", datetime)], priority=1
+    )
+    assert len(TsExporter.handlers) + 102 == len(Exporter.handlers)
+
+    class StrEnum(str, Enum):
+        A = "a"
+
+    exporter = Exporter(rpc_cls())
+    assert exporter.root_type_to_interface(Decimal) == "string"
+    assert exporter.root_type_to_interface(List[Decimal]) == "Array<string>"
+    assert exporter.root_type_to_interface(datetime) == "string"
+    assert exporter.root_type_to_interface(date) == "Date"
+    assert exporter.root_type_to_interface(StrEnum) == "StrEnum"
+    assert [type(handler) for handler in exporter.get_handlers(StrEnum)] == [
+        SimpleTypeHandler,
+        EnumHandler,
+    ]
+    assert [type(handler) for handler in exporter.get_handlers(datetime)] == [
+        StrictDatetimeHandler,
+        DateHandler,
+    ]
+    assert exporter.get_handlers(date) is exporter.get_handlers(date)
+
+    # handlers without keys are tried for every type
+    class AnyHandler(DecimalHandler):
+        def type_to_interface(self, exporter, type_):
+            return "unknown"
+
+    Exporter.handlers.append(AnyHandler())
+    exporter = Exporter(rpc_cls())
+    assert exporter.root_type_to_interface(complex) == "unknown"
+    assert exporter.root_type_to_interface(int) == "number"
+
+    # handlers without keys keep their precedence in the list
+    class StrDateHandler(TypeHandler):
+        def _is_supported(self, type_):
+            return isinstance(type_, type) and issubclass(type_, date)
+
+        def type_to_interface(self, exporter, type_):
+            if self._is_supported(type_):
+                return "string"
+
+        def ts_to_primitive(self, exporter, type_, src, dest):
+            if self._is_supported(type_):
+                return CodeLines.naive(src, dest)
+
+        def primitive_to_ts(self, exporter, type_, src, dest):
+            if self._is_supported(type_):
+                return CodeLines.naive(src, dest)
+
+    class OverridingExporter(TsExporter):
+        handlers = [StrDateHandler()] + TsExporter.handlers
+
+    class Event(BaseModel):
+        d: datetime
+
+    class GetEvent(AbstractProcedure):
+        def call(self, in_: int, context) -> Event:
+            pass
+
+    exporter = OverridingExporter(rpc_cls().register(GetEvent))
+    assert exporter.root_type_to_interface(datetime) == "string"
+    assert exporter.root_type_to_interface(int) == "number"
+    code = "".join(exporter.to_code_pieces())
+    assert "interface Event {d: string}" in code
+    # no converter, since nothing is converted
+    assert "_PrimitiveToEvent" not in code
+
+
+def test_discriminated_union_export(rpc_cls, tmp_path):
+    from pydantic import Field
+    from typing_extensions import Annotated
+
+    class Kind(Enum):
+        BIRD = "bird"
+
+    class Cat(BaseModel):
+        kind: Literal["cat"]
+        born: date
+
+    class Dog(BaseModel):
+        kind: Literal["dog", "puppy"]
+        name: str
+
+    class Bird(BaseModel):
+        kind: Literal[Kind.BIRD]
+        seen: datetime
+
+    Pet = Annotated[Union[Cat, Dog, Bird], Field(discriminator="kind")]
+
+    class Owner(BaseModel):
+        pet: Union[Cat, Dog] = Field(discriminator="kind")
+        pets: List[Pet]
+        previous: Optional[Union[Cat, Dog]] = Field(None, discriminator="kind")
+
+    class GetOwner(AbstractProcedure):
+        def call(self, in_: Owner, context) -> Owner:
+            return in_
+
+    class GetPets(AbstractProcedure):
+        def call(self, in_: List[Pet], context) -> List[Pet]:
+            return in_
+
+    rpc = rpc_cls().register(GetOwner, GetPets)
+    exporter = TsExporter(rpc)
+    assert exporter.root_type_to_interface(Owner) == "Owner"
+    assert exporter.name_to_interface_def["Owner"] == (
+        "{pet: Cat | Dog, pets: Array<Cat | Dog | Bird>, "
+        "previous?: Cat | Dog | undefined}"
+    )
+    assert exporter.root_primitive_to_ts(Pet, "x", "x").lines == [
+        "switch (x.kind) {",
+        'case "cat":',
+        "x = _PrimitiveToCat(x)",
+        "break;",
+        'case "bird":',
+        "x = _PrimitiveToBird(x)",
+        "break;",
+        "}",
+    ]
+    assert exporter.root_ts_to_primitive(Pet, "x", "y").lines == [
+        "switch (x.kind) {",
+        'case "cat":',
+        "y = _CatToPrimitive((x as Cat))",
+        "break;",
+        'case "bird":',
+        "y = _BirdToPrimitive((x as Bird))",
+        "break;",
+        "default:",
+        "y = x;",
+        "}",
+    ]
+
+    with pytest.raises(TypeError):
+        exporter.root_primitive_to_ts(
+            Annotated[Union[Cat, int], Field(discriminator="kind")], "x", "x"
+        )
+    with pytest.raises(TypeError):
+        exporter.root_type_to_interface(Union[Cat, Dog])
+
+    filename = rpc.ts_dump(str(tmp_path / "discriminated.ts"))
+    with open(filename, encoding="utf-8") as f:
+        code = f.read()
+    assert "switch (src.pet.kind) {" in code
+    assert 'case "dog":' not in code
+    assert check_ts(filename)
+
+
+def test_validators_export(rpc_cls, tmp_path):
+    from pydantic import Field, confloat, conint, conlist
+    from typing_extensions import Annotated
+
+    class Color(Enum):
+        RED = "red"
+        BLUE = "blue"
+
+    class Item(BaseModel):
+        name: constr(min_length=1, max_length=5, pattern=r"^(?P<a>x)")
+        qty: conint(gt=0, le=10)
+        price: Optional[float] = Field(None, ge=0.5)
+        step: confloat(multiple_of=0.1) = 0.1
+        tags: conlist(str, max_length=2) = []
+
+    class Node(BaseModel):
+        value: conint(ge=0)
+        children: List["Node"] = []
+
+    class Order(BaseModel):
+        items: List[Item]
+        color: Color
+        pair: Tuple[conint(gt=0), str]
+        tree: Optional[Node] = None
+        comment: str = ""
+
+    class CreateOrder(AbstractProcedure):
+        def call(self, in_: Order, context) -> int:
+            return 1
+
+    class Count(AbstractProcedure):
+        def call(self, in_: conint(multiple_of=2), context) -> int:
+            return in_
+
+    class Echo(AbstractProcedure):
+        def call(self, in_: str, context) -> str:
+            return in_
+
+    rpc = rpc_cls().register(CreateOrder, Count, Echo)
+    exporter = TsExporter(rpc, validate_params=True)
+    assert exporter.root_validate(str, "x").lines == []
+    assert exporter.root_validate(
+        Annotated[Optional[int], Field(lt=3)], "x", ('"a"',)
+    ).lines == [
+        "if (x !== undefined && x !== null) {",
+        "if (x >= 3) {",
+        'errors.push({type: "less_than", loc: loc.concat(["a"]), '
+        'msg: "Input should be less than 3", input: x, ctx: {lt: 3}})',
+        "}",
+        "}",
+    ]
+    assert exporter.root_validate(Color, "x").lines == [
+        'if (x !== "red" && x !== "blue") {',
+        'errors.push({type: "enum", loc: loc, '
+        "msg: \"Input should be 'red' or 'blue'\", input: x, "
+        "ctx: {expected: \"'red' or 'blue'\"}})",
+        "}",
+    ]
+    assert exporter.root_validate(Order, "x").lines == [
+        "_ValidateOrder(x, loc, errors)"
+    ]
+
+    code = "".join(exporter.to_code_pieces())
+    assert 'const _Pattern1 = new RegExp("^(?<a>x)");' in code
+    assert "_ValidateNode(src.children[" in code
+    assert "strLength(src.name) > 5" in code
+    # floats are multiples within a tolerance (0.3 % 0.1 isn't 0 in js)
+    assert "if (!isMultipleOf(src.step, 0.1)) {" in code
+    assert "if (params % 2 !== 0) {" in code
+    # no checks of empty min_length of lists
+    assert "src.tags.length < 0" not in code
+    assert '"Count", params, _CountParamsToPrimitive, ' in code
+    assert "{validate: _CountValidateParams}" in code
+    assert "_EchoValidateParams" not in code
+    assert "ValidateParams" not in "".join(TsExporter(rpc).to_code_pieces())
+
+    filename = rpc.ts_dump(
+        str(tmp_path / "validators.ts"), validate_params=True
+    )
+    assert check_ts(filename)
+
+
+def test_pattern_export(rpc_cls, tmp_path):
+    class Names(BaseModel):
+        # backreferences are supported by python re only
+        model_config = {"regex_engine": "python-re"}
+
+        named: constr(pattern=r"^(?P<a>x)(?P=a)\Z")
+        ignore_case: constr(pattern=r"(?i)^[]a-z]+\Z")
+        verbose: constr(pattern=r"(?x) ^ a")
+        scoped: constr(pattern=r"^(?i:a)b")
+
+    class SetNames(AbstractProcedure):
+        def call(self, in_: Names, context) -> int:
+            return 1
+
+    rpc = rpc_cls().register(SetNames)
+    code = "".join(TsExporter(rpc, validate_params=True).to_code_pieces())
+    assert (
+        r'const _Pattern1 = new RegExp("^(?<a>x)\\k<a>(?![\\s\\S])");' in code
+    )
+    assert (
+        r'const _Pattern2 = new RegExp("^[\\]a-z]+(?![\\s\\S])", "i");' in code
+    )
+    # untranslatable patterns are checked by the server only
+    assert "_Pattern3" not in code
+    assert code.count("string_pattern_mismatch") == 2
+    assert "(?x)" not in code
+    assert "(?i:" not in code
+
+    filename = rpc.ts_dump(str(tmp_path / "patterns.ts"), validate_params=True)
+    assert check_ts(filename)
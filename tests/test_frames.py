@@ -0,0 +1,115 @@
+import asyncio
+import json
+import socket
+import struct
+from typing import List, Optional
+
+import pytest
+
+from synclane import (
+    AbstractAsyncProcedure,
+    AbstractProcedure,
+    AsyncFrameTransport,
+    AsyncRpcClient,
+    ClientProcedure,
+    FrameServer,
+)
+
+from .base import rpc_async_cls
+
+
+@pytest.mark.asyncio
+async def test_frame_server(rpc_async_cls, tmp_path):
+    release = asyncio.Event()
+
+    class Echo(AbstractAsyncProcedure):
+        async def call_async(self, in_: int, context) -> List[Optional[int]]:
+            if in_.root < 0:
+                await release.wait()
+            return [in_.root, context]
+
+    class Fail(AbstractProcedure):
+        def call(self, in_: int, context) -> int:
+            raise RuntimeError("unhandled")
+
+    rpc = rpc_async_cls().register(Echo, Fail)
+    connections = []
+
+    def make_context(writer):
+        connections.append(writer)
+        return len(connections)
+
+    server = await FrameServer(rpc, make_context, max_concurrency=2).start(
+        "127.0.0.1", 0
+    )
+    unix_server = await FrameServer(rpc).start_unix(str(tmp_path / "rpc.sock"))
+    loop = asyncio.get_running_loop()
+    exceptions = []
+    loop.set_exception_handler(
+        lambda loop, context: exceptions.append(context)
+    )
+    try:
+        port = server.server.sockets[0].getsockname()[1]
+        transport = AsyncFrameTransport(("127.0.0.1", port))
+
+        def body(request_id, params, method="Echo"):
+            return json.dumps(
+                {"id": request_id, "method": method, "params": params}
+            ).encode()
+
+        # multiplexed by one connection, responses matched by stream ids
+        responses = await asyncio.gather(
+            *[transport.post(body(i, i)) for i in range(20)]
+        )
+        assert [json.loads(response) for response in responses] == [
+            {"jsonrpc": "2.0", "result": [i, 1], "id": i} for i in range(20)
+        ]
+        assert transport.connections_opened == 1
+        assert server.metrics.connections_opened == 1
+        assert server.metrics.requests == 20
+
+        # reading pauses, while max_concurrency calls are in flight
+        blocked = [
+            asyncio.ensure_future(transport.post(body(i, -i - 1)))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0.05)
+        assert server.metrics.requests_in_flight == 2
+        assert server.metrics.read_pauses >= 1
+        release.set()
+        assert len(await asyncio.gather(*blocked)) == 3
+        assert server.metrics.requests_in_flight == 0
+
+        # unhandled exceptions
+        response = json.loads(await transport.post(body(1, 1, "Fail")))
+        assert response["error"]["code"] == -32603
+        assert isinstance(exceptions[0]["exception"], RuntimeError)
+
+        # typed clients, unix sockets
+        unix_transport = AsyncFrameTransport(
+            str(tmp_path / "rpc.sock"), pool_size=2
+        )
+        echo = ClientProcedure("Echo", int, List[Optional[int]])
+        async with AsyncRpcClient(unix_transport) as client:
+            results = await asyncio.gather(
+                *[client._call(echo, i) for i in range(4)]
+            )
+            assert results == [[i, None] for i in range(4)]
+            assert unix_transport.connections_opened == 2
+
+        # frames longer than max_frame_size close the connection
+        server.max_frame_size = 10
+        with pytest.raises(ConnectionError):
+            await transport.post(body(1, 1))
+        assert server.metrics.frames_rejected == 1
+        assert server.metrics.connections_active == 0
+        server.max_frame_size = 1024
+        response = json.loads(await transport.post(body(7, 7)))
+        assert response["result"] == [7, 2]
+        assert transport.connections_opened == 2
+        await transport.close()
+    finally:
+        loop.set_exception_handler(None)
+        for frame_server in (server, unix_server):
+            frame_server.close()
+            await frame_server.wait_closed()
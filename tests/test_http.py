@@ -0,0 +1,296 @@
+import gzip
+import hashlib
+import json
+import zlib
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+
+from synclane import (
+    AbstractAsyncProcedure,
+    AbstractProcedure,
+    ResponseCompressor,
+)
+from synclane._http import negotiate_encoding
+
+from .base import rpc_async_cls, rpc_cls
+
+
+def test_negotiate_encoding():
+    for accept_encoding, expected in [
+        (None, None),
+        ("", None),
+        ("br", None),
+        ("gzip", "gzip"),
+        ("deflate", "deflate"),
+        ("deflate, gzip", "gzip"),
+        ("gzip;q=0.5, deflate", "deflate"),
+        ("gzip;q=0, deflate;q=0", None),
+        ("gzip;q=x, deflate;q=0.1", "deflate"),
+        ("*", "gzip"),
+        ("br, GZIP ; q=0.9", "gzip"),
+    ]:
+        assert negotiate_encoding(accept_encoding) == expected
+
+
+def test_compressor():
+    results = [json.dumps(list(range(i, i + 200))).encode() for i in range(3)]
+    compressor = ResponseCompressor(min_size=100)
+    compressor.cache_bytes = 2 * max(
+        len(compressor._deflate_segment(result)) for result in results
+    )
+
+    for memoize in (False, True):
+        for result in results + results[:1]:
+            for suffix in (b', "id": 1}', b', "id": 22}'):
+                chunks = (b'{"result": ', result, suffix)
+                for decompress, accept_encoding in [
+                    (gzip.decompress, "gzip"),
+                    (zlib.decompress, "deflate"),
+                ]:
+                    compressed, encoding = compressor.compress(
+                        chunks, accept_encoding, memoize
+                    )
+                    assert encoding == accept_encoding
+                    assert decompress(b"".join(compressed)) == b"".join(chunks)
+        if not memoize:
+            assert not compressor._cache
+
+    # keyed by digests, bounded by total size of segments
+    assert list(compressor._cache) == [
+        hashlib.blake2b(result, digest_size=16).digest()
+        for result in (results[2], results[0])
+    ]
+    assert compressor._cached_bytes == sum(
+        map(len, compressor._cache.values())
+    )
+    assert compressor._cached_bytes <= compressor.cache_bytes
+
+    chunks = (b"[1, 2, 3]",)
+    assert compressor.compress(chunks, "gzip") == (chunks, None)
+    assert compressor.compress(chunks * 20, "br") == (chunks * 20, None)
+
+    lazy_chunks = (memoryview(b"[1, 2, 3]")[i : i + 1] for i in range(9))
+    compressed, encoding = compressor.compress(lazy_chunks, "gzip")
+    assert encoding == "gzip"
+    assert gzip.decompress(b"".join(compressed)) == b"[1, 2, 3]"
+
+    compressed, _ = ResponseCompressor(min_size=0).compress((), "deflate")
+    assert zlib.decompress(b"".join(compressed)) == b""
+
+
+@pytest.mark.asyncio
+async def test_call_http(rpc_cls, rpc_async_cls):
+    class Rows(BaseModel):
+        rows: list
+
+    class GetRows(AbstractProcedure):
+        def call(self, in_: int, context) -> Rows:
+            return Rows(rows=list(range(in_.root)))
+
+    rpc = rpc_cls().register(GetRows)
+    async_rpc = rpc_async_cls().register(GetRows)
+    for count, headers, encoding in [
+        (10, {"accept-encoding": "gzip"}, None),
+        (1000, {"accept-encoding": "gzip"}, "gzip"),
+        (1000, {"accept-encoding": "deflate"}, "deflate"),
+        (1000, {}, None),
+        (1000, None, None),
+    ]:
+        body = json.dumps({"id": 1, "method": "GetRows", "params": count})
+        expected = rpc.call(body, None)
+        for response in (
+            rpc.call_http(body, None, headers),
+            await async_rpc.call_http_async(body, None, headers),
+        ):
+            assert response.status == 200
+            assert response.headers["Content-Type"] == "application/json"
+            assert response.headers["Vary"] == "Accept-Encoding"
+            assert response.headers.get("Content-Encoding") == encoding
+            if encoding == "gzip":
+                assert gzip.decompress(response.body) == expected
+            elif encoding == "deflate":
+                assert zlib.decompress(response.body) == expected
+            else:
+                assert response.body == expected
+            assert response.body is response.body
+
+    # results are not reused, so their compression is not memoized
+    assert not rpc.compressor._cache
+    assert rpc.compressor is not rpc_cls().compressor
+    rpc.compressor = None
+    response = rpc.call_http(body, None, {"accept-encoding": "gzip"})
+    assert response.headers == {"Content-Type": "application/json"}
+    assert response.body == expected
+
+
+@pytest.mark.asyncio
+async def test_query(rpc_cls, rpc_async_cls):
+    class Rows(BaseModel):
+        rows: list
+
+    class GetRows(AbstractProcedure):
+        QUERY = True
+        QUERY_MAX_AGE = 60
+
+        def call(self, in_: int, context) -> Rows:
+            return Rows(rows=list(range(in_.root)))
+
+    class CountRows(AbstractProcedure):
+        def call(self, in_: int, context) -> int:
+            return in_.root
+
+    class GetTotal(AbstractProcedure):
+        QUERY = True
+        QUERY_MAX_AGE = 30
+        QUERY_PUBLIC = True
+
+        def call(self, in_: int, context) -> int:
+            return in_.root
+
+    class GetUserTotal(GetTotal):
+        PERMISSIONS = [lambda context: None]
+
+    procedures = (GetRows, CountRows, GetTotal, GetUserTotal)
+    rpc = rpc_cls().register(*procedures)
+    async_rpc = rpc_async_cls().register(*procedures)
+
+    async def call_http(*args):
+        return [
+            rpc.call_http(*args),
+            await async_rpc.call_http_async(*args),
+        ]
+
+    for response in await call_http(
+        b"", None, {}, "GET", {"method": "GetRows", "params": "3"}
+    ):
+        assert response.status == 200
+        assert json.loads(response.body) == {
+            "jsonrpc": "2.0",
+            "result": {"rows": [0, 1, 2]},
+            "id": 0,
+        }
+        assert response.headers["Cache-Control"] == "private, max-age=60"
+        etag = response.headers["ETag"]
+
+    for if_none_match, status in [
+        (etag, 304),
+        (f"W/{etag}", 304),
+        (f'"abc", {etag[:-1]}-gzip"', 304),
+        ("*", 304),
+        ('"abc"', 200),
+    ]:
+        for response in await call_http(
+            b"",
+            None,
+            {"if-none-match": if_none_match},
+            "GET",
+            {"method": "GetRows", "params": "3"},
+        ):
+            assert response.status == status
+            assert response.headers["ETag"] == etag
+            if status == 304:
+                assert response.body == b""
+
+    for response in await call_http(
+        b"",
+        None,
+        {"accept-encoding": "gzip"},
+        "GET",
+        {"method": "GetRows", "params": "1000"},
+    ):
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["ETag"].endswith('-gzip"')
+        assert json.loads(gzip.decompress(response.body))["id"] == 0
+
+    for query in [
+        {"method": "CountRows", "params": "1"},
+        {"method": "missing", "params": "1"},
+    ]:
+        for response in await call_http(b"", None, {}, "GET", query):
+            assert response.headers["Cache-Control"] == "no-store"
+            assert "ETag" not in response.headers
+            assert json.loads(response.body)["error"]["code"] == -32601
+
+    for query in [{}, {"method": "GetRows", "params": "{"}]:
+        for response in await call_http(b"", None, None, "GET", query):
+            assert response.headers["Cache-Control"] == "no-store"
+            assert json.loads(response.body)["error"]["code"] == -32600
+
+    # permissions make responses private, even if the procedure is public
+    for method, cache_control in [
+        ("GetTotal", "public, max-age=30"),
+        ("GetUserTotal", "private, max-age=30"),
+    ]:
+        for response in await call_http(
+            b"", None, {}, "GET", {"method": method, "params": "1"}
+        ):
+            assert response.headers["Cache-Control"] == cache_control
+
+    rpc.compressor = async_rpc.compressor = None
+    for response in await call_http(
+        b"",
+        None,
+        {"if-none-match": etag},
+        "GET",
+        {"method": "GetRows", "params": "3"},
+    ):
+        assert response.status == 304
+        assert "Vary" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_server_timing(rpc_cls, rpc_async_cls):
+    class GetRows(AbstractProcedure):
+        QUERY = True
+        RESULT_CHUNK_SIZE = 2
+
+        def call(self, in_: int, context) -> List[int]:
+            return list(range(in_.root))
+
+    class CountRows(AbstractAsyncProcedure):
+        async def call_async(self, in_: int, context) -> int:
+            return in_.root
+
+    class Rpc(rpc_cls):
+        server_timing = True
+
+    class AsyncRpc(rpc_async_cls):
+        server_timing = True
+
+    rpc = Rpc().register(GetRows)
+    async_rpc = AsyncRpc().register(GetRows, CountRows)
+    phases = ["parse", "permissions", "validate", "call", "serialize"]
+    for response, expected in [
+        (
+            rpc.call_http(
+                b'{"id": 1, "method": "GetRows", "params": 3}', None
+            ),
+            b"[0,1,2]",
+        ),
+        (
+            rpc.call_http(
+                b"",
+                None,
+                http_method="GET",
+                query={"method": "GetRows", "params": "3"},
+            ),
+            b"[0,1,2]",
+        ),
+        (
+            await async_rpc.call_http_async(
+                b'{"id": 1, "method": "CountRows", "params": 3}', None
+            ),
+            b"3",
+        ),
+    ]:
+        assert json.loads(response.body)["result"] == json.loads(expected)
+        metrics = response.headers["Server-Timing"].split(", ")
+        assert [metric.split(";")[0] for metric in metrics] == phases
+        for metric in metrics:
+            assert float(metric.split(";dur=")[1]) >= 0
+
+    response = rpc.call_http(b'{"id": 1, "method": "x", "params": 3}', None)
+    assert response.headers["Server-Timing"].startswith("parse;dur=")
+    assert "Server-Timing" not in rpc_cls().call_http(b"{}", None).headers
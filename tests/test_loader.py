@@ -0,0 +1,97 @@
+import asyncio
+import json
+from typing import List, Optional
+
+import pytest
+from pydantic import BaseModel
+
+from synclane import AbstractAsyncProcedure, BatchLoader
+
+from .base import rpc_async_cls
+
+
+@pytest.mark.asyncio
+async def test_batch_loader(rpc_async_cls):
+    batches = []
+
+    async def load_names(keys):
+        batches.append(keys)
+        await asyncio.sleep(0)
+        return {key: f"user{key}" for key in keys if key >= 0}
+
+    users = BatchLoader(load_names)
+
+    class Post(BaseModel):
+        author_id: int
+        author: Optional[str] = None
+
+    class GetPosts(AbstractAsyncProcedure):
+        async def call_async(self, in_: List[int], context) -> List[Post]:
+            posts = [Post(author_id=author_id) for author_id in in_.root]
+            names = await users.load_many([post.author_id for post in posts])
+            for post, name in zip(posts, names):
+                post.author = name
+            # cached for the call
+            assert await users.load(in_.root[0]) == names[0]
+            return posts
+
+    rpc = rpc_async_cls().register(GetPosts)
+
+    async def call(author_ids):
+        body = {"id": 1, "method": "GetPosts", "params": author_ids}
+        return json.loads(await rpc.call_async(body, None))["result"]
+
+    # one batch of unique keys per loop iteration, across concurrent calls
+    results = await asyncio.gather(call([1, 2, 1]), call([2, 3]))
+    assert [[post["author"] for post in result] for result in results] == [
+        ["user1", "user2", "user1"],
+        ["user2", "user3"],
+    ]
+    assert batches == [[1, 2, 3]]
+
+    # caches are per call
+    await call([1])
+    assert batches[-1] == [1]
+
+    # outside of calls only loads of a batch are shared
+    assert await users.load_many([4, 4]) == ["user4", "user4"]
+    assert await users.load(4) == "user4"
+    assert batches[-2:] == [[4], [4]]
+
+    # missing keys & errors aren't cached
+    with pytest.raises(KeyError):
+        await users.load(-1)
+
+    async def fail(keys):
+        batches.append(keys)
+        raise RuntimeError("unavailable")
+
+    failing = BatchLoader(fail, max_batch_size=2)
+    results = await asyncio.gather(
+        *[failing.load(key) for key in range(3)], return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batches[-2:] == [[0, 1], [2]]
+
+    async def load_list(keys):
+        return [key * 2 for key in keys][:1]
+
+    with pytest.raises(ValueError):
+        await BatchLoader(load_list, scope="batch").load_many([1, 2])
+    with pytest.raises(ValueError):
+        BatchLoader(load_list, scope="app")
+
+    # loads of a cancelled batch are cancelled, rather than hang
+    started = asyncio.Event()
+
+    async def load_forever(keys):
+        started.set()
+        await asyncio.sleep(60)
+
+    stuck = BatchLoader(load_forever)
+    loads = asyncio.gather(stuck.load(1), stuck.load(2))
+    await started.wait()
+    for task in stuck._tasks:
+        task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(loads, 1)
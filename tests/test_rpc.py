@@ -1,14 +1,18 @@
 import json
+from datetime import date, datetime, timezone
 from decimal import Decimal
 from typing import Dict, Generic, List, Optional, Tuple, TypeVar, Union
 
 import pytest
-from pydantic import BaseModel, ValidationError, constr
+from pydantic import BaseModel, ValidationError, constr, field_serializer
+from pydantic_core import PydanticSerializationError
 
 from synclane import (
     AbstractAsyncProcedure,
     AbstractProcedure,
     AbstractRpc,
+    DayNumberDate,
+    EpochDatetime,
     ProcedureNotFound,
 )
 from synclane._export import TsExporter
@@ -382,3 +386,369 @@ def test_exceptions(dumb_rpc_cls, dumb_async_rpc_cls, rpc_cls, rpc_async_cls):
         class A(AbstractAsyncProcedure):
             def call_async():
                 pass
+
+
+@pytest.mark.asyncio
+async def test_chunks(rpc_cls, rpc_async_cls):
+    class UserParams(BaseModel):
+        uid: str
+
+    class UserDetails(BaseModel):
+        uid: str
+
+    class GetUser(AbstractProcedure):
+        def call(self, in_: UserParams, context) -> UserDetails:
+            return UserDetails(uid=in_.uid)
+
+    body = b'{"id": 7, "method": "GetUser", "params": {"uid": "abc"}}'
+    expected = b'{"jsonrpc": "2.0", "result": {"uid":"abc"}, "id": 7}'
+
+    rpc = rpc_cls().register(GetUser)
+    chunks = rpc.call_chunks(body, None)
+    assert len(chunks) == 3
+    assert chunks[1] == b'{"uid":"abc"}'
+    assert b"".join(chunks) == expected
+
+    async_rpc = rpc_async_cls().register(GetUser)
+    assert b"".join(await async_rpc.call_async_chunks(body, None)) == expected
+
+    for raw_data in (
+        memoryview(body),
+        memoryview(bytearray(body)),
+        memoryview(b"  " + body)[2:],
+    ):
+        assert rpc.call(raw_data, None) == expected
+        assert await async_rpc.call_async(raw_data, None) == expected
+
+    assert b"".join(rpc.call_chunks(b"{}", None)).endswith(b', "id": null}')
+    assert json.loads(
+        b"".join(
+            rpc.call_chunks({"id": 1, "method": "missing", "params": 1}, None)
+        )
+    ) == {
+        "error": {"code": -32601, "message": "Method not found"},
+        "id": 1,
+        "jsonrpc": "2.0",
+    }
+
+
+@pytest.mark.asyncio
+async def test_result_chunk_size(rpc_cls, rpc_async_cls):
+    class Row(BaseModel):
+        a: int
+
+    class GetRows(AbstractProcedure):
+        RESULT_CHUNK_SIZE = 2
+
+        def call(self, in_: int, context) -> List[Row]:
+            return [Row(a=i) for i in range(in_.root)]
+
+    rpc = rpc_cls().register(GetRows)
+    async_rpc = rpc_async_cls().register(GetRows)
+    for count in (0, 1, 2, 5):
+        body = {"id": 1, "method": "GetRows", "params": count}
+        chunks = list(rpc.call_chunks(body, None))
+        slices = (count + 1) // 2
+        # prefix, brackets, slices with commas between them, id suffix
+        assert len(chunks) == 4 + slices + max(slices - 1, 0)
+        expected = {
+            "id": 1,
+            "jsonrpc": "2.0",
+            "result": [{"a": i} for i in range(count)],
+        }
+        assert json.loads(b"".join(chunks)) == expected
+        assert json.loads(rpc.call(body, None)) == expected
+        assert json.loads(await async_rpc.call_async(body, None)) == expected
+
+    with pytest.raises(TypeError):
+
+        class GetRow(AbstractProcedure):
+            RESULT_CHUNK_SIZE = 2
+
+            def call(self, in_: int, context) -> Row:
+                return Row(a=in_)
+
+    with pytest.raises(ValueError):
+
+        class GetNoRows(AbstractProcedure):
+            RESULT_CHUNK_SIZE = 0
+
+            def call(self, in_: int, context) -> List[Row]:
+                return []
+
+    # errors of serialization are passed to prepare_exception, unless the
+    # chunks are lazy
+    class BadRow(BaseModel):
+        a: int
+
+        @field_serializer("a")
+        def serialize_a(self, value):
+            raise ValueError("unserializable")
+
+    class GetBadRows(AbstractProcedure):
+        RESULT_CHUNK_SIZE = 2
+
+        def call(self, in_: int, context) -> List[BadRow]:
+            return [BadRow(a=i) for i in range(in_.root)]
+
+    class Rpc(rpc_cls):
+        def prepare_exception(self, raw_data, context, exc):
+            return {"code": -32000, "message": type(exc).__name__}
+
+    class AsyncRpc(rpc_async_cls):
+        prepare_exception = Rpc.prepare_exception
+
+    body = {"id": 1, "method": "GetBadRows", "params": 3}
+    error = {
+        "jsonrpc": "2.0",
+        "error": {"code": -32000, "message": "PydanticSerializationError"},
+        "id": 1,
+    }
+    rpc = Rpc().register(GetBadRows)
+    assert json.loads(rpc.call(body, None)) == error
+    assert (
+        json.loads(
+            await AsyncRpc().register(GetBadRows).call_async(body, None)
+        )
+        == error
+    )
+    with pytest.raises(PydanticSerializationError):
+        b"".join(rpc.call_chunks(body, None))
+
+
+def test_numeric_dates(rpc_cls):
+    class Dates(BaseModel):
+        dt: EpochDatetime
+        d: DayNumberDate
+        dts: List[EpochDatetime] = []
+
+    class ShiftDates(AbstractProcedure):
+        def call(self, in_: Dates, context) -> Dates:
+            assert in_.dt == datetime(2000, 1, 1, 12, tzinfo=timezone.utc)
+            assert in_.d == date(2000, 1, 2)
+            return Dates(
+                dt=datetime(1970, 1, 1, 0, 0, 0, 1000),
+                d=date(1969, 12, 31),
+                dts=[datetime(2000, 1, 1, tzinfo=timezone.utc)],
+            )
+
+    rpc = rpc_cls().register(ShiftDates)
+    result = json.loads(
+        rpc.call(
+            {
+                "id": 1,
+                "method": "ShiftDates",
+                "params": {"dt": 946728000000, "d": 10958},
+            },
+            None,
+        )
+    )
+    assert result == {
+        "id": 1,
+        "jsonrpc": "2.0",
+        "result": {"dt": 1, "d": -1, "dts": [946684800000]},
+    }
+
+    result = json.loads(
+        rpc.call(
+            json.dumps(
+                {
+                    "id": 1,
+                    "method": "ShiftDates",
+                    "params": {"dt": "abc", "d": 10958},
+                }
+            ),
+            None,
+        )
+    )
+    assert result["error"]["details"][0]["loc"] == ["dt"]
+
+
+def test_discriminated_union(rpc_cls):
+    from pydantic import Field
+    from typing_extensions import Annotated, Literal
+
+    class Cat(BaseModel):
+        kind: Literal["cat"]
+        lives: int
+
+    class Dog(BaseModel):
+        kind: Literal["dog"]
+        name: str
+
+    Pet = Annotated[Union[Cat, Dog], Field(discriminator="kind")]
+
+    class CountLives(AbstractProcedure):
+        def call(self, in_: List[Pet], context) -> int:
+            return sum(pet.lives for pet in in_.root if isinstance(pet, Cat))
+
+    rpc = rpc_cls().register(CountLives)
+    params = [{"kind": "cat", "lives": 9}, {"kind": "dog", "name": "Rex"}]
+    result = json.loads(
+        rpc.call({"id": 1, "method": "CountLives", "params": params}, None)
+    )
+    assert result["result"] == 9
+
+    # validated against the tagged variant only
+    params = [{"kind": "dog", "lives": 9}]
+    result = json.loads(
+        rpc.call({"id": 1, "method": "CountLives", "params": params}, None)
+    )
+    assert [error["loc"] for error in result["error"]["details"]] == [
+        [0, "dog", "name"]
+    ]
+
+
+def test_lazy_procedures(rpc_cls, rpc_async_cls):
+    from synclane._base import LazyModel
+
+    class Row(BaseModel):
+        a: int
+
+    class LazyProcedure(AbstractProcedure):
+        LAZY = True
+
+        def call(self, in_: str, context) -> str:
+            raise NotImplementedError
+
+    class GetRows(LazyProcedure):
+        RESULT_CHUNK_SIZE = 2
+
+        def call(self, in_: int, context) -> List[Row]:
+            return [Row(a=i) for i in range(in_.root)]
+
+    class GetRow(LazyProcedure):
+        def call(self, in_: int, context) -> Row:
+            return Row(a=in_.root)
+
+    class GetRowAsync(AbstractAsyncProcedure):
+        LAZY = True
+
+        async def call_async(self, in_: int, context) -> Row:
+            return Row(a=in_.root)
+
+    assert isinstance(vars(GetRows)["in_type"], LazyModel)
+    assert isinstance(vars(GetRows)["out_type"], LazyModel)
+
+    rpc = rpc_cls().register(GetRows, GetRow)
+    result = json.loads(
+        rpc.call({"id": 1, "method": "GetRows", "params": 3}, None)
+    )
+    assert result["result"] == [{"a": 0}, {"a": 1}, {"a": 2}]
+    # built on the first call
+    assert vars(GetRows)["out_type"].model_fields["root"].annotation == (
+        List[Row]
+    )
+    assert isinstance(vars(GetRow)["in_type"], LazyModel)
+
+    assert rpc.warm() is rpc
+    assert vars(GetRow)["in_type"].model_fields["root"].annotation is int
+    assert vars(GetRow)["out_type"] is Row
+
+    rpc_async_cls().register(GetRowAsync).warm()
+    assert not isinstance(vars(GetRowAsync)["in_type"], LazyModel)
+
+    # signatures are still checked at class definition
+    with pytest.raises(TypeError):
+
+        class GetRowChunks(LazyProcedure):
+            RESULT_CHUNK_SIZE = 2
+
+            def call(self, in_: int, context) -> Row:
+                return Row(a=in_)
+
+
+def test_root_models_interning():
+    import sys
+    import tracemalloc
+
+    from typing_extensions import Literal
+
+    from synclane import root_model_stats
+    from synclane._base import ensure_pydantic_model, normalize_type
+
+    class Row(BaseModel):
+        a: int
+
+    assert ensure_pydantic_model(Row) is Row
+    tracemalloc.start()
+    try:
+        model = ensure_pydantic_model(List[Row])
+    finally:
+        tracemalloc.stop()
+    if sys.version_info[0:2] >= (3, 9):
+        assert ensure_pydantic_model(list[Row]) is model
+    assert model.model_validate([{"a": 1}]).root == [Row(a=1)]
+
+    assert ensure_pydantic_model(Optional[Row]) is ensure_pydantic_model(
+        Union[None, Row]
+    )
+    assert normalize_type(Literal[1]) != normalize_type(Literal[True])
+    assert ensure_pydantic_model(Literal[1]) is not ensure_pydantic_model(
+        Literal[True]
+    )
+
+    class GetRows(AbstractProcedure):
+        def call(self, in_: List[Row], context) -> List[Row]:
+            return in_
+
+    assert GetRows.in_type is GetRows.out_type is model
+
+    stats = next(stats for stats in root_model_stats() if stats.model is model)
+    assert stats.uses >= 3
+    assert stats.build_time > 0
+    assert stats.memory > 0
+
+
+@pytest.mark.asyncio
+async def test_invoke(rpc_cls, rpc_async_cls):
+    class UserParams(BaseModel):
+        uid: constr(min_length=2)
+
+    class User(BaseModel):
+        uid: str
+        name: str
+
+    def permission(context):
+        if context is None:
+            raise PermissionError
+
+    class GetUser(AbstractProcedure):
+        PERMISSIONS = [permission]
+
+        def call(self, in_: UserParams, context) -> User:
+            return User(uid=in_.uid, name=context)
+
+    class CountUsers(AbstractAsyncProcedure):
+        async def call_async(self, in_: UserParams, context) -> int:
+            return len(in_.uid)
+
+    rpc = rpc_cls().register(GetUser)
+    params = UserParams(uid="u1")
+    assert rpc.invoke(GetUser, params, "John") == User(uid="u1", name="John")
+    assert rpc.invoke("GetUser", {"uid": "u2"}, "Bob").uid == "u2"
+    # instances are trusted, unless revalidated
+    invalid_params = UserParams.model_construct(uid="u")
+    assert rpc.invoke(GetUser, invalid_params, "John").uid == "u"
+    assert rpc.invoke(GetUser, params, "John", revalidate=True).uid == "u1"
+    with pytest.raises(ValidationError):
+        rpc.invoke(GetUser, invalid_params, "John", revalidate=True)
+    with pytest.raises(PermissionError):
+        rpc.invoke(GetUser, params, None)
+    with pytest.raises(ValidationError):
+        rpc.invoke(GetUser, {"id": "u1"}, "John")
+    with pytest.raises(ProcedureNotFound):
+        rpc.invoke(CountUsers, params, "John")
+    with pytest.raises(ProcedureNotFound):
+        rpc.invoke("Missing", params, "John")
+
+    async_rpc = rpc_async_cls().register(GetUser, CountUsers)
+    assert await async_rpc.invoke_async(CountUsers, params, None) == 2
+    assert await async_rpc.invoke_async(CountUsers, invalid_params, None) == 1
+    with pytest.raises(ValidationError):
+        await async_rpc.invoke_async(
+            CountUsers, invalid_params, None, revalidate=True
+        )
+    assert (await async_rpc.invoke_async(GetUser, params, "John")).name == (
+        "John"
+    )